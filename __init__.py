@@ -46,6 +46,7 @@ import sys
 import os
 from bpy.types import AddonPreferences
 from bpy.props import BoolProperty
+from .utils import DETAIL_LEVELS
 
 
 class RigifyPreferences(AddonPreferences):
@@ -333,6 +334,18 @@ def register():
     IDStore = bpy.types.Armature
     IDStore.rigify_templates = bpy.props.CollectionProperty(type=RigifyTemplate)
     IDStore.rigify_active_template = bpy.props.IntProperty(name="Rigify Active Template", description="The selected ui template", default=1)
+    IDStore.rigify_detail_level = bpy.props.EnumProperty(items=DETAIL_LEVELS, default='FULL',
+                                                         name="Detail Level",
+                                                         description="Deformation detail of the generated rig")
+
+    IDStore.rigify_mirror_generation = bpy.props.BoolProperty(name="Mirror Symmetric Rigs", default=False,
+                                                              description="Generate the left side of symmetric rig pairs"
+                                                                          " and mirror it to the right side")
+
+    RigifyParameters.rigify_detail_level = bpy.props.EnumProperty(
+        items=(('DEFAULT', 'Default', 'Use the detail level of the metarig'),) + DETAIL_LEVELS,
+        default='DEFAULT', name="Detail Level",
+        description="Deformation detail of this rig")
 
     # Add rig parameters
     for rig in rig_lists.rig_list:
@@ -366,6 +379,8 @@ def unregister():
     IDStore = bpy.types.Armature
     del IDStore.rigify_templates
     del IDStore.rigify_active_template
+    del IDStore.rigify_detail_level
+    del IDStore.rigify_mirror_generation
 
     bpy.utils.unregister_class(RigifyName)
     bpy.utils.unregister_class(RigifyTemplate)
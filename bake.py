@@ -0,0 +1,326 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Bakes the deformation of a generated rig into a lightweight proxy
+    armature holding only the DEF bones, without constraints or drivers.
+
+    Headless use, e.g. on a render farm:
+        blender -b shot.blend --python-expr "import rigify.bake; rigify.bake.main()" \\
+            -- --rig rig --start 1 --end 250 --output shot_proxy.blend
+"""
+
+import bpy
+import argparse
+import sys
+import numpy as np
+from mathutils import Matrix
+
+from .utils import DEF_PREFIX, MetarigError
+
+PROXY_SUFFIX = "_proxy"
+
+
+def get_deform_bones(rig):
+    """ Returns the names of the DEF bones of the rig, parents first.
+    """
+    return [b.name for b in rig.data.bones if b.name.startswith(DEF_PREFIX)]
+
+
+def get_deform_parent(bone):
+    """ Returns the closest DEF ancestor of a bone, or None.
+    """
+    parent = bone.parent
+    while parent and not parent.name.startswith(DEF_PREFIX):
+        parent = parent.parent
+    return parent
+
+
+def create_deform_armature(context, rig, name=None):
+    """ Creates a new armature object with a copy of the DEF bones of rig,
+        each parented to its closest DEF ancestor.
+    """
+    scn = context.scene
+    if name is None:
+        name = rig.name + PROXY_SUFFIX
+
+    arm = bpy.data.armatures.new(name)
+    proxy = bpy.data.objects.new(name, arm)
+    scn.objects.link(proxy)
+    proxy.matrix_world = rig.matrix_world
+    arm.draw_type = rig.data.draw_type
+
+    bones = rig.data.bones
+    names = get_deform_bones(rig)
+
+    # Edit bone data can only be read from the edit mode of the source rig,
+    # so the rest pose is copied from the bone data instead
+    scn.objects.active = proxy
+    bpy.ops.object.mode_set(mode='EDIT')
+    for name in names:
+        bone = bones[name]
+        ebone = arm.edit_bones.new(name)
+        ebone.head = bone.head_local
+        ebone.tail = bone.tail_local
+        ebone.align_roll(bone.matrix_local.to_3x3().col[2])
+        ebone.bbone_segments = bone.bbone_segments
+        ebone.bbone_in = bone.bbone_in
+        ebone.bbone_out = bone.bbone_out
+        ebone.bbone_x = bone.bbone_x
+        ebone.bbone_z = bone.bbone_z
+        ebone.layers = bone.layers
+
+    for name in names:
+        parent = get_deform_parent(bones[name])
+        if parent:
+            ebone = arm.edit_bones[name]
+            ebone.parent = arm.edit_bones[parent.name]
+            # B-Bones take their curve from connected neighbours
+            ebone.use_connect = bones[name].use_connect and bones[name].parent == parent
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    for pbone in proxy.pose.bones:
+        pbone.rotation_mode = 'QUATERNION'
+
+    return proxy
+
+
+def sample_deform_transforms(context, rig, proxy, frame_start, frame_end):
+    """ Evaluates the rig on every frame of the range and returns the
+        local transforms the proxy bones need to match the DEF bones,
+        as {bone name: (frames, 10) array of location, quaternion, scale},
+        and the (frames, 10) array of the world transform of the rig.
+    """
+    scn = context.scene
+    pose_bones = rig.pose.bones
+    proxy_bones = proxy.data.bones
+
+    # Rest matrices of the proxy bones relative to their parent
+    rest = dict()
+    for bone in proxy_bones:
+        if bone.parent:
+            rest[bone.name] = (bone.parent.matrix_local.inverted() * bone.matrix_local).inverted()
+        else:
+            rest[bone.name] = bone.matrix_local.inverted()
+
+    names = [bone.name for bone in proxy_bones]
+    parents = [bone.parent.name if bone.parent else None for bone in proxy_bones]
+    frames = range(frame_start, frame_end + 1)
+    samples = {name: np.empty((len(frames), 10)) for name in names}
+    object_samples = np.empty((len(frames), 10))
+    previous = dict()
+
+    for i, f in enumerate(frames):
+        scn.frame_set(f)
+        loc, quat, scale = rig.matrix_world.decompose()
+        if i:
+            quat.make_compatible(previous[None])
+        previous[None] = quat
+        object_samples[i] = tuple(loc) + tuple(quat) + tuple(scale)
+
+        matrices = {name: pose_bones[name].matrix for name in names}
+        for name, parent in zip(names, parents):
+            if parent:
+                basis = rest[name] * matrices[parent].inverted() * matrices[name]
+            else:
+                basis = rest[name] * matrices[name]
+
+            loc, quat, scale = basis.decompose()
+            # Keep quaternions on the same hemisphere so they interpolate the short way
+            if name in previous:
+                quat.make_compatible(previous[name])
+            previous[name] = quat
+
+            samples[name][i] = tuple(loc) + tuple(quat) + tuple(scale)
+
+    return samples, object_samples
+
+
+def write_channels(action, prefix, group, frames, values):
+    """ Writes the location, quaternion and scale columns of values into
+        new fcurves of the action, each filled with a single foreach_set.
+    """
+    channels = (('location', 3), ('rotation_quaternion', 4), ('scale', 3))
+
+    column = 0
+    for prop, size in channels:
+        for index in range(size):
+            fcu = action.fcurves.new(prefix + prop, index, group)
+            fcu.keyframe_points.add(len(frames))
+            co = np.empty(len(frames) * 2)
+            co[0::2] = frames
+            co[1::2] = values[:, column]
+            fcu.keyframe_points.foreach_set('co', co)
+            # Enum properties have no raw access
+            for point in fcu.keyframe_points:
+                point.interpolation = 'LINEAR'
+            fcu.update()
+            column += 1
+
+
+def write_deform_action(proxy, samples, object_samples, frame_start, name=None):
+    """ Writes the sampled transforms into a new action of the proxy.
+        The object transform is only keyed if the rig moves in the range.
+    """
+    if name is None:
+        name = proxy.name + "Action"
+
+    action = bpy.data.actions.new(name)
+    if proxy.animation_data is None:
+        proxy.animation_data_create()
+    proxy.animation_data.action = action
+
+    frames = frame_start + np.arange(len(object_samples), dtype=float)
+    for bone_name, values in samples.items():
+        write_channels(action, 'pose.bones["%s"].' % bone_name, bone_name, frames, values)
+
+    proxy.rotation_mode = 'QUATERNION'
+    if np.ptp(object_samples, axis=0).max() > 1e-6:
+        write_channels(action, '', "Object Transforms", frames, object_samples)
+
+    return action
+
+
+def remap_armature_modifiers(scene, rig, proxy):
+    """ Points the armature modifiers deforming with rig to proxy instead.
+        Returns the remapped objects.
+    """
+    remapped = []
+    for obj in scene.objects:
+        for mod in obj.modifiers:
+            if mod.type == 'ARMATURE' and mod.object == rig:
+                mod.object = proxy
+                if obj not in remapped:
+                    remapped.append(obj)
+    return remapped
+
+
+def get_parent_matrix(obj):
+    """ Returns the world matrix obj gets from its parent, before its
+        parent inverse matrix.
+    """
+    parent = obj.parent
+    if obj.parent_type == 'BONE' and obj.parent_bone in parent.pose.bones:
+        pbone = parent.pose.bones[obj.parent_bone]
+        # Bone parenting follows the tail of the bone
+        return parent.matrix_world * pbone.matrix * Matrix.Translation((0, pbone.length, 0))
+    return parent.matrix_world.copy()
+
+
+def reparent_children(scene, rig, proxy):
+    """ Moves the children of rig to proxy, keeping their world transform.
+        Children of a bone follow its closest DEF bone, or the proxy object
+        if there is none. Returns the reparented objects.
+    """
+    scene.update()
+    children = list(rig.children)
+    old_matrices = {child.name: get_parent_matrix(child) for child in children}
+
+    for child in children:
+        deform_bone = None
+        if child.parent_type == 'BONE':
+            bone = rig.data.bones.get(child.parent_bone)
+            if bone and not bone.name.startswith(DEF_PREFIX):
+                bone = get_deform_parent(bone)
+            if bone and bone.name in proxy.data.bones:
+                deform_bone = bone.name
+
+        child.parent = proxy
+        if deform_bone:
+            child.parent_type = 'BONE'
+            child.parent_bone = deform_bone
+        elif child.parent_type == 'BONE':
+            child.parent_type = 'OBJECT'
+
+    scene.update()
+    for child in children:
+        child.matrix_parent_inverse = get_parent_matrix(child).inverted() * old_matrices[child.name] \
+            * child.matrix_parent_inverse
+
+    return children
+
+
+def bake_deform_rig(context, rig, frame_start=None, frame_end=None, name=None, remap=True):
+    """ Bakes the DEF bones of a generated rig over the frame range into
+        a new constraint free armature and returns it.
+        With remap the meshes deformed by rig are moved to the proxy.
+    """
+    scn = context.scene
+    if rig is None or rig.type != 'ARMATURE':
+        raise MetarigError("RIGIFY ERROR: an armature is needed to bake a deform proxy")
+
+    if not get_deform_bones(rig):
+        raise MetarigError("RIGIFY ERROR: rig '%s' has no %s bones to bake" % (rig.name, DEF_PREFIX))
+
+    if frame_start is None:
+        frame_start = scn.frame_start
+    if frame_end is None:
+        frame_end = scn.frame_end
+
+    frame_current = scn.frame_current
+    active = scn.objects.active
+    mode = active.mode if active else 'OBJECT'
+    if mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    try:
+        proxy = create_deform_armature(context, rig, name)
+        samples, object_samples = sample_deform_transforms(context, rig, proxy, frame_start, frame_end)
+        write_deform_action(proxy, samples, object_samples, frame_start)
+        if remap:
+            remap_armature_modifiers(scn, rig, proxy)
+    finally:
+        scn.frame_set(frame_current)
+        scn.objects.active = active
+        if mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode=mode)
+
+    return proxy
+
+
+def main(argv=None):
+    """ Command line entry point, reads the arguments after '--'.
+    """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(description="Bake a Rigify rig into a deform only proxy armature")
+    parser.add_argument("--rig", required=True, help="Name of the generated rig object")
+    parser.add_argument("--start", type=int, default=None, help="First frame to bake")
+    parser.add_argument("--end", type=int, default=None, help="Last frame to bake")
+    parser.add_argument("--name", default=None, help="Name of the proxy armature")
+    parser.add_argument("--no-remap", action="store_true", help="Keep the meshes deformed by the rig")
+    parser.add_argument("--remove-rig", action="store_true", help="Delete the control rig after baking")
+    parser.add_argument("--output", default=None, help="Save the result to this .blend file")
+    args = parser.parse_args(argv)
+
+    context = bpy.context
+    rig = bpy.data.objects.get(args.rig)
+    proxy = bake_deform_rig(context, rig, args.start, args.end, args.name, not args.no_remap)
+
+    if args.remove_rig:
+        # Props and meshes parented to the rig would lose their parent
+        reparent_children(context.scene, rig, proxy)
+        context.scene.objects.unlink(rig)
+        bpy.data.objects.remove(rig)
+
+    if args.output:
+        bpy.ops.wm.save_as_mainfile(filepath=args.output, copy=True)
+
+    return proxy
@@ -0,0 +1,276 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Benchmark suite: generates every shipped metarig and the sample of every
+    rig type, records the cost of each, and compares it with a baseline.
+
+    Headless use:
+        blender -b --factory-startup --python-expr "import rigify.benchmark; rigify.benchmark.main()" \\
+            -- --output bench.json --baseline baseline.json
+
+    Exits with status 1 when a case regressed against the baseline.
+"""
+
+import bpy
+import argparse
+import json
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+
+from .utils import METARIG_DIR, get_rig_type
+from .report import rig_complexity_report
+from .profiler import time_playback
+from . import rig_lists
+
+# Metrics compared with a relative tolerance, the others must not grow at all
+TIMED_METRICS = ('generate_ms', 'ms_per_frame')
+COUNTED_METRICS = ('mode_switches', 'bones', 'constraints', 'drivers')
+
+# Timings below this many ms are too noisy to fail on
+MIN_TIMED_MS = 1.0
+
+
+@contextmanager
+def count_operator_calls(idname):
+    """ Counts the calls to the operator idname (e.g. 'object.mode_set')
+        made inside the block.
+    """
+    op_type = type(bpy.ops.object.mode_set)
+    call = op_type.__call__
+    counter = {'calls': 0}
+
+    def counted_call(self, *args, **kwargs):
+        if self.idname_py() == idname:
+            counter['calls'] += 1
+        return call(self, *args, **kwargs)
+
+    op_type.__call__ = counted_call
+    try:
+        yield counter
+    finally:
+        op_type.__call__ = call
+
+
+def get_metarig_cases():
+    """ Returns {case name: metarig module} of the shipped metarigs,
+        named after their path in the metarigs directory.
+    """
+    from .metarig_menu import get_metarig_list
+
+    # Scanned again, the menu's dict no longer holds the top level metarigs
+    cases = dict()
+    prefix = METARIG_DIR + '.'
+    for modules in get_metarig_list("").values():
+        for m in modules:
+            name = m.__name__
+            cases['metarig:' + name[name.index(prefix) + len(prefix):]] = m
+    return cases
+
+
+def get_sample_cases():
+    """ Returns {case name: create_sample function} of the rig types.
+    """
+    cases = dict()
+    for rig_type in rig_lists.rig_list:
+        if rig_type in rig_lists.implementation_rigs:
+            continue
+        create_sample = getattr(get_rig_type(rig_type), 'create_sample', None)
+        if create_sample is not None:
+            cases['sample:' + rig_type] = create_sample
+    return cases
+
+
+def create_sample_metarig(context, create_sample):
+    """ Adds an empty metarig and fills it with a rig type sample.
+    """
+    from . import template_list
+
+    bpy.ops.object.armature_add()
+    obj = context.active_object
+    obj.name = "metarig"
+    obj.data.name = "metarig"
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    bones = obj.data.edit_bones
+    bones.remove(bones[0])
+    template_list.fill_ui_template_list(obj)
+
+    create_sample(obj)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return obj
+
+
+def remove_new_data(objects, texts, datablocks):
+    """ Removes the objects and texts created since the given name sets, and
+        the new armatures and meshes (datablocks, {collection: name set})
+        they leave without users.
+    """
+    scn = bpy.context.scene
+    for obj in list(bpy.data.objects):
+        if obj.name not in objects:
+            if obj.name in scn.objects:
+                scn.objects.unlink(obj)
+            bpy.data.objects.remove(obj)
+    for text in list(bpy.data.texts):
+        if text.name not in texts:
+            bpy.data.texts.remove(text)
+    for attr, names in datablocks.items():
+        collection = getattr(bpy.data, attr)
+        for data in list(collection):
+            if data.name not in names and data.users == 0:
+                collection.remove(data)
+
+
+def run_case(context, make_metarig, frames):
+    """ Builds the metarig with make_metarig(context) and generates it.
+        Returns the measures of the case.
+    """
+    from .generate import generate_rig
+
+    objects = set(bpy.data.objects.keys())
+    texts = set(bpy.data.texts.keys())
+    datablocks = {attr: set(getattr(bpy.data, attr).keys()) for attr in ('armatures', 'meshes')}
+    try:
+        metarig = make_metarig(context)
+        with count_operator_calls('object.mode_set') as counter:
+            start = time.perf_counter()
+            rig = generate_rig(context, metarig)
+            generate_ms = (time.perf_counter() - start) * 1000.0
+
+        total = rig_complexity_report(rig)['total']
+        return {
+            'generate_ms': generate_ms,
+            'mode_switches': counter['calls'],
+            'bones': sum(total['bones'].values()),
+            'constraints': sum(total['constraints'].values()),
+            'drivers': sum(total['drivers'].values()),
+            'ms_per_frame': time_playback(context, rig, frames) * 1000.0,
+        }
+    finally:
+        if context.active_object and context.active_object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        remove_new_data(objects, texts, datablocks)
+
+
+def run_benchmark(context, pattern=None, frame_count=24):
+    """ Runs every case whose name matches the pattern.
+        Failing cases are recorded with their error.
+    """
+    from .metarig_menu import create_metarig
+
+    frames = list(range(1, frame_count + 1))
+    cases = [(name, lambda c, m=m: create_metarig(c, m))
+             for name, m in sorted(get_metarig_cases().items())]
+    cases += [(name, lambda c, f=f: create_sample_metarig(c, f))
+              for name, f in sorted(get_sample_cases().items())]
+
+    results = dict()
+    for name, make_metarig in cases:
+        if pattern and not re.search(pattern, name):
+            continue
+        print("Rigify benchmark: %s" % name)
+        try:
+            results[name] = run_case(context, make_metarig, frames)
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            results[name] = {'error': "%s: %s" % (type(e).__name__, e)}
+
+    return {
+        'blender': bpy.app.version_string,
+        'frames': frame_count,
+        'cases': results,
+    }
+
+
+def compare_results(baseline, current, tolerance=0.25):
+    """ Returns the regressions of current against baseline, as text lines.
+        Timings regress beyond the relative tolerance, counts as soon as they grow.
+    """
+    regressions = []
+    for name, base in sorted(baseline['cases'].items()):
+        case = current['cases'].get(name)
+        if case is None:
+            continue
+        if 'error' in case and 'error' not in base:
+            regressions.append("%s: now fails (%s)" % (name, case['error']))
+            continue
+        if 'error' in case or 'error' in base:
+            continue
+
+        for metric in TIMED_METRICS:
+            old, new = base[metric], case[metric]
+            if new > old * (1.0 + tolerance) and new - old > MIN_TIMED_MS:
+                regressions.append("%s: %s %.2f -> %.2f (+%.0f%%)"
+                                   % (name, metric, old, new, (new / old - 1.0) * 100.0))
+        for metric in COUNTED_METRICS:
+            if case[metric] > base[metric]:
+                regressions.append("%s: %s %d -> %d" % (name, metric, base[metric], case[metric]))
+
+    return regressions
+
+
+def format_results(results):
+    lines = ["%-36s %10s %6s %6s %6s %6s %9s"
+             % ("case", "generate", "modes", "bones", "cons", "drv", "ms/frame")]
+    for name, case in sorted(results['cases'].items()):
+        if 'error' in case:
+            lines.append("%-36s ERROR %s" % (name, case['error']))
+        else:
+            lines.append("%-36s %8.1fms %6d %6d %6d %6d %9.3f"
+                         % (name, case['generate_ms'], case['mode_switches'], case['bones'],
+                            case['constraints'], case['drivers'], case['ms_per_frame']))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """ Command line entry point, reads the arguments after '--'.
+    """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(description="Benchmark the Rigify metarigs and rig type samples")
+    parser.add_argument("--cases", default=None, help="Only run the cases matching this regular expression")
+    parser.add_argument("--frames", type=int, default=24, help="Frames of playback to time")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative timing increase")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(bpy.context, args.cases, args.frames)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print("Rigify benchmark: %d regressions against %s" % (len(regressions), args.baseline))
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("Rigify benchmark: no regressions against %s" % args.baseline)
+
+    return results
@@ -0,0 +1,181 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Python-free driver pass: rewrites the SCRIPTED drivers of a generated
+    rig whose expression is linear in its variables into AVERAGE or SUM
+    drivers with a generator modifier, and reports the ones left as Python.
+"""
+
+import ast
+import math
+
+from .utils import MetarigError
+from .report import driver_bone_name
+
+# Names an expression may use besides its variables
+EXPRESSION_CONSTANTS = {'pi': math.pi}
+
+
+class NotLinear(Exception):
+    pass
+
+
+def linear_form(expression, variables):
+    """ Returns the expression as (constant, {variable: coefficient}) if it
+        is linear in the driver variables, otherwise None.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        return None
+
+    def add(a, b, sign=1.0):
+        coefs = dict(a[1])
+        for name, coef in b[1].items():
+            coefs[name] = coefs.get(name, 0.0) + sign * coef
+        return a[0] + sign * b[0], coefs
+
+    def scale(a, factor):
+        return a[0] * factor, {name: coef * factor for name, coef in a[1].items()}
+
+    def visit(node):
+        if isinstance(node, ast.Num):
+            return float(node.n), {}
+        if isinstance(node, ast.Name):
+            if node.id in variables:
+                return 0.0, {node.id: 1.0}
+            if node.id in EXPRESSION_CONSTANTS:
+                return EXPRESSION_CONSTANTS[node.id], {}
+            raise NotLinear()
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return scale(visit(node.operand), -1.0)
+            if isinstance(node.op, ast.UAdd):
+                return visit(node.operand)
+            raise NotLinear()
+        if isinstance(node, ast.BinOp):
+            left, right = visit(node.left), visit(node.right)
+            if isinstance(node.op, ast.Add):
+                return add(left, right)
+            if isinstance(node.op, ast.Sub):
+                return add(left, right, -1.0)
+            if isinstance(node.op, ast.Mult):
+                if not left[1]:
+                    return scale(right, left[0])
+                if not right[1]:
+                    return scale(left, right[0])
+            if isinstance(node.op, ast.Div) and not right[1] and right[0] != 0.0:
+                return scale(left, 1.0 / right[0])
+        raise NotLinear()
+
+    try:
+        return visit(tree.body)
+    except NotLinear:
+        return None
+
+
+def get_generator(fcu):
+    """ Returns (modifier, constant, factor) of the linear generator the
+        fcurve applies to its driver value, with a None modifier when there
+        is no modifier, or None if the fcurve does more than that.
+    """
+    if len(fcu.keyframe_points):
+        return None
+    if len(fcu.modifiers) == 0:
+        return None, 0.0, 1.0
+    if len(fcu.modifiers) > 1:
+        return None
+
+    mod = fcu.modifiers[0]
+    if (mod.type != 'GENERATOR' or mod.mode != 'POLYNOMIAL' or mod.poly_order != 1 or mod.use_additive
+            or mod.mute or mod.use_restricted_range or mod.use_influence):
+        return None
+    return mod, mod.coefficients[0], mod.coefficients[1]
+
+
+def convert_driver(fcu):
+    """ Rewrites a SCRIPTED driver linear in its variables into an AVERAGE
+        (one variable) or SUM (equal coefficients) driver followed by a
+        generator modifier. Returns True when converted.
+    """
+    driver = fcu.driver
+    if driver.type != 'SCRIPTED' or driver.use_self:
+        return False
+
+    variables = {var.name for var in driver.variables}
+    form = linear_form(driver.expression, variables)
+    generator = get_generator(fcu)
+    if form is None or generator is None:
+        return False
+
+    constant, coefs = form
+    factors = set(coefs.values())
+    if len(factors) != 1 or 0.0 in factors:
+        return False
+    factor = factors.pop()
+
+    # Variables the expression doesn't read would count in the sum
+    for var in list(driver.variables):
+        if var.name not in coefs:
+            driver.variables.remove(var)
+
+    mod, mod_constant, mod_factor = generator
+    if mod is None:
+        mod = fcu.modifiers.new('GENERATOR')
+        mod.mode = 'POLYNOMIAL'
+        mod.poly_order = 1
+
+    driver.type = 'AVERAGE' if len(coefs) == 1 else 'SUM'
+    mod.coefficients = (mod_constant + mod_factor * constant, mod_factor * factor)
+    return True
+
+
+def get_drivers(obj):
+    """ Yields the driver fcurves of the rig object and its armature.
+    """
+    for anim in (obj.animation_data, obj.data.animation_data):
+        if anim is not None:
+            yield from anim.drivers
+
+
+def convert_python_drivers(obj):
+    """ Converts the drivers of the rig that can do without Python.
+        Returns the number converted and [(bone name, data path, index,
+        expression)] of the SCRIPTED drivers left.
+    """
+    if obj is None or obj.type != 'ARMATURE':
+        raise MetarigError("RIGIFY ERROR: an armature is needed to convert its drivers")
+
+    converted = 0
+    remaining = []
+    for fcu in get_drivers(obj):
+        if convert_driver(fcu):
+            converted += 1
+        elif fcu.driver.type == 'SCRIPTED':
+            remaining.append((driver_bone_name(fcu.data_path), fcu.data_path, fcu.array_index,
+                              fcu.driver.expression))
+    return converted, remaining
+
+
+def format_remaining(remaining):
+    """ Returns the drivers left as Python as text lines.
+    """
+    return "\n".join("%s[%d]: %s" % (data_path, index, expression)
+                     for bone_name, data_path, index, expression in remaining)
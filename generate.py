@@ -23,17 +23,27 @@ import re
 import time
 import traceback
 import sys
+import types
+import numpy as np
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 from .utils import MetarigError, new_bone, get_rig_type
 from .utils import ORG_PREFIX, MCH_PREFIX, DEF_PREFIX, WGT_PREFIX, ROOT_NAME, make_original_name
+from .utils import strip_org
 from .utils import RIG_DIR
 from .utils import create_root_widget
 from .utils import random_id
 from .utils import copy_attributes
+from .utils import get_detail_level, apply_detail_level
+from .utils import bone_lookup_scope, name_allocation_scope, mode_set
+from .utils import get_pose_bones, get_bone_layers, get_bone_names
 
 from .utils import gamma_correct
 from .utils import get_ui_template_module
+from .rigs.utils import write_limb_registry, write_light_tiers
+from .report import write_rig_bones_registry
+from .driver_audit import convert_python_drivers, format_remaining
+from .mirror import find_mirror_rigs, get_rig_state, can_mirror, mirror_rig, flip_quoted_names
 #from .rig_ui_template import UI_SLIDERS, layers_ui, UI_REGISTER
 
 RIG_MODULE = "rigs"
@@ -330,27 +340,103 @@ def generate_rig(context, metarig):
     #         if lyr:
     #             context.scene.layers[i] = False
 
+    # Resolve the detail level of every rig, the rig types read it from their parameters
+    for pbone in obj.pose.bones:
+        if pbone.rigify_type:
+            params = pbone.rigify_parameters
+            params.rigify_detail_level = get_detail_level(metarig, params)
+
     #----------------------------------
     try:
-        # Collect/initialize all the rigs.
-        rigs = []
-        for bone in bones_sorted:
-            bpy.ops.object.mode_set(mode='EDIT')
-            rigs += get_bone_rigs(obj, bone)
-        t.tick("Initialize rigs: ")
-
-        # Generate all the rigs.
-        ui_scripts = []
-        for rig in rigs:
-            # Go into editmode in the rig armature
-            bpy.ops.object.mode_set(mode='OBJECT')
-            context.scene.objects.active = obj
-            obj.select = True
-            bpy.ops.object.mode_set(mode='EDIT')
-            scripts = rig.generate()
-            if scripts is not None:
-                ui_scripts += [scripts[0]]
-        t.tick("Generate rigs: ")
+        # Bone lookups are cached until the next mode switch
+        with bone_lookup_scope(), name_allocation_scope():
+            # Collect/initialize all the rigs.
+            rigs = []
+            rig_bases = []
+            for bone in bones_sorted:
+                mode_set(obj, 'EDIT')
+                bone_rigs = get_bone_rigs(obj, bone)
+                rigs += bone_rigs
+                rig_bases += [bone] * len(bone_rigs)
+            t.tick("Initialize rigs: ")
+
+            # Rig types with a generate_batch() generate all their instances
+            # of a hierarchy level together, in place of the first one. Rigs
+            # still run after every rig of the levels above theirs, but must
+            # not depend on the order of the rigs of their own level.
+            steps = []
+            batches = {}
+            for rig, base in zip(rigs, rig_bases):
+                if hasattr(rig, 'generate_batch'):
+                    # Modules are reloaded for every rig, compare the class names
+                    depth = len(obj.pose.bones[base].parent_recursive)
+                    rig_class = (type(rig).__module__, type(rig).__name__, depth)
+                    if rig_class in batches:
+                        batches[rig_class].append((rig, base))
+                        continue
+                    batches[rig_class] = [(rig, base)]
+                    steps.append(batches[rig_class])
+                else:
+                    steps.append([(rig, base)])
+
+            # Symmetric rig pairs: the right side is mirrored from the left one
+            mirror_pairs = {}
+            if metarig.data.rigify_mirror_generation:
+                mirror_pairs = find_mirror_rigs(metarig)
+            # Only single rig steps are mirrored, and only when the left side comes first
+            order = {step[0][1]: i for i, step in enumerate(steps) if len(step) == 1
+                     and not hasattr(step[0][0], 'generate_batch')}
+            mirror_sources = {left: (right, chain) for right, (left, chain) in mirror_pairs.items()
+                              if left in order and right in order and order[left] < order[right]}
+            mirrored = set()
+
+            # Generate all the rigs.
+            ui_scripts = []
+            rig_bones = {}
+            for step in steps:
+                if step[0][1] in mirrored:
+                    continue
+
+                # Go into editmode in the rig armature
+                mode_set(obj, 'OBJECT')
+                context.scene.objects.active = obj
+                obj.select = True
+                mode_set(obj, 'EDIT')
+
+                rig, base = step[0]
+                if hasattr(rig, 'generate_batch'):
+                    created = rig.generate_batch([rig for rig, base in step])
+                    for (rig, base), new_bones in zip(step, created):
+                        rig_bones.setdefault(strip_org(base), []).extend(new_bones)
+                    continue
+
+                existing = set(get_bone_names(obj))
+                if base in mirror_sources:
+                    mirror_state = get_rig_state(obj, mirror_sources[base][1])
+                scripts = rig.generate()
+                if scripts is not None:
+                    ui_scripts += [scripts[0]]
+                # Most rig types leave generate() in object mode
+                new_bones = [name for name in get_bone_names(obj) if name not in existing]
+                rig_bones.setdefault(strip_org(base), []).extend(new_bones)
+
+                if base in mirror_sources:
+                    right, chain = mirror_sources[base]
+                    mode_set(obj, 'EDIT')
+                    if can_mirror(obj, new_bones):
+                        mirror_bones = mirror_rig(obj, new_bones, chain, mirror_state)
+                        rig_bones.setdefault(strip_org(right), []).extend(mirror_bones)
+                        if scripts is not None:
+                            ui_scripts += [flip_quoted_names(scripts[0], set(new_bones + chain))]
+                        mirrored.add(right)
+            t.tick("Generate rigs: ")
+
+            # Lighten the rigs generated below full detail
+            mode_set(obj, 'OBJECT')
+            for rig, base in zip(rigs, rig_bases):
+                level = get_detail_level(metarig, getattr(rig, 'params', None))
+                apply_detail_level(obj, rig_bones[strip_org(base)], level)
+            write_rig_bones_registry(obj, rig_bones)
     except Exception as e:
         # Cleanup if something goes wrong
         print("Rigify: failed to generate rig.")
@@ -501,21 +587,39 @@ def generate_rig(context, metarig):
     template_name = id_store.rigify_templates[id_store.rigify_active_template].name
     template = get_ui_template_module(template_name)
     script.write(template.UI_SLIDERS % rig_id)
-    for s in ui_scripts:
-        script.write("\n        " + s.replace("\n", "\n        ") + "\n")
+    section_bones = dict()
+    for i, s in enumerate(ui_scripts):
+        script.write(ui_section(obj, i, s, section_bones))
     script.write(template.layers_ui(vis_layers, layer_layout))
+    script.write("\nSECTION_BONES = %r\n" % section_bones)
     script.write(template.UI_REGISTER)
     script.use_module = True
 
+    # Load the UI runtime shared by the rig scripts
+    if hasattr(template, 'UI_RUNTIME'):
+        load_ui_runtime(template.UI_RUNTIME_NAME, template.UI_RUNTIME)
+
     # Run UI script
     exec(script.as_string(), {})
 
+    # Rewrite the drivers that can do without Python
+    converted, remaining = convert_python_drivers(obj)
+    if remaining:
+        print("Rigify: %d drivers converted, %d left as Python:" % (converted, len(remaining)))
+        print(format_remaining(remaining))
+
     # Create Selection Sets
     create_selection_sets(obj, metarig)
 
     # Create Bone Groups
     create_bone_groups(obj, metarig)
 
+    # Store the limb names for the animation tools
+    write_limb_registry(obj)
+
+    # Record the secondary constraints and drivers for light evaluation
+    write_light_tiers(obj)
+
     # Add rig_ui to logic
     skip = False
     ctrls = obj.game.controllers
@@ -544,6 +648,57 @@ def generate_rig(context, metarig):
             child.parent_bone = sub_parent
             child.matrix_world = mat
 
+    return obj
+
+def load_ui_runtime(name, source):
+    """ Writes the shared rig UI runtime to its text block, once per blend
+        file, and runs it as the module the rig scripts import.
+    """
+    text = bpy.data.texts.get(name)
+    if text is None:
+        text = bpy.data.texts.new(name)
+
+    changed = text.as_string() != source
+    if changed:
+        text.clear()
+        text.write(source)
+    text.use_module = True
+
+    module_name = name[:-len(".py")]
+    module = sys.modules.get(module_name)
+    if module is None or changed:
+        if module is None:
+            module = types.ModuleType(module_name)
+            sys.modules[module_name] = module
+        exec(source, module.__dict__)
+
+
+UI_NAME_PATTERN = re.compile(r"'([^'\n]*)'|\"([^\"\n]*)\"")
+
+
+def ui_section(obj, index, script, section_bones):
+    """ Returns the code of a rig UI script, drawn only when one of the bones
+        it names is selected. Adds those bones to section_bones,
+        a {bone name: section indices} map.
+    """
+    bones = obj.data.bones
+    names = set()
+    for match in UI_NAME_PATTERN.finditer(script):
+        name = match.group(1) if match.group(1) is not None else match.group(2)
+        if name in bones:
+            names.add(name)
+
+    if not script.strip() or not names:
+        return "\n        " + script.replace("\n", "\n        ") + "\n"
+
+    for name in sorted(names):
+        section_bones[name] = section_bones.get(name, ()) + (index,)
+
+    code = "\n        if %d in sections:" % index
+    code += "\n            " + script.replace("\n", "\n            ") + "\n"
+    return code
+
+
 def create_selection_sets(obj, metarig):
 
     # Check if selection sets addon is installed
@@ -551,39 +706,33 @@ def create_selection_sets(obj, metarig):
             and 'bone_selection_sets' not in bpy.context.user_preferences.addons:
         return
 
-    bpy.ops.object.mode_set(mode='POSE')
+    names = obj.data.bones.keys()
+    layers = get_bone_layers(obj)
 
-    bpy.context.scene.objects.active = obj
-    obj.select = True
-    metarig.select = False
-    pbones = obj.pose.bones
+    # Only the bones that would show when selected, as the addon lists them
+    hidden = np.zeros(len(names), dtype=np.bool_)
+    obj.data.bones.foreach_get('hide', hidden)
+    visible = layers[:, np.array(obj.data.layers[:], dtype=np.bool_)].any(axis=1) & ~hidden
 
     for i, name in enumerate(metarig.data.rigify_layers.keys()):
         if name == '' or not metarig.data.rigify_layers[i].set:
             continue
 
-        bpy.ops.pose.select_all(action='DESELECT')
-        for b in pbones:
-            if b.bone.layers[i]:
-                b.bone.select = True
-
         #bpy.ops.pose.selection_set_add()
         obj.selection_sets.add()
         obj.selection_sets[-1].name = name
         if 'bone_selection_sets' in bpy.context.user_preferences.addons:
             act_sel_set = obj.selection_sets[-1]
 
-            # iterate only the selected bones in current pose that are not hidden
-            for bone in bpy.context.selected_pose_bones:
-                if bone.name not in act_sel_set.bone_ids:
-                    bone_id = act_sel_set.bone_ids.add()
-                    bone_id.name = bone.name
+            for index in np.flatnonzero(layers[:, i] & visible):
+                bone_id = act_sel_set.bone_ids.add()
+                bone_id.name = names[index]
 
 
 def create_bone_groups(obj, metarig):
 
     bpy.ops.object.mode_set(mode='OBJECT')
-    pb = obj.pose.bones
+    pb = get_pose_bones(obj)
     layers = metarig.data.rigify_layers
     groups = metarig.data.rigify_colors
 
@@ -600,17 +749,21 @@ def create_bone_groups(obj, metarig):
             bg.colors.select = gamma_correct(groups[g_id].select)
             bg.colors.active = gamma_correct(groups[g_id].active)
 
-    for b in pb:
-        try:
-            layer_index = b.bone.layers[:].index(True)
-        except ValueError:
-            continue
-        if layer_index > len(layers) - 1:   # bone is on reserved layers
-            continue
-        g_id = layers[layer_index].group - 1
-        if g_id >= 0:
-            name = groups[g_id].name
-            b.bone_group = obj.pose.bone_groups[name]
+    # Bone group of every layer, bones on reserved layers get none
+    layer_groups = [None] * 32
+    for i, l in enumerate(layers[:32]):
+        if l.group > 0:
+            layer_groups[i] = obj.pose.bone_groups[groups[l.group - 1].name]
+
+    # Bones take the group of their first layer
+    bone_layers = get_bone_layers(obj)
+    first_layers = bone_layers.argmax(axis=1)
+    names = obj.data.bones.keys()
+
+    for index in np.flatnonzero(bone_layers.any(axis=1)):
+        bg = layer_groups[first_layers[index]]
+        if bg is not None:
+            pb[names[index]].bone_group = bg
 
 
 def get_bone_rigs(obj, bone_name, halt_on_missing=False):
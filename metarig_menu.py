@@ -79,27 +79,34 @@ def get_metarig_list(path, depth=0):
     return metarigs_dict
 
 
-def make_metarig_add_execute(m):
-    """ Create an execute method for a metarig creation operator.
+def create_metarig(context, m):
+    """ Adds a new metarig object built by the metarig module m, and returns it.
     """
-    def execute(self, context):
-        # Add armature object
-        bpy.ops.object.armature_add()
-        obj = context.active_object
-        obj.name = "metarig"
-        obj.data.name = "metarig"
+    # Add armature object
+    bpy.ops.object.armature_add()
+    obj = context.active_object
+    obj.name = "metarig"
+    obj.data.name = "metarig"
+
+    # Remove default bone
+    bpy.ops.object.mode_set(mode='EDIT')
+    bones = context.active_object.data.edit_bones
+    bones.remove(bones[0])
+
+    template_list.fill_ui_template_list(obj)
 
-        # Remove default bone
-        bpy.ops.object.mode_set(mode='EDIT')
-        bones = context.active_object.data.edit_bones
-        bones.remove(bones[0])
+    # Create metarig
+    m.create(obj)
 
-        template_list.fill_ui_template_list(obj)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return obj
 
-        # Create metarig
-        m.create(obj)
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+def make_metarig_add_execute(m):
+    """ Create an execute method for a metarig creation operator.
+    """
+    def execute(self, context):
+        create_metarig(context, m)
         return {'FINISHED'}
     return execute
 
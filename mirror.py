@@ -0,0 +1,401 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Mirror-based generation: the right side rig of a symmetric pair is not
+    generated, but mirrored across X from the generated left side rig.
+"""
+
+import bpy
+import re
+from mathutils import Matrix, Vector
+from rna_prop_ui import rna_idprop_ui_prop_get
+
+from .utils import WGT_PREFIX, make_original_name
+from .utils import create_widget, mode_set
+
+SIDE_PATTERN = re.compile(r'^(.*[._\- ])([LlRr])((?:\.\d+)?)$')
+SIDE_FLIP = {'L': 'R', 'R': 'L', 'l': 'r', 'r': 'l'}
+
+X_MIRROR = Matrix.Scale(-1, 4, Vector((1, 0, 0)))
+
+# Relative tolerance of the metarig symmetry check
+SYMMETRY_TOLERANCE = 1e-4
+
+# Values measured along X, or around Y and Z, change sign across the mirror
+MIRROR_NEGATED_RANGES = {
+    'LIMIT_LOCATION': (('min_x', 'max_x'),),
+    'LIMIT_ROTATION': (('min_y', 'max_y'), ('min_z', 'max_z')),
+}
+IK_NEGATED_RANGES = (('ik_min_y', 'ik_max_y'), ('ik_min_z', 'ik_max_z'))
+
+EDIT_BONE_ATTRIBUTES = (
+    'use_deform', 'use_inherit_rotation', 'use_inherit_scale',
+    'use_local_location', 'use_envelope_multiply', 'bbone_segments', 'bbone_in',
+    'bbone_out', 'bbone_x', 'bbone_z', 'envelope_distance', 'head_radius',
+    'tail_radius', 'hide_select',
+)
+
+POSE_BONE_ATTRIBUTES = (
+    'rotation_mode', 'lock_location', 'lock_rotation', 'lock_rotation_w',
+    'lock_rotations_4d', 'lock_scale', 'ik_stretch', 'lock_ik_x', 'lock_ik_y',
+    'lock_ik_z', 'use_ik_limit_x', 'use_ik_limit_y', 'use_ik_limit_z',
+    'ik_stiffness_x', 'ik_stiffness_y', 'ik_stiffness_z', 'ik_min_x', 'ik_max_x',
+    'custom_shape_scale', 'use_custom_shape_bone_size',
+)
+
+
+def flip_name(name):
+    """ Returns the name with its .L/.R side swapped, or the name itself
+        if it has no side.
+    """
+    match = SIDE_PATTERN.match(name)
+    if match is None:
+        return name
+    base, side, number = match.groups()
+    return base + SIDE_FLIP[side] + number
+
+
+def flip_quoted_names(text, names):
+    """ Flips the side of every quoted string of text found in names.
+    """
+    def flip(match):
+        quote, name = match.group(1), match.group(2)
+        if name in names:
+            return quote + flip_name(name) + quote
+        return match.group(0)
+    return re.sub(r'(["\'])([^"\'\n]*)\1', flip, text)
+
+
+def is_mirror_matrix(left, right, scale):
+    """ True if right is the X mirror of the left bone matrix.
+    """
+    mirrored = X_MIRROR * left * X_MIRROR
+    for i in range(3):
+        for j in range(3):
+            if abs(mirrored[i][j] - right[i][j]) > SYMMETRY_TOLERANCE:
+                return False
+        if abs(mirrored[i][3] - right[i][3]) > SYMMETRY_TOLERANCE * scale:
+            return False
+    return True
+
+
+def get_parameters(pose_bone):
+    """ Returns the rigify parameters of a pose bone as a comparable dict.
+    """
+    params = pose_bone.rigify_parameters
+    values = dict()
+    for prop in params.bl_rna.properties:
+        if prop.identifier in ('rna_type', 'name'):
+            continue
+        value = getattr(params, prop.identifier)
+        values[prop.identifier] = tuple(value) if hasattr(value, '__len__') and not isinstance(value, str) else value
+    return values
+
+
+def get_rig_chains(metarig):
+    """ Maps every metarig bone holding a rig type to the bones of its rig:
+        itself and the descendants up to the next rig type.
+    """
+    pbones = metarig.pose.bones
+    chains = dict()
+    for bone in metarig.data.bones:
+        owner = bone
+        while owner and not pbones[owner.name].rigify_type:
+            owner = owner.parent
+        if owner:
+            chains.setdefault(owner.name, []).append(bone.name)
+    return chains
+
+
+def find_mirror_rigs(metarig):
+    """ Checks the symmetry of the metarig, and returns the rig pairs that can
+        be mirrored: same rig type and parameters, X mirrored bones and parents.
+        Returns {right rig bone: (left rig bone, left rig ORG bones)}, in ORG names.
+    """
+    pbones = metarig.pose.bones
+    bones = metarig.data.bones
+    chains = get_rig_chains(metarig)
+    scale = max([b.length for b in bones] + [1e-6])
+
+    pairs = dict()
+    for left, chain in chains.items():
+        match = SIDE_PATTERN.match(left)
+        right = flip_name(left)
+        if match is None or match.group(2) not in 'Ll' or right not in chains:
+            continue
+        if pbones[left].rigify_type != pbones[right].rigify_type:
+            continue
+        if get_parameters(pbones[left]) != get_parameters(pbones[right]):
+            continue
+        if sorted(flip_name(name) for name in chain) != sorted(chains[right]):
+            continue
+
+        symmetric = True
+        for name in chain:
+            bone = bones[name]
+            other = bones[flip_name(name)]
+            parent = flip_name(bone.parent.name) if bone.parent else None
+            other_parent = other.parent.name if other.parent else None
+            if parent != other_parent \
+                    or not is_mirror_matrix(bone.matrix_local, other.matrix_local, scale) \
+                    or abs(bone.length - other.length) > SYMMETRY_TOLERANCE * scale:
+                symmetric = False
+                break
+
+        if symmetric:
+            pairs[make_original_name(right)] = (make_original_name(left),
+                                                 [make_original_name(name) for name in chain])
+
+    return pairs
+
+
+def get_rig_state(obj, org_bones):
+    """ Records the constraints and drivers of the rig's ORG bones before
+        it is generated, so that only what the rig adds gets mirrored.
+    """
+    pbones = obj.pose.bones
+    drivers = set()
+    for anim in (obj.animation_data, obj.data.animation_data):
+        if anim is not None:
+            drivers.update((fcu.data_path, fcu.array_index) for fcu in anim.drivers)
+    return {
+        'constraints': {name: len(pbones[name].constraints) for name in org_bones},
+        'drivers': drivers,
+    }
+
+
+def can_mirror(obj, bone_names):
+    """ True if there are bones, every bone has a side and its mirror
+        name is free.
+    """
+    if not bone_names:
+        return False
+
+    bones = obj.data.edit_bones
+    for name in bone_names:
+        other = flip_name(name)
+        if other == name or other in bones:
+            return False
+    return True
+
+
+def copy_props(source, target, attributes):
+    for attr in attributes:
+        if hasattr(source, attr):
+            setattr(target, attr, getattr(source, attr))
+
+
+def negate_ranges(target, ranges):
+    for low, high in ranges:
+        low_value, high_value = getattr(target, low), getattr(target, high)
+        setattr(target, low, -high_value)
+        setattr(target, high, -low_value)
+
+
+def mirror_edit_bones(obj, new_bones, org_bones):
+    """ Creates the X mirror of the new edit bones, and mirrors the
+        ORG bones onto their existing counterparts. Must be in edit mode.
+    """
+    eb = obj.data.edit_bones
+
+    for name in new_bones:
+        eb.new(flip_name(name))
+
+    for name in new_bones + org_bones:
+        bone = eb[name]
+        other = eb[flip_name(name)]
+        other.head = (-bone.head.x, bone.head.y, bone.head.z)
+        other.tail = (-bone.tail.x, bone.tail.y, bone.tail.z)
+        other.roll = -bone.roll
+        other.layers = list(bone.layers)
+        copy_props(bone, other, EDIT_BONE_ATTRIBUTES)
+
+    # Parent once all the bones are in place, connecting moves the head
+    for name in new_bones + org_bones:
+        bone = eb[name]
+        other = eb[flip_name(name)]
+        if bone.parent:
+            other.parent = eb.get(flip_name(bone.parent.name), bone.parent)
+        else:
+            other.parent = None
+        other.use_connect = bone.use_connect
+
+
+def mirror_pose_bones(obj, new_bones, org_bones, state):
+    """ Mirrors the pose bone settings, custom properties and constraints.
+        Must be in object mode.
+    """
+    pbones = obj.pose.bones
+
+    for name in new_bones:
+        bone = pbones[name]
+        other = pbones[flip_name(name)]
+        copy_props(bone, other, POSE_BONE_ATTRIBUTES)
+        copy_props(bone, other, ('ik_min_y', 'ik_max_y', 'ik_min_z', 'ik_max_z'))
+        negate_ranges(other, IK_NEGATED_RANGES)
+        other.bone.hide = bone.bone.hide
+        other.bone.show_wire = bone.bone.show_wire
+        if bone.custom_shape_transform:
+            other.custom_shape_transform = pbones[flip_name(bone.custom_shape_transform.name)]
+
+    for name in new_bones + org_bones:
+        bone = pbones[name]
+        other = pbones[flip_name(name)]
+
+        # Custom properties
+        for key in bone.keys():
+            if key in ('_RNA_UI', 'rigify_parameters', 'rigify_type') or key in other.keys():
+                continue
+            other[key] = bone[key]
+            prop1 = rna_idprop_ui_prop_get(bone, key, create=False)
+            if prop1 is not None:
+                prop2 = rna_idprop_ui_prop_get(other, key, create=True)
+                for k in prop1.keys():
+                    prop2[k] = prop1[k]
+
+        # Constraints added by the rig
+        first = state['constraints'].get(name, 0)
+        for con in bone.constraints[first:]:
+            mirror_constraint(obj, con, other.constraints.new(con.type))
+
+
+def mirror_constraint(obj, con, other):
+    """ Copies the constraint con onto other, targeting the mirror bones.
+    """
+    # Targets first, the spaces available depend on them
+    props = [p.identifier for p in con.bl_rna.properties
+             if not p.is_readonly and p.identifier not in ('rna_type', 'type')]
+    props.sort(key=lambda p: not p.endswith('target'))
+    for prop in props:
+        try:
+            setattr(other, prop, getattr(con, prop))
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+    for attr in ('subtarget', 'pole_subtarget'):
+        name = getattr(con, attr, "")
+        if name and getattr(con, attr.replace('subtarget', 'target')) == obj:
+            setattr(other, attr, flip_name(name))
+
+    negate_ranges(other, MIRROR_NEGATED_RANGES.get(con.type, ()))
+
+
+def flip_data_path(data_path):
+    """ Flips the sided names between quotes in an RNA data path.
+    """
+    return re.sub(r'"([^"]*)"', lambda m: '"%s"' % flip_name(m.group(1)), data_path)
+
+
+def mirror_drivers(obj, new_bones, org_bones, state):
+    """ Copies the drivers the rig added on its bones to the mirror bones,
+        reading from the mirror bones too. Must be in object mode.
+    """
+    names = set(new_bones) | set(org_bones)
+
+    for id_data in (obj, obj.data):
+        anim = id_data.animation_data
+        if anim is None:
+            continue
+        for fcu in list(anim.drivers):
+            if (fcu.data_path, fcu.array_index) in state['drivers']:
+                continue
+            words = fcu.data_path.split('"')
+            if len(words) < 3 or words[1] not in names:
+                continue
+
+            path = flip_data_path(fcu.data_path)
+            try:
+                other = id_data.driver_add(path, fcu.array_index)
+            except TypeError:
+                other = id_data.driver_add(path)
+
+            driver, other_driver = fcu.driver, other.driver
+            other_driver.type = driver.type
+            other_driver.expression = driver.expression
+            other_driver.use_self = driver.use_self
+
+            for var in driver.variables:
+                other_var = other_driver.variables.new()
+                other_var.name = var.name
+                other_var.type = var.type
+                for i, target in enumerate(var.targets):
+                    other_target = other_var.targets[i]
+                    if var.type == 'SINGLE_PROP':
+                        other_target.id_type = target.id_type
+                    other_target.id = target.id
+                    other_target.data_path = flip_data_path(target.data_path)
+                    other_target.bone_target = flip_name(target.bone_target)
+                    other_target.transform_type = target.transform_type
+                    other_target.transform_space = target.transform_space
+
+            for mod, other_mod in zip(fcu.modifiers, other.modifiers):
+                if mod.type == 'GENERATOR' and other_mod.type == 'GENERATOR':
+                    other_mod.mode = mod.mode
+                    other_mod.poly_order = mod.poly_order
+                    other_mod.use_additive = mod.use_additive
+                    other_mod.coefficients = tuple(mod.coefficients)
+
+
+def mirror_widgets(obj, new_bones):
+    """ Gives the mirror bones the X mirror of the rig's widgets.
+        Must be in object mode.
+    """
+    pbones = obj.pose.bones
+    prefix = WGT_PREFIX + obj.name + '_'
+
+    for name in new_bones:
+        bone = pbones[name]
+        other = pbones[flip_name(name)]
+        shape = bone.custom_shape
+        if shape is None:
+            continue
+        if not shape.name.startswith(prefix) or shape.type != 'MESH':
+            # Not a widget of this rig, share it
+            other.custom_shape = shape
+            continue
+
+        widget_bone = flip_name(shape.name[len(prefix):])
+        widget_name = prefix + widget_bone
+        widget = bpy.data.objects.get(widget_name)
+        if widget is None:
+            widget = create_widget(obj, widget_bone, widget_bone if widget_bone in pbones else other.name)
+            if widget is None:
+                widget = bpy.data.objects[widget_name]
+            mesh = shape.data
+            verts = [(-v.co.x, v.co.y, v.co.z) for v in mesh.vertices]
+            edges = [tuple(e.vertices) for e in mesh.edges]
+            faces = [tuple(reversed(p.vertices)) for p in mesh.polygons]
+            widget.data.from_pydata(verts, edges, faces)
+            widget.data.update()
+        other.custom_shape = widget
+
+
+def mirror_rig(obj, new_bones, org_bones, state):
+    """ Mirrors everything a generated rig made, its new bones and what it
+        changed on its ORG bones, to the other side. Returns the names of
+        the mirror bones. Must be called in edit mode.
+    """
+    mirror_edit_bones(obj, new_bones, org_bones)
+    mode_set(obj, 'OBJECT')
+    mirror_pose_bones(obj, new_bones, org_bones, state)
+    mirror_drivers(obj, new_bones, org_bones, state)
+    mirror_widgets(obj, new_bones)
+    mode_set(obj, 'EDIT')
+    return [flip_name(name) for name in new_bones]
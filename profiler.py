@@ -0,0 +1,235 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Playback profiler of generated rigs: measures the evaluation time of
+    every rig type instance and bone group by muting its constraints and
+    drivers, and ranks them.
+
+    Headless use:
+        blender -b --python-expr "import rigify.profiler; rigify.profiler.main()" \\
+            -- --metarig human --start 1 --end 48 --output human_profile.json
+"""
+
+import bpy
+import argparse
+import json
+import re
+import sys
+import time
+
+from .utils import MetarigError, get_metarig_module, METARIG_DIR, ORG_PREFIX
+from .report import get_bone_owners, driver_bone_name, UNATTRIBUTED
+
+# Bone groups profiled across rig types: (name, bone name pattern, rigify_type pattern)
+PROFILE_GROUPS = (
+    ('tweaks', r'tweak', None),
+    ('ik_stretch', r'ik_stretch', None),
+    ('face', None, r'^faces\.'),
+)
+
+
+def time_playback(context, obj, frames, repeat=3):
+    """ Returns the shortest average time, in seconds, the scene takes to
+        step through the frames, over repeat runs. The rig is tagged on every
+        frame so it is evaluated even where it isn't animated.
+    """
+    scn = context.scene
+    best = None
+    for r in range(repeat):
+        elapsed = 0.0
+        for f in frames:
+            obj.update_tag({'OBJECT', 'DATA'})
+            start = time.perf_counter()
+            scn.frame_set(f)
+            elapsed += time.perf_counter() - start
+        average = elapsed / len(frames)
+        if best is None or average < best:
+            best = average
+    return best
+
+
+def get_profile_groups(obj, per_rig=True, per_group=True):
+    """ Returns [(kind, name, rigify_type, bone names)] of the parts of
+        the rig to measure.
+    """
+    owners = get_bone_owners(obj)
+    pbones = obj.pose.bones
+    groups = []
+
+    if per_rig:
+        rigs = dict()
+        for pbone in pbones:
+            rigs.setdefault(owners.get(pbone.name, UNATTRIBUTED), set()).add(pbone.name)
+        for base, names in sorted(rigs.items()):
+            org = pbones.get(ORG_PREFIX + base)
+            groups.append(('rig', base or "(unattributed)", org.rigify_type if org else "", names))
+
+    if per_group:
+        for name, bone_pattern, type_pattern in PROFILE_GROUPS:
+            names = set()
+            for pbone in pbones:
+                if bone_pattern and re.search(bone_pattern, pbone.name):
+                    names.add(pbone.name)
+                elif type_pattern:
+                    org = pbones.get(ORG_PREFIX + owners.get(pbone.name, UNATTRIBUTED))
+                    if org and re.search(type_pattern, org.rigify_type):
+                        names.add(pbone.name)
+            if names:
+                groups.append(('group', name, "", names))
+
+    return groups
+
+
+def mute_bones(obj, names):
+    """ Mutes the constraints and the drivers of the named bones.
+        Returns what was changed, to give to unmute().
+    """
+    muted = []
+    pbones = obj.pose.bones
+    for name in names:
+        for con in pbones[name].constraints:
+            if not con.mute:
+                con.mute = True
+                muted.append(con)
+
+    for anim in (obj.animation_data, obj.data.animation_data):
+        if anim is None:
+            continue
+        for fcu in anim.drivers:
+            if not fcu.mute and driver_bone_name(fcu.data_path) in names:
+                fcu.mute = True
+                muted.append(fcu)
+
+    return muted
+
+
+def unmute(muted):
+    for item in muted:
+        item.mute = False
+
+
+def profile_rig(context, obj, frame_start, frame_end, repeat=3, per_rig=True, per_group=True):
+    """ Times the playback of the rig, then of the rig with each group muted.
+        Returns the baseline time per frame and the hotspots, the groups
+        saving the most time first.
+    """
+    if obj is None or obj.data.get("rig_id") is None:
+        raise MetarigError("RIGIFY ERROR: a generated rig is needed to profile playback")
+
+    scn = context.scene
+    frame_current = scn.frame_current
+    frames = list(range(frame_start, frame_end + 1))
+
+    try:
+        baseline = time_playback(context, obj, frames, repeat)
+        hotspots = []
+        for kind, name, rigify_type, names in get_profile_groups(obj, per_rig, per_group):
+            muted = mute_bones(obj, names)
+            if not muted:
+                continue
+            try:
+                elapsed = time_playback(context, obj, frames, repeat)
+            finally:
+                unmute(muted)
+
+            cost = max(baseline - elapsed, 0.0)
+            hotspots.append({
+                'kind': kind,
+                'name': name,
+                'rigify_type': rigify_type,
+                'bones': len(names),
+                'muted': len(muted),
+                'ms_per_frame': cost * 1000.0,
+                'share': cost / baseline if baseline else 0.0,
+            })
+    finally:
+        scn.frame_set(frame_current)
+
+    hotspots.sort(key=lambda h: h['ms_per_frame'], reverse=True)
+
+    return {
+        'rig_id': obj.data["rig_id"],
+        'rig': obj.name,
+        'frames': len(frames),
+        'ms_per_frame': baseline * 1000.0,
+        'hotspots': hotspots,
+    }
+
+
+def format_profile(profile):
+    """ Returns the profile as a ranked text table.
+    """
+    lines = ["Rig '%s': %.3f ms per frame over %d frames"
+             % (profile['rig'], profile['ms_per_frame'], profile['frames'])]
+    lines.append("%-4s %-6s %-28s %-26s %6s %6s %9s %7s"
+                 % ("#", "kind", "name", "rigify_type", "bones", "muted", "ms/frame", "share"))
+    for i, h in enumerate(profile['hotspots']):
+        lines.append("%-4d %-6s %-28s %-26s %6d %6d %9.3f %6.1f%%"
+                     % (i + 1, h['kind'], h['name'], h['rigify_type'], h['bones'], h['muted'],
+                        h['ms_per_frame'], h['share'] * 100.0))
+    return "\n".join(lines)
+
+
+def generate_metarig(context, metarig_name):
+    """ Adds the shipped metarig (module path relative to the metarigs
+        directory, e.g. "Animals.cat") and generates it. Returns the rig.
+    """
+    from .metarig_menu import create_metarig
+    from .generate import generate_rig
+
+    path, sep, name = metarig_name.rpartition('.')
+    module = get_metarig_module(name, METARIG_DIR + '.' + path if path else METARIG_DIR)
+    metarig = create_metarig(context, module)
+    return generate_rig(context, metarig)
+
+
+def main(argv=None):
+    """ Command line entry point, reads the arguments after '--'.
+    """
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(description="Profile the playback of a Rigify rig")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--rig", help="Name of a generated rig object")
+    source.add_argument("--metarig", help="Shipped metarig to generate, e.g. human or Animals.cat")
+    parser.add_argument("--start", type=int, default=1, help="First frame")
+    parser.add_argument("--end", type=int, default=24, help="Last frame")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measure, the fastest is kept")
+    parser.add_argument("--no-rigs", action="store_true", help="Don't measure the rig type instances")
+    parser.add_argument("--no-groups", action="store_true", help="Don't measure the bone groups")
+    parser.add_argument("--output", default=None, help="Write the profile to this JSON file")
+    args = parser.parse_args(argv)
+
+    context = bpy.context
+    if args.metarig:
+        obj = generate_metarig(context, args.metarig)
+    else:
+        obj = bpy.data.objects.get(args.rig)
+
+    profile = profile_rig(context, obj, args.start, args.end, args.repeat,
+                          not args.no_rigs, not args.no_groups)
+    print(format_profile(profile))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(profile, f, indent=2, sort_keys=True)
+
+    return profile
@@ -0,0 +1,227 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Static complexity report of generated rigs: what every rig type
+    instance of the metarig added to the evaluation of the armature.
+"""
+
+import ast
+import json
+
+from .utils import ORG_PREFIX, MCH_PREFIX, DEF_PREFIX, MetarigError, strip_org
+
+RIG_BONES_REGISTRY = "rigify_rig_bones"  # Armature custom property: {metarig bone: generated bones}
+UNATTRIBUTED = ""  # Report entry of the bones no rig type created (root, ...)
+
+SIMPLE_EXPRESSION_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Num, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd,
+)
+
+
+def write_rig_bones_registry(obj, rig_bones):
+    """ Stores which bones every rig created, keyed on the metarig bone
+        holding the rig type. Called at generation time.
+    """
+    obj.data[RIG_BONES_REGISTRY] = rig_bones
+
+
+def bone_category(name):
+    """ Returns the report category of a bone: ORG, MCH, DEF or control.
+    """
+    for prefix in (ORG_PREFIX, MCH_PREFIX, DEF_PREFIX):
+        if name.startswith(prefix):
+            return prefix.rstrip('-')
+    return 'control'
+
+
+def is_simple_expression(expression, variables):
+    """ True if the expression only does arithmetic on numbers and
+        the driver variables, without function calls or attribute access.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        return False
+
+    for node in ast.walk(tree):
+        if not isinstance(node, SIMPLE_EXPRESSION_NODES):
+            return False
+        if isinstance(node, ast.Name) and node.id not in variables:
+            return False
+    return True
+
+
+def is_python_driver(driver):
+    """ True if the driver runs a python expression beyond plain arithmetic.
+    """
+    if driver.type != 'SCRIPTED':
+        return False
+    return driver.use_self or not is_simple_expression(driver.expression, {v.name for v in driver.variables})
+
+
+def driver_bone_name(data_path):
+    """ Returns the name of the bone an fcurve data path points into, or None.
+    """
+    words = data_path.split('"')
+    if len(words) >= 3 and words[0] in ('pose.bones[', 'bones['):
+        return words[1]
+    return None
+
+
+def new_counts():
+    return {
+        'bones': {'ORG': 0, 'MCH': 0, 'DEF': 0, 'control': 0},
+        'constraints': {},
+        'drivers': {},
+        'python_drivers': 0,
+        'bbone_segments': 0,
+        'widget_vertices': 0,
+    }
+
+
+def add_counts(total, counts):
+    """ Adds the counts into total.
+    """
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            for k, v in value.items():
+                total[key][k] = total[key].get(k, 0) + v
+        else:
+            total[key] += value
+
+
+def get_bone_owners(obj):
+    """ Maps every bone of the generated rig to the metarig bone whose rig
+        type produced it. ORG bones belong to the closest rig type above them.
+    """
+    owners = dict()
+    registry = obj.data.get(RIG_BONES_REGISTRY)
+    if registry is not None:
+        for base, names in registry.to_dict().items():
+            for name in names:
+                owners[name] = base
+
+    for pbone in obj.pose.bones:
+        if pbone.name in owners or not pbone.name.startswith(ORG_PREFIX):
+            continue
+        owner = pbone
+        while owner and not owner.rigify_type:
+            owner = owner.parent
+        if owner and owner.name.startswith(ORG_PREFIX):
+            owners[pbone.name] = strip_org(owner.name)
+
+    return owners
+
+
+def rig_complexity_report(obj):
+    """ Counts what the generated rig evaluates, per rig type instance
+        (keyed on the metarig bone) and in total.
+    """
+    rig_id = obj.data.get("rig_id")
+    if rig_id is None:
+        raise MetarigError("RIGIFY ERROR: '%s' is not a generated rig" % obj.name)
+
+    owners = get_bone_owners(obj)
+    entries = dict()
+
+    def entry(bone_name):
+        base = owners.get(bone_name, UNATTRIBUTED)
+        if base not in entries:
+            org = obj.pose.bones.get(ORG_PREFIX + base)
+            entries[base] = {
+                'rigify_type': org.rigify_type if org else "",
+                'counts': new_counts(),
+            }
+        return entries[base]['counts']
+
+    for pbone in obj.pose.bones:
+        counts = entry(pbone.name)
+        counts['bones'][bone_category(pbone.name)] += 1
+
+        for con in pbone.constraints:
+            counts['constraints'][con.type] = counts['constraints'].get(con.type, 0) + 1
+
+        segments = pbone.bone.bbone_segments
+        if segments > 1:
+            counts['bbone_segments'] += segments
+
+        shape = pbone.custom_shape
+        if shape and shape.type == 'MESH':
+            counts['widget_vertices'] += len(shape.data.vertices)
+
+    for anim in (obj.animation_data, obj.data.animation_data):
+        if anim is None:
+            continue
+        for fcu in anim.drivers:
+            bone_name = driver_bone_name(fcu.data_path)
+            if bone_name is None:
+                counts = entry(None)
+            else:
+                counts = entry(bone_name)
+            driver = fcu.driver
+            counts['drivers'][driver.type] = counts['drivers'].get(driver.type, 0) + 1
+            if is_python_driver(driver):
+                counts['python_drivers'] += 1
+
+    total = new_counts()
+    for rig in entries.values():
+        add_counts(total, rig['counts'])
+
+    return {
+        'rig_id': rig_id,
+        'rig': obj.name,
+        'rigs': entries,
+        'total': total,
+        'registry': RIG_BONES_REGISTRY in obj.data,
+    }
+
+
+def format_report(report):
+    """ Returns the report as a text table, heaviest rigs first.
+    """
+    def weight(counts):
+        return (sum(counts['constraints'].values()) + sum(counts['drivers'].values())
+                + counts['python_drivers'] + counts['bbone_segments'])
+
+    lines = ["Rig '%s' (rig_id %s)" % (report['rig'], report['rig_id'])]
+    if not report.get('registry'):
+        lines.append("No bone registry, regenerate the rig: only ORG bones are attributed to their rig")
+    header = "%-28s %-26s %5s %5s %5s %5s %6s %6s %6s %6s %8s"
+    row = "%-28s %-26s %5d %5d %5d %5d %6d %6d %6d %6d %8d"
+    lines.append(header % ("metarig bone", "rigify_type", "ORG", "MCH", "DEF", "CTRL",
+                           "cons", "drv", "py", "bbseg", "wgt vert"))
+
+    rigs = sorted(report['rigs'].items(), key=lambda item: weight(item[1]['counts']), reverse=True)
+    rigs.append(("TOTAL", {'rigify_type': "", 'counts': report['total']}))
+
+    for base, rig in rigs:
+        counts = rig['counts']
+        bones = counts['bones']
+        lines.append(row % (base or "(unattributed)", rig['rigify_type'],
+                            bones['ORG'], bones['MCH'], bones['DEF'], bones['control'],
+                            sum(counts['constraints'].values()), sum(counts['drivers'].values()),
+                            counts['python_drivers'], counts['bbone_segments'], counts['widget_vertices']))
+
+    return "\n".join(lines)
+
+
+def report_to_json(report):
+    return json.dumps(report, indent=2, sort_keys=True)
@@ -21,10 +21,11 @@
 import bpy
 
 from ...utils import MetarigError
-from ...utils import copy_bone
+from ...utils import copy_bones
 from ...utils import connected_children_names
 from ...utils import strip_org, make_deformer_name
 from ...utils import create_bone_widget
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 
 class Rig:
@@ -51,76 +52,93 @@ class Rig:
             The main armature should be selected and active before this is called.
 
         """
-        bpy.ops.object.mode_set(mode='EDIT')
+        self.generate_batch([self])
+
+    @staticmethod
+    def generate_batch(rigs):
+        """ Generate several rigs of this type at once, with a single
+            edit pass and a single pose pass for all of them.
+            Returns the names of the bones created for each rig.
+        """
+        obj = rigs[0].obj
+        mode_set(obj, 'EDIT')
 
         # Create the deformation and control bone chains.
         # Just copies of the original chain.
-        def_chain = []
-        ctrl_chain = []
-        for i in range(len(self.org_bones)):
-            name = self.org_bones[i]
-
-            # Control bone
-            if self.make_controls:
-                # Copy
-                ctrl_bone = copy_bone(self.obj, name)
-                eb = self.obj.data.edit_bones
-                ctrl_bone_e = eb[ctrl_bone]
-                # Name
-                ctrl_bone_e.name = strip_org(name)
-                # Parenting
-                if i == 0:
-                    # First bone
-                    ctrl_bone_e.parent = eb[self.org_bones[0]].parent
+        copies = []
+        for rig in rigs:
+            for name in rig.org_bones:
+                if rig.make_controls:
+                    copies.append((name, strip_org(name)))
+                if rig.make_deforms:
+                    copies.append((name, make_deformer_name(strip_org(name))))
+        names = iter(copy_bones(obj, copies))
+
+        eb = get_edit_bones(obj)
+
+        chains = []
+        for rig in rigs:
+            def_chain = []
+            ctrl_chain = []
+            for i in range(len(rig.org_bones)):
+                # Control bone
+                if rig.make_controls:
+                    ctrl_bone_e = eb[next(names)]
+                    # Parenting
+                    if i == 0:
+                        # First bone
+                        ctrl_bone_e.parent = eb[rig.org_bones[0]].parent
+                    else:
+                        # The rest
+                        ctrl_bone_e.parent = eb[ctrl_chain[-1]]
+                    # Add to list
+                    ctrl_chain += [ctrl_bone_e.name]
                 else:
-                    # The rest
-                    ctrl_bone_e.parent = eb[ctrl_chain[-1]]
-                # Add to list
-                ctrl_chain += [ctrl_bone_e.name]
-            else:
-                ctrl_chain += [None]
-
-            # Deformation bone
-            if self.make_deforms:
-                # Copy
-                def_bone = copy_bone(self.obj, name)
-                eb = self.obj.data.edit_bones
-                def_bone_e = eb[def_bone]
-                # Name
-                def_bone_e.name = make_deformer_name(strip_org(name))
-                # Parenting
-                if i == 0:
-                    # First bone
-                    def_bone_e.parent = eb[self.org_bones[0]].parent
+                    ctrl_chain += [None]
+
+                # Deformation bone
+                if rig.make_deforms:
+                    def_bone_e = eb[next(names)]
+                    # Parenting
+                    if i == 0:
+                        # First bone
+                        def_bone_e.parent = eb[rig.org_bones[0]].parent
+                    else:
+                        # The rest
+                        def_bone_e.parent = eb[def_chain[-1]]
+                    # Add to list
+                    def_chain += [def_bone_e.name]
                 else:
-                    # The rest
-                    def_bone_e.parent = eb[def_chain[-1]]
-                # Add to list
-                def_chain += [def_bone_e.name]
-            else:
-                def_chain += [None]
-
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
-
-        # Constraints for org and def
-        for org, ctrl, defrm in zip(self.org_bones, ctrl_chain, def_chain):
-            if self.make_controls:
-                con = pb[org].constraints.new('COPY_TRANSFORMS')
-                con.name = "copy_transforms"
-                con.target = self.obj
-                con.subtarget = ctrl
-
-            if self.make_deforms:
-                con = pb[defrm].constraints.new('COPY_TRANSFORMS')
-                con.name = "copy_transforms"
-                con.target = self.obj
-                con.subtarget = org
-
-        # Create control widgets
-        if self.make_controls:
-            for bone in ctrl_chain:
-                create_bone_widget(self.obj, bone)
+                    def_chain += [None]
+            chains.append((ctrl_chain, def_chain))
+
+        mode_set(obj, 'OBJECT')
+        pb = get_pose_bones(obj)
+
+        created = []
+        for rig, (ctrl_chain, def_chain) in zip(rigs, chains):
+            # Constraints for org and def
+            for org, ctrl, defrm in zip(rig.org_bones, ctrl_chain, def_chain):
+                if rig.make_controls:
+                    con = pb[org].constraints.new('COPY_TRANSFORMS')
+                    con.name = "copy_transforms"
+                    con.target = obj
+                    con.subtarget = ctrl
+
+                if rig.make_deforms:
+                    con = pb[defrm].constraints.new('COPY_TRANSFORMS')
+                    con.name = "copy_transforms"
+                    con.target = obj
+                    con.subtarget = org
+
+            # Create control widgets
+            if rig.make_controls:
+                for bone in ctrl_chain:
+                    create_bone_widget(obj, bone)
+
+            created.append([name for name in ctrl_chain + def_chain if name])
+
+        return created
 
 
 def add_parameters(params):
@@ -144,7 +162,7 @@ def create_sample(obj):
     """ Create a sample metarig for this rig type.
     """
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -170,7 +188,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['bone.02']]
     bones['bone.03'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['bone.01']]
     pbone.rigify_type = 'basic.copy_chain'
     pbone.lock_location = (False, False, False)
@@ -193,7 +211,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -20,9 +20,10 @@
 
 import bpy
 
-from ...utils import copy_bone
+from ...utils import copy_bones
 from ...utils import strip_org, make_deformer_name
 from ...utils import create_bone_widget, create_circle_widget
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 
 class Rig:
@@ -48,44 +49,65 @@ class Rig:
             The main armature should be selected and active before this is called.
 
         """
-        bpy.ops.object.mode_set(mode='EDIT')
+        self.generate_batch([self])
 
-        # Make a control bone (copy of original).
-        if self.make_control:
-            bone = copy_bone(self.obj, self.org_bone, self.org_name)
-
-        # Make a deformation bone (copy of original, child of original).
-        if self.make_deform:
-            def_bone = copy_bone(self.obj, self.org_bone, make_deformer_name(self.org_name))
+    @staticmethod
+    def generate_batch(rigs):
+        """ Generate several rigs of this type at once, with a single
+            edit pass and a single pose pass for all of them.
+            Returns the names of the bones created for each rig.
+        """
+        obj = rigs[0].obj
+        mode_set(obj, 'EDIT')
+
+        # Make the control bones (copies of original)
+        # and the deformation bones (copies of original, children of original).
+        copies = []
+        for rig in rigs:
+            if rig.make_control:
+                copies.append((rig.org_bone, rig.org_name))
+            if rig.make_deform:
+                copies.append((rig.org_bone, make_deformer_name(rig.org_name)))
+        names = iter(copy_bones(obj, copies))
 
         # Get edit bones
-        eb = self.obj.data.edit_bones
-        # UNUSED
-        # if self.make_control:
-        #     bone_e = eb[bone]
-        if self.make_deform:
-            def_bone_e = eb[def_bone]
-
-        # Parent
-        if self.make_deform:
-            def_bone_e.use_connect = False
-            def_bone_e.parent = eb[self.org_bone]
-
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
-
-        if self.make_control:
+        eb = get_edit_bones(obj)
+
+        created = []
+        controls = []
+        for rig in rigs:
+            bones = []
+            if rig.make_control:
+                bone = next(names)
+                bones.append(bone)
+                controls.append((rig, bone))
+            if rig.make_deform:
+                def_bone = next(names)
+                bones.append(def_bone)
+
+                # Parent
+                def_bone_e = eb[def_bone]
+                def_bone_e.use_connect = False
+                def_bone_e.parent = eb[rig.org_bone]
+            created.append(bones)
+
+        mode_set(obj, 'OBJECT')
+        pb = get_pose_bones(obj)
+
+        for rig, bone in controls:
             # Constrain the original bone.
-            con = pb[self.org_bone].constraints.new('COPY_TRANSFORMS')
+            con = pb[rig.org_bone].constraints.new('COPY_TRANSFORMS')
             con.name = "copy_transforms"
-            con.target = self.obj
+            con.target = obj
             con.subtarget = bone
 
             # Create control widget
-            if self.make_widget:
-                create_circle_widget(self.obj, bone, radius=0.5)
+            if rig.make_widget:
+                create_circle_widget(obj, bone, radius=0.5)
             else:
-                create_bone_widget(self.obj, bone)
+                create_bone_widget(obj, bone)
+
+        return created
 
 
 def add_parameters(params):
@@ -127,7 +149,7 @@ def create_sample(obj):
     """ Create a sample metarig for this rig type.
     """
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -139,7 +161,7 @@ def create_sample(obj):
     bone.use_connect = False
     bones['Bone'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Bone']]
     pbone.rigify_type = 'basic.super_copy'
     pbone.lock_location = (False, False, False)
@@ -148,7 +170,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
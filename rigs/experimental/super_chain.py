@@ -5,6 +5,8 @@ from ...utils import copy_bone, flip_bone, put_bone, org, align_bone_y_axis, ali
 from ...utils import strip_org, make_deformer_name, connected_children_names
 from ...utils import create_circle_widget, create_sphere_widget, create_widget, create_chain_widget
 from ...utils import MetarigError, make_mechanism_name, create_cube_widget
+from ...utils import apply_constraints, make_drivers, prop_variable
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 from rna_prop_ui import rna_idprop_ui_prop_get
 from ..limbs.limb_utils import get_bone_name
 
@@ -23,7 +25,7 @@ class Rig:
     def __init__(self, obj, bone_name, params):
         """ A simplified version of the torso rig. Basically a connected-DEF chain of bones """
 
-        eb = obj.data.edit_bones
+        eb = get_edit_bones(obj)
 
         self.obj = obj
         self.org_bones = [bone_name] + connected_children_names(obj, bone_name)
@@ -127,8 +129,8 @@ class Rig:
 
         org_bones  = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         if not pivot:
             pivot = int(len(org_bones)/2)
@@ -180,8 +182,8 @@ class Rig:
         org_bones  = self.org_bones
         pivot_name = org_bones[pivot-1]
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create torso control bone
         torso_name = 'torso'
@@ -213,8 +215,8 @@ class Rig:
     def create_deform(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         def_bones = []
         for o in org_bones:
@@ -222,7 +224,7 @@ class Rig:
             def_name = copy_bone(self.obj, o, def_name)
             def_bones.append(def_name)
 
-        bpy.ops.object.mode_set(mode='POSE')
+        mode_set(self.obj, 'POSE')
         # Create bbone segments
         for bone in def_bones:
             self.obj.data.bones[bone].bbone_segments = self.bbones
@@ -233,15 +235,15 @@ class Rig:
         else:
             self.obj.data.bones[def_bones[0]].bbone_in = 1.0
             self.obj.data.bones[def_bones[-1]].bbone_out = 1.0
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
         return def_bones
 
     def create_neck( self, neck_bones ):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create neck control
         neck    = copy_bone( self.obj, org(neck_bones[0]), 'neck' )
@@ -302,8 +304,8 @@ class Rig:
     def create_chest( self, chest_bones ):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # get total spine length
 
@@ -341,8 +343,8 @@ class Rig:
     def create_hips( self, hip_bones ):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create hips control bone
         hips = copy_bone( self.obj, org( hip_bones[-1] ), 'hips' )
@@ -388,8 +390,8 @@ class Rig:
     def create_chain(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         twk, mch, mch_ctrl, ctrl = [], [], [], []
 
@@ -569,8 +571,8 @@ class Rig:
     def parent_bones(self, bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Parent deform bones
         for i, b in enumerate(bones['def']):
@@ -704,17 +706,7 @@ class Rig:
             eb[ org ].parent = eb[ twk ]
 
     def make_constraint(self, bone, constraint):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
-
-        owner_pb = pb[bone]
-        const = owner_pb.constraints.new(constraint['constraint'])
-        const.target = self.obj
-
-        # filter contraint props to those that actually exist in the current
-        # type of constraint, then assign values to each
-        for p in [k for k in constraint.keys() if k in dir(const)]:
-            setattr(const, p, constraint[p])
+        apply_constraints(self.obj, [(bone, constraint)])
 
     def constrain_bones(self, bones):
         # DEF bones
@@ -902,9 +894,9 @@ class Rig:
                 })
 
     def stick_to_bendy_bones(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
+        mode_set(self.obj, 'OBJECT')
         deform = bones['def']
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
 
         if len(deform) > 1:  # Only for single bone sup chain
             return
@@ -925,8 +917,8 @@ class Rig:
             def_pb.use_bbone_custom_handles = True
 
     def create_drivers(self, bones):
-        bpy.ops.object.mode_set(mode ='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Setting the torso's props
         torso = pb[ bones['pivot']['ctrl'] ]
@@ -948,28 +940,15 @@ class Rig:
             prop["description"] = prop
 
         # driving the follow rotation switches for neck and head
-        for bone, prop, in zip( owners, props ):
-            # Add driver to copy rotation constraint
-            drv = pb[ bone ].constraints[ 0 ].driver_add("influence").driver
-            drv.type = 'AVERAGE'
-
-            var = drv.variables.new()
-            var.name = prop
-            var.type = "SINGLE_PROP"
-            var.targets[0].id = self.obj
-            var.targets[0].data_path = \
-                torso.path_from_id() + '['+ '"' + prop + '"' + ']'
-
-            drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-            drv_modifier.mode            = 'POLYNOMIAL'
-            drv_modifier.poly_order      = 1
-            drv_modifier.coefficients[0] = 1.0
-            drv_modifier.coefficients[1] = -1.0
+        make_drivers( [
+            ( pb[ bone ].constraints[ 0 ], "influence",
+              [ ( prop, prop_variable( self.obj, torso.name, prop ) ) ], 'invert' )
+            for bone, prop in zip( owners, props )
+        ] )
 
     def locks_and_widgets(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         #Locks
         mch_ctrl = bones['chain']['mch_ctrl']
@@ -1124,8 +1103,8 @@ class Rig:
 
         self.SINGLE_BONE = (len(self.org_bones) == 1)
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         bones = {}
         if eb[self.org_bones[0]].parent:
@@ -1346,7 +1325,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -1379,7 +1358,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['spine.002']]
     bones['spine.003'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['spine']]
     pbone.rigify_type = 'experimental.super_chain'
     pbone.lock_location = (False, False, False)
@@ -1413,7 +1392,7 @@ def create_sample(obj):
     pbone.rotation_mode = 'QUATERNION'
     pbone.bone.layers = [True, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False]
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -4,6 +4,8 @@ from   ...utils       import copy_bone, flip_bone
 from   ...utils       import org, strip_org, make_deformer_name, connected_children_names, make_mechanism_name
 from   ...utils       import create_circle_widget, create_sphere_widget, create_widget, create_cube_widget
 from   ...utils       import MetarigError
+from   ...utils       import register_constraint_template, apply_constraints
+from   ...utils       import get_data_bones, get_edit_bones, get_pose_bones, mode_set
 from   rna_prop_ui    import rna_idprop_ui_prop_get
 from   ..widgets import create_face_widget, create_eye_widget, create_eyes_widget, create_ear_widget, create_jaw_widget, create_teeth_widget
 
@@ -18,13 +20,65 @@ if is_selected(all_controls):
     layout.prop(pose_bones[eyes_ctrl_name], '["%s"]', slider=True)
 """
 
+# Constraint templates of the face bones, applied in bulk by Rig.constraints()
+register_constraint_template( 'def_tweak',
+    { 'constraint' : 'DAMPED_TRACK' },
+    { 'constraint' : 'STRETCH_TO'   } )
+
+register_constraint_template( 'def_lids',
+    { 'constraint' : 'DAMPED_TRACK', 'head_tail' : 1.0 },
+    { 'constraint' : 'STRETCH_TO',   'head_tail' : 1.0 } )
+
+register_constraint_template( 'mch_eyes',
+    { 'constraint' : 'DAMPED_TRACK' } )
+
+register_constraint_template( 'mch_eyes_lids_follow',
+    { 'constraint' : 'COPY_LOCATION', 'head_tail' : 1.0 } )
+
+register_constraint_template( 'mch_eyes_parent',
+    { 'constraint' : 'COPY_TRANSFORMS' } )
+
+register_constraint_template( 'mch_jaw_master',
+    { 'constraint' : 'COPY_TRANSFORMS' } )
+
+register_constraint_template( 'teeth',
+    { 'constraint' : 'COPY_TRANSFORMS' } )
+
+register_constraint_template( 'tweak_copyloc',
+    { 'constraint'   : 'COPY_LOCATION',
+      'use_offset'   : True,
+      'target_space' : 'LOCAL',
+      'owner_space'  : 'LOCAL' } )
+
+register_constraint_template( 'tweak_copy_rot_scl',
+    { 'constraint'   : 'COPY_ROTATION',
+      'use_offset'   : True,
+      'target_space' : 'LOCAL',
+      'owner_space'  : 'LOCAL' },
+    { 'constraint'   : 'COPY_SCALE',
+      'use_offset'   : True,
+      'target_space' : 'LOCAL',
+      'owner_space'  : 'LOCAL' } )
+
+register_constraint_template( 'tweak_copyloc_inv',
+    { 'constraint'   : 'COPY_LOCATION',
+      'target_space' : 'LOCAL',
+      'owner_space'  : 'LOCAL',
+      'use_offset'   : True,
+      'invert_x'     : True,
+      'invert_y'     : True,
+      'invert_z'     : True } )
+
+register_constraint_template( 'mch_tongue_copy_trans',
+    { 'constraint' : 'COPY_TRANSFORMS' } )
+
 
 class Rig:
 
     def __init__(self, obj, bone_name, params):
         self.obj = obj
 
-        b = self.obj.data.bones
+        b = get_data_bones(self.obj)
 
         children = [
             "nose", "lip.T.L", "lip.B.L", "jaw", "ear.L", "ear.R", "lip.T.R",
@@ -46,6 +100,7 @@ class Rig:
         self.org_bones   = [bone_name] + children + grand_children
         self.face_length = obj.data.edit_bones[ self.org_bones[0] ].length
         self.params      = params
+        self.detail_level = params.rigify_detail_level
 
         if params.primary_layers_extra:
             self.primary_layers = list(params.primary_layers)
@@ -59,8 +114,8 @@ class Rig:
 
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Adjust eye bones roll
         eb['ORG-eye.L'].roll = 0.0
@@ -82,8 +137,8 @@ class Rig:
     def create_deformation(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         def_bones = []
         for org in org_bones:
@@ -120,8 +175,8 @@ class Rig:
         org_bones = self.org_bones
 
         ## create control bones
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         eyeL_ctrl_name = strip_org(bones['eyes'][0])
         eyeR_ctrl_name = strip_org(bones['eyes'][1])
@@ -199,7 +254,7 @@ class Rig:
         flip_bone( self.obj, tongue_ctrl_name )
 
         ## Assign widgets
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        mode_set(self.obj, 'OBJECT')
 
         # Assign each eye widgets
         create_eye_widget( self.obj, eyeL_ctrl_name )
@@ -246,8 +301,8 @@ class Rig:
         org_bones = self.org_bones
 
         ## create tweak bones
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         tweaks = []
 
@@ -296,8 +351,8 @@ class Rig:
 
                 tweaks.append( tweak_name )
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         primary_tweaks = [
             "lid.B.L.002", "lid.T.L.002", "lid.B.R.002", "lid.T.R.002",
@@ -367,8 +422,8 @@ class Rig:
 
     def create_mch(self, jaw_ctrl, tongue_ctrl):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create eyes mch bones
         eyes = [ bone for bone in org_bones if 'eye' in bone ]
@@ -462,8 +517,8 @@ class Rig:
 
     def parent_bones(self, all_bones, tweak_unique):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         face_name = [ bone for bone in org_bones if 'face' in bone ].pop()
 
@@ -639,115 +694,9 @@ class Rig:
             eb[ bone                       ].parent = eb[ 'ear.L' ]
             eb[ bone.replace( '.L', '.R' ) ].parent = eb[ 'ear.R' ]
 
-    def make_constraits(self, constraint_type, bone, subtarget, influence = 1):
-        org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='OBJECT')
-        pb = self.obj.pose.bones
-
-        owner_pb = pb[bone]
-
-        if   constraint_type == 'def_tweak':
-
-            const = owner_pb.constraints.new( 'DAMPED_TRACK' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-
-            const = owner_pb.constraints.new( 'STRETCH_TO' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-
-        elif constraint_type == 'def_lids':
-
-            const = owner_pb.constraints.new( 'DAMPED_TRACK' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.head_tail = 1.0
-
-            const = owner_pb.constraints.new( 'STRETCH_TO' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.head_tail = 1.0
-
-        elif constraint_type == 'mch_eyes':
-
-            const = owner_pb.constraints.new( 'DAMPED_TRACK' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-
-        elif constraint_type == 'mch_eyes_lids_follow':
-
-            const = owner_pb.constraints.new( 'COPY_LOCATION' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.head_tail = 1.0
-
-        elif constraint_type == 'mch_eyes_parent':
-
-            const = owner_pb.constraints.new( 'COPY_TRANSFORMS' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-
-        elif constraint_type == 'mch_jaw_master':
-
-            const = owner_pb.constraints.new( 'COPY_TRANSFORMS' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.influence = influence
-
-        elif constraint_type == 'teeth':
-
-            const = owner_pb.constraints.new( 'COPY_TRANSFORMS' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.influence = influence
-
-        elif constraint_type == 'tweak_copyloc':
-
-            const = owner_pb.constraints.new( 'COPY_LOCATION' )
-            const.target       = self.obj
-            const.subtarget    = subtarget
-            const.influence    = influence
-            const.use_offset   = True
-            const.target_space = 'LOCAL'
-            const.owner_space  = 'LOCAL'
-
-        elif constraint_type == 'tweak_copy_rot_scl':
-
-            const = owner_pb.constraints.new( 'COPY_ROTATION' )
-            const.target       = self.obj
-            const.subtarget    = subtarget
-            const.use_offset   = True
-            const.target_space = 'LOCAL'
-            const.owner_space  = 'LOCAL'
-
-            const = owner_pb.constraints.new( 'COPY_SCALE' )
-            const.target       = self.obj
-            const.subtarget    = subtarget
-            const.use_offset   = True
-            const.target_space = 'LOCAL'
-            const.owner_space  = 'LOCAL'
-
-        elif constraint_type == 'tweak_copyloc_inv':
-
-            const = owner_pb.constraints.new( 'COPY_LOCATION' )
-            const.target       = self.obj
-            const.subtarget    = subtarget
-            const.influence    = influence
-            const.target_space = 'LOCAL'
-            const.owner_space  = 'LOCAL'
-            const.use_offset   = True
-            const.invert_x     = True
-            const.invert_y     = True
-            const.invert_z     = True
-
-        elif constraint_type == 'mch_tongue_copy_trans':
-
-            const = owner_pb.constraints.new( 'COPY_TRANSFORMS' )
-            const.target    = self.obj
-            const.subtarget = subtarget
-            const.influence = influence
-
     def constraints( self, all_bones ):
+        rows = []
+
         ## Def bone constraints
 
         def_specials = {
@@ -787,7 +736,7 @@ class Rig:
 
         for bone in [ bone for bone in all_bones['deform']['all'] if 'lid' not in bone ]:
             if bone in list( def_specials.keys() ):
-                self.make_constraits('def_tweak', bone, def_specials[bone] )
+                rows.append( ( bone, 'def_tweak', def_specials[bone] ) )
             else:
                 matches = re.match( pattern, bone ).groups()
                 if len( matches ) > 1 and matches[-1]:
@@ -796,7 +745,7 @@ class Rig:
                     tweak = "".join( str_list )
                 else:
                     tweak = "".join( matches ) + ".001"
-                self.make_constraits('def_tweak', bone, tweak )
+                rows.append( ( bone, 'def_tweak', tweak ) )
 
         def_lids = sorted( [ bone for bone in all_bones['deform']['all'] if 'lid' in bone ] )
         mch_lids = sorted( [ bone for bone in all_bones['mch']['lids'] ] )
@@ -809,43 +758,43 @@ class Rig:
         mch_lidsR = mch_lidsR[1:] + [ mch_lidsR[0] ]
 
         for boneL, boneR, mchL, mchR in zip( def_lidsL, def_lidsR, mch_lidsL, mch_lidsR ):
-            self.make_constraits('def_lids', boneL, mchL )
-            self.make_constraits('def_lids', boneR, mchR )
+            rows.append( ( boneL, 'def_lids', mchL ) )
+            rows.append( ( boneR, 'def_lids', mchR ) )
 
         ## MCH constraints
 
         # mch lids constraints
         for bone in all_bones['mch']['lids']:
             tweak = bone[4:]  # remove "MCH-" from bone name
-            self.make_constraits('mch_eyes', bone, tweak )
+            rows.append( ( bone, 'mch_eyes', tweak ) )
 
         # mch eyes constraints
         for bone in [ 'MCH-eye.L', 'MCH-eye.R' ]:
             ctrl = bone[4:]  # remove "MCH-" from bone name
-            self.make_constraits('mch_eyes', bone, ctrl )
+            rows.append( ( bone, 'mch_eyes', ctrl ) )
 
         for bone in [ 'MCH-eye.L.001', 'MCH-eye.R.001' ]:
             target = bone[:-4] # remove number from the end of the name
-            self.make_constraits('mch_eyes_lids_follow', bone, target )
+            rows.append( ( bone, 'mch_eyes_lids_follow', target ) )
 
         # mch eyes parent constraints
-        self.make_constraits('mch_eyes_parent', 'MCH-eyes_parent', 'ORG-face' )
+        rows.append( ( 'MCH-eyes_parent', 'mch_eyes_parent', 'ORG-face' ) )
 
         ## Jaw constraints
 
         # jaw master mch bones
-        self.make_constraits( 'mch_jaw_master', 'MCH-mouth_lock',     'jaw_master', 0.20  )
-        self.make_constraits( 'mch_jaw_master', 'MCH-jaw_master',     'jaw_master', 1.00  )
-        self.make_constraits( 'mch_jaw_master', 'MCH-jaw_master.001', 'jaw_master', 0.75  )
-        self.make_constraits( 'mch_jaw_master', 'MCH-jaw_master.002', 'jaw_master', 0.35  )
-        self.make_constraits( 'mch_jaw_master', 'MCH-jaw_master.003', 'jaw_master', 0.10  )
-        self.make_constraits( 'mch_jaw_master', 'MCH-jaw_master.004', 'jaw_master', 0.025 )
+        rows.append( ( 'MCH-mouth_lock', 'mch_jaw_master', 'jaw_master', 0.20 ) )
+        rows.append( ( 'MCH-jaw_master', 'mch_jaw_master', 'jaw_master', 1.00 ) )
+        rows.append( ( 'MCH-jaw_master.001', 'mch_jaw_master', 'jaw_master', 0.75 ) )
+        rows.append( ( 'MCH-jaw_master.002', 'mch_jaw_master', 'jaw_master', 0.35 ) )
+        rows.append( ( 'MCH-jaw_master.003', 'mch_jaw_master', 'jaw_master', 0.10 ) )
+        rows.append( ( 'MCH-jaw_master.004', 'mch_jaw_master', 'jaw_master', 0.025 ) )
 
-        self.make_constraits( 'teeth', 'ORG-teeth.T', 'teeth.T', 1.00 )
-        self.make_constraits( 'teeth', 'ORG-teeth.B', 'teeth.B', 1.00 )
+        rows.append( ( 'ORG-teeth.T', 'teeth', 'teeth.T', 1.00 ) )
+        rows.append( ( 'ORG-teeth.B', 'teeth', 'teeth.B', 1.00 ) )
 
         for bone in all_bones['mch']['jaw'][1:-1]:
-            self.make_constraits( 'mch_jaw_master', bone, 'MCH-mouth_lock' )
+            rows.append( ( bone, 'mch_jaw_master', 'MCH-mouth_lock' ) )
 
         ## Tweak bones constraints
 
@@ -877,12 +826,12 @@ class Rig:
             for target, influence in zip( targets, influences ):
 
                 # Left side constraints
-                self.make_constraits( 'tweak_copyloc', owner, target, influence )
+                rows.append( ( owner, 'tweak_copyloc', target, influence ) )
 
                 # create constraints for the right side too
                 ownerR  = owner.replace(  '.L', '.R' )
                 targetR = target.replace( '.L', '.R' )
-                self.make_constraits( 'tweak_copyloc', ownerR, targetR, influence )
+                rows.append( ( ownerR, 'tweak_copyloc', targetR, influence ) )
 
         # copy rotation & scale constraints for tweak bones of both sides
         tweak_copy_rot_scl_L = {
@@ -893,11 +842,11 @@ class Rig:
         for owner in list( tweak_copy_rot_scl_L.keys() ):
             target    = tweak_copy_rot_scl_L[owner]
             influence = tweak_copy_rot_scl_L[owner]
-            self.make_constraits( 'tweak_copy_rot_scl', owner, target )
+            rows.append( ( owner, 'tweak_copy_rot_scl', target ) )
 
             # create constraints for the right side too
             owner = owner.replace( '.L', '.R' )
-            self.make_constraits( 'tweak_copy_rot_scl', owner, target )
+            rows.append( ( owner, 'tweak_copy_rot_scl', target ) )
 
         # inverted tweak bones constraints
         tweak_nose = {
@@ -910,20 +859,27 @@ class Rig:
         for owner in list( tweak_nose.keys() ):
             target    = tweak_nose[owner][0]
             influence = tweak_nose[owner][1]
-            self.make_constraits( 'tweak_copyloc_inv', owner, target, influence )
+            rows.append( ( owner, 'tweak_copyloc_inv', target, influence ) )
+
+        # Low detail faces drop the secondary tweaks following their neighbours,
+        # the tweak bones stay since the deform bones hang from them
+        if self.detail_level == 'LOW':
+            rows = [ row for row in rows if not row[1].startswith( 'tweak_' ) ]
 
         # MCH tongue constraints
         divider = len( all_bones['mch']['tongue'] ) + 1
         factor  = len( all_bones['mch']['tongue'] )
 
         for owner in all_bones['mch']['tongue']:
-            self.make_constraits( 'mch_tongue_copy_trans', owner, 'tongue_master', ( 1 / divider ) * factor )
+            rows.append( ( owner, 'mch_tongue_copy_trans', 'tongue_master', ( 1 / divider ) * factor ) )
             factor -= 1
 
+        apply_constraints( self.obj, rows )
+
     def drivers_and_props( self, all_bones ):
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         jaw_ctrl  = all_bones['ctrls']['jaw'][0]
         eyes_ctrl = all_bones['ctrls']['eyes'][2]
@@ -974,8 +930,8 @@ class Rig:
 
     def create_bones(self):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Clear parents for org bones
         for bone in [ bone for bone in org_bones if 'face' not in bone ]:
@@ -1099,7 +1055,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -1748,7 +1704,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['brow.T.R.002']]
     bones['brow.T.R.003'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['face']]
     pbone.rigify_type = 'faces.super_face'
     pbone.lock_location = (False, False, False)
@@ -2394,7 +2350,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
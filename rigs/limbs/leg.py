@@ -10,6 +10,9 @@ from ...utils import create_circle_widget, create_sphere_widget, create_line_wid
 from ...utils import MetarigError, make_mechanism_name, org
 from ...utils import create_limb_widget, connected_children_names
 from ...utils import align_bone_y_axis, align_bone_x_axis, align_bone_z_axis
+from ...utils import make_driver, make_drivers, prop_variable
+from ...utils import copy_bones, get_chain_segments, set_edit_bone_arrays
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 from rna_prop_ui import rna_idprop_ui_prop_get
 from ..widgets import create_ikarrow_widget
 from math import trunc, pi
@@ -43,6 +46,7 @@ class Rig:
 
         self.segments = params.segments
         self.bbones = params.bbones
+        self.detail_level = params.rigify_detail_level
         self.limb_type = params.limb_type
         self.rot_axis = params.rotation_axis
         self.auto_align_extremity = params.auto_align_extremity
@@ -60,8 +64,8 @@ class Rig:
 
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         thigh = self.org_bones[0]
         org_bones = list(
@@ -118,8 +122,8 @@ class Rig:
 
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         name = get_bone_name( strip_org( org_bones[0] ), 'mch', 'parent' )
 
@@ -150,7 +154,7 @@ class Rig:
         })
 
         # Limb Follow Driver
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
 
         name = 'FK_limb_follow'
 
@@ -183,62 +187,59 @@ class Rig:
     def create_tweak(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         tweaks         = {}
         tweaks['ctrl'] = []
         tweaks['mch' ] = []
 
+        # Low detail limbs have no tweak chain
+        if self.detail_level == 'LOW':
+            return tweaks
+
         # Create and parent mch and ctrl tweaks
-        for i,org in enumerate(org_bones):
-            if i < len(org_bones) - 1:
-                # Create segments if specified
-                for j in range( self.segments ):
-                    # MCH
-                    name = get_bone_name( strip_org(org), 'mch', 'tweak' )
-                    mch = copy_bone( self.obj, org, name )
-
-                    # CTRL
-                    name = get_bone_name( strip_org(org), 'ctrl', 'tweak' )
-                    ctrl = copy_bone( self.obj, org, name )
-
-                    eb[ mch  ].length /= self.segments
-                    eb[ ctrl ].length /= self.segments
-
-                    # If we have more than one segments, place the head of the
-                    # 2nd and onwards at the correct position
-                    if j > 0:
-                        put_bone(self.obj, mch,  eb[ tweaks['mch' ][-1] ].tail)
-                        put_bone(self.obj, ctrl, eb[ tweaks['ctrl'][-1] ].tail)
-
-                    tweaks['ctrl'] += [ ctrl ]
-                    tweaks['mch' ] += [ mch  ]
-
-                    # Parenting the tweak ctrls to mchs
-                    eb[ mch  ].parent = eb[ org ]
-                    eb[ ctrl ].parent = eb[ mch ]
-
-            else: # Last limb bone - is not subdivided
-                name = get_bone_name( strip_org(org), 'mch', 'tweak' )
-                mch = copy_bone( self.obj, org_bones[i-1], name )
-                eb[ mch ].length = eb[org].length / 4
-                put_bone(
-                    self.obj,
-                    mch,
-                    eb[org_bones[i-1]].tail
-                )
-
-                ctrl = get_bone_name( strip_org(org), 'ctrl', 'tweak' )
-                ctrl = copy_bone( self.obj, org, ctrl )
-                eb[ ctrl ].length = eb[org].length / 2
-
-                tweaks['mch']  += [ mch  ]
-                tweaks['ctrl'] += [ ctrl ]
-
-                # Parenting the tweak ctrls to mchs
-                eb[ mch  ].parent = eb[ org ]
-                eb[ ctrl ].parent = eb[ mch ]
+        # Every limb bone but the last is cut into segments, all at once
+        copies = []
+        for org in org_bones[:-1]:
+            for j in range( self.segments ):
+                copies.append( ( org, get_bone_name( strip_org(org), 'mch', 'tweak' ) ) )
+                copies.append( ( org, get_bone_name( strip_org(org), 'ctrl', 'tweak' ) ) )
+
+        heads, tails, rolls = get_chain_segments( self.obj, org_bones[:-1], self.segments )
+        names = copy_bones( self.obj, copies )
+        set_edit_bone_arrays( self.obj, names[0::2], heads, tails, rolls )
+        set_edit_bone_arrays( self.obj, names[1::2], heads, tails, rolls )
+
+        for ( org, name ), mch, ctrl in zip( copies[0::2], names[0::2], names[1::2] ):
+            tweaks['ctrl'] += [ ctrl ]
+            tweaks['mch' ] += [ mch  ]
+
+            # Parenting the tweak ctrls to mchs
+            eb[ mch  ].parent = eb[ org ]
+            eb[ ctrl ].parent = eb[ mch ]
+
+        # Last limb bone - is not subdivided
+        org = org_bones[-1]
+        name = get_bone_name( strip_org(org), 'mch', 'tweak' )
+        mch = copy_bone( self.obj, org_bones[-2], name )
+        eb[ mch ].length = eb[org].length / 4
+        put_bone(
+            self.obj,
+            mch,
+            eb[org_bones[-2]].tail
+        )
+
+        ctrl = get_bone_name( strip_org(org), 'ctrl', 'tweak' )
+        ctrl = copy_bone( self.obj, org, ctrl )
+        eb[ ctrl ].length = eb[org].length / 2
+
+        tweaks['mch']  += [ mch  ]
+        tweaks['ctrl'] += [ ctrl ]
+
+        # Parenting the tweak ctrls to mchs
+        eb[ mch  ].parent = eb[ org ]
+        eb[ ctrl ].parent = eb[ mch ]
 
         # Scale to reduce widget size and maintain conventions!
         for mch, ctrl in zip( tweaks['mch'], tweaks['ctrl'] ):
@@ -286,7 +287,7 @@ class Rig:
                 })
 
         # Ctrl bones Locks and Widgets
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
         for t in tweaks['ctrl']:
             pb[t].lock_rotation = True, False, True
             pb[t].lock_scale    = False, True, False
@@ -301,29 +302,19 @@ class Rig:
     def create_def(self, tweaks):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
-        def_bones = []
-        for i, org in enumerate(org_bones):
-            if i < len(org_bones) - 1:
-                # Create segments if specified
-                for j in range(self.segments):
-                    name = get_bone_name(strip_org(org), 'def')
-                    def_name = copy_bone(self.obj, org, name)
+        # Every limb bone but the last is cut into segments, all at once
+        copies = []
+        for org in org_bones[:-1]:
+            for j in range(self.segments):
+                copies.append((org, get_bone_name(strip_org(org), 'def')))
+        copies.append((org_bones[-1], get_bone_name(strip_org(org_bones[-1]), 'def')))
 
-                    eb[def_name].length /= self.segments
-
-                    # If we have more than one segments, place the 2nd and
-                    # onwards on the tail of the previous bone
-                    if j > 0:
-                        put_bone(self.obj, def_name, eb[ def_bones[-1] ].tail)
-
-                    def_bones += [def_name]
-            else:
-                name = get_bone_name(strip_org(org), 'def')
-                def_name = copy_bone(self.obj, org, name)
-                def_bones.append(def_name)
+        heads, tails, rolls = get_chain_segments(self.obj, org_bones[:-1], self.segments)
+        def_bones = copy_bones(self.obj, copies)
+        set_edit_bone_arrays(self.obj, def_bones[:-1], heads, tails, rolls)
 
         # Parent deform bones
         for i,b in enumerate( def_bones ):
@@ -331,6 +322,13 @@ class Rig:
                 eb[b].parent      = eb[ def_bones[i-1] ] # to previous
                 eb[b].use_connect = True
 
+        # Without tweaks the deform bones ride on their org bones
+        if not tweaks:
+            for ( org, name ), d in zip( copies, def_bones ):
+                eb[d].use_connect = False
+                eb[d].parent      = eb[org]
+            return def_bones
+
         # Constraint def to tweaks
         for d,t in zip(def_bones, tweaks):
             tidx = tweaks.index(t)
@@ -362,7 +360,7 @@ class Rig:
 
 
         # Rubber hose drivers
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
         for i, t in enumerate(tweaks[1:-1]):
             # Create custom property on tweak bone to control rubber hose
             name = 'rubber_tweak'
@@ -406,8 +404,8 @@ class Rig:
     def create_ik(self, parent):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         ctrl = get_bone_name(org_bones[0], 'ctrl', 'ik')
         mch_ik = get_bone_name(org_bones[0], 'mch', 'ik')
@@ -490,7 +488,7 @@ class Rig:
             'subtarget': org_bones[1],
         })
 
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
 
         make_constraint(self, vispole, {
             'constraint': 'STRETCH_TO',
@@ -535,8 +533,8 @@ class Rig:
     def create_fk(self, parent):
         org_bones = self.org_bones.copy()
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         ctrls = []
 
@@ -566,7 +564,7 @@ class Rig:
         })
 
         # Locks and widgets
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
         pb[ctrls[2]].lock_location = True, True, True
 
         create_limb_widget(self.obj, ctrls[0])
@@ -581,8 +579,8 @@ class Rig:
         return {'ctrl': ctrls, 'mch': mch}
 
     def org_parenting_and_switch(self, org_bones, ik, fk, parent):
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
         # re-parent ORGs in a connected chain
         for i, o in enumerate(org_bones):
             if i > 0:
@@ -590,8 +588,8 @@ class Rig:
                 if i <= len(org_bones)-1:
                     eb[o].use_connect = True
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
         pb_parent = pb[parent]
 
         # Create ik/fk switch property
@@ -635,8 +633,8 @@ class Rig:
 
         bones['ik']['ctrl']['terminal'] = []
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create toes def bone
         toes_def = get_bone_name(org_bones[-1], 'def')
@@ -859,7 +857,7 @@ class Rig:
                 'owner_space': 'LOCAL'
             })
 
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
         if self.rot_axis == 'x'or self.rot_axis == 'automatic':
             ik_rot_axis = pb[org_bones[0]].x_axis
         elif self.rot_axis == 'z':
@@ -976,22 +974,8 @@ class Rig:
 
         # Add driver to limit scale constraint influence
         b = bones['ik']['mch_str']
-        drv = pb[b].constraints[-1].driver_add("influence").driver
-        drv.type = 'AVERAGE'
-
-        var = drv.variables.new()
-        var.name = prop.name
-        var.type = "SINGLE_PROP"
-        var.targets[0].id = self.obj
-        var.targets[0].data_path = \
-            pb_parent.path_from_id() + '[' + '"' + prop.name + '"' + ']'
-
-        drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-        drv_modifier.mode = 'POLYNOMIAL'
-        drv_modifier.poly_order = 1
-        drv_modifier.coefficients[0] = 1.0
-        drv_modifier.coefficients[1] = -1.0
+        make_driver(pb[b].constraints[-1], "influence", modifier='invert',
+                    variables=[(prop.name, prop_variable(self.obj, pb_parent.name, prop.name))])
 
         # Create leg widget
         create_foot_widget(self.obj, ctrl, bone_transform_name=None)
@@ -1007,8 +991,8 @@ class Rig:
         # Add ballsocket widget to heel
         create_ballsocket_widget(self.obj, heel, bone_transform_name=None)
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         if len(org_bones) >= 4:
             # Create toes control bone
@@ -1040,7 +1024,7 @@ class Rig:
             })
 
             # Find IK/FK switch property
-            pb = self.obj.pose.bones
+            pb = get_pose_bones(self.obj)
             prop = rna_idprop_ui_prop_get( pb[bones['fk']['ctrl'][-1]], 'IK_FK' )
 
             # Modify rotation mode for ik and tweak controls
@@ -1051,22 +1035,8 @@ class Rig:
 
             # Add driver to limit scale constraint influence
             b = toe_mch
-            drv = pb[b].constraints[-1].driver_add("influence").driver
-            drv.type = 'AVERAGE'
-
-            var = drv.variables.new()
-            var.name = prop.name
-            var.type = "SINGLE_PROP"
-            var.targets[0].id = self.obj
-            var.targets[0].data_path = \
-                pb_parent.path_from_id() + '['+ '"' + prop.name + '"' + ']'
-
-            drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-            drv_modifier.mode = 'POLYNOMIAL'
-            drv_modifier.poly_order = 1
-            drv_modifier.coefficients[0] = 1.0
-            drv_modifier.coefficients[1] = -1.0
+            make_driver(pb[b].constraints[-1], "influence", modifier='invert',
+                        variables=[(prop.name, prop_variable(self.obj, pb_parent.name, prop.name))])
 
             # Create toe circle widget
             create_circle_widget(self.obj, toes, radius=0.4, head_tail=0.5)
@@ -1084,8 +1054,8 @@ class Rig:
 
     def create_drivers(self, bones):
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         ctrl = pb[bones['ik']['mch_foot'][0]]
         ctrl_pole = pb[bones['ik']['mch_foot'][1]]
@@ -1095,8 +1065,11 @@ class Rig:
 
         props = ["IK_follow", "root/parent", "pole_vector", "pole_follow"]
 
+        drivers = []
         for prop in props:
 
+            var = (prop, prop_variable(self.obj, owner.name, prop))
+
             if prop == 'pole_vector':
                 owner[prop] = False
                 pole_prop = rna_idprop_ui_prop_get(owner, prop, create=True)
@@ -1105,84 +1078,15 @@ class Rig:
                 pole_prop["description"] = prop
                 mch_ik = pb[bones['ik']['mch_ik']]
 
-                # ik target hide driver
+                # ik target and vis-pole hide drivers
                 pole_target = pb[bones['ik']['ctrl']['ik_target']]
-                drv = pole_target.bone.driver_add("hide").driver
-                drv.type = 'AVERAGE'
-
-                var = drv.variables.new()
-                var.name = prop
-                var.type = "SINGLE_PROP"
-                var.targets[0].id = self.obj
-                var.targets[0].data_path = \
-                    owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                drv_modifier.mode = 'POLYNOMIAL'
-                drv_modifier.poly_order = 1
-                drv_modifier.coefficients[0] = 1.0
-                drv_modifier.coefficients[1] = -1.0
-
-                # vis-pole hide driver
                 vispole = pb[bones['ik']['visuals']['vispole']]
-                drv = vispole.bone.driver_add("hide").driver
-                drv.type = 'AVERAGE'
-                var = drv.variables.new()
-                var.name = prop
-                var.type = "SINGLE_PROP"
-                var.targets[0].id = self.obj
-                var.targets[0].data_path = \
-                    owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                drv_modifier.mode = 'POLYNOMIAL'
-                drv_modifier.poly_order = 1
-                drv_modifier.coefficients[0] = 1.0
-                drv_modifier.coefficients[1] = -1.0
-
-                # arrow hide driver
-                # pole_target = pb[bones['ik']['ctrl']['limb']]
-                # drv = pole_target.bone.driver_add("hide").driver
-                # drv.type = 'AVERAGE'
-                #
-                # var = drv.variables.new()
-                # var.name = prop
-                # var.type = "SINGLE_PROP"
-                # var.targets[0].id = self.obj
-                # var.targets[0].data_path = \
-                #     owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-                #
-                # drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-                #
-                # drv_modifier.mode = 'POLYNOMIAL'
-                # drv_modifier.poly_order = 1
-                # drv_modifier.coefficients[0] = 0.0
-                # drv_modifier.coefficients[1] = 1.0
+                drivers.append((pole_target.bone, "hide", [var]))
+                drivers.append((vispole.bone, "hide", [var]))
 
                 for cns in mch_ik.constraints:
                     if 'IK' in cns.type:
-                        drv = cns.driver_add("mute").driver
-                        drv.type = 'AVERAGE'
-
-                        var = drv.variables.new()
-                        var.name = prop
-                        var.type = "SINGLE_PROP"
-                        var.targets[0].id = self.obj
-                        var.targets[0].data_path = \
-                            owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                        drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                        drv_modifier.mode = 'POLYNOMIAL'
-                        drv_modifier.poly_order = 1
-                        if not cns.pole_subtarget:
-                            drv_modifier.coefficients[0] = 0.0
-                            drv_modifier.coefficients[1] = 1
-                        else:
-                            drv_modifier.coefficients[0] = 1.0
-                            drv_modifier.coefficients[1] = -1.0
+                        drivers.append((cns, "mute", [var], 'invert' if cns.pole_subtarget else 'identity'))
 
             elif prop == 'IK_follow':
 
@@ -1192,75 +1096,10 @@ class Rig:
                 rna_prop["max"] = True
                 rna_prop["description"] = prop
 
-                drv = ctrl.constraints[0].driver_add("mute").driver
-                drv.type = 'AVERAGE'
-
-                var = drv.variables.new()
-                var.name = prop
-                var.type = "SINGLE_PROP"
-                var.targets[0].id = self.obj
-                var.targets[0].data_path = \
-                    owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                drv_modifier.mode = 'POLYNOMIAL'
-                drv_modifier.poly_order = 1
-                drv_modifier.coefficients[0] = 1.0
-                drv_modifier.coefficients[1] = -1.0
-
-                if len(ctrl.constraints) > 1:
-                    drv = ctrl.constraints[1].driver_add("mute").driver
-                    drv.type = 'AVERAGE'
-
-                    var = drv.variables.new()
-                    var.name = prop
-                    var.type = "SINGLE_PROP"
-                    var.targets[0].id = self.obj
-                    var.targets[0].data_path = \
-                        owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                    drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                    drv_modifier.mode = 'POLYNOMIAL'
-                    drv_modifier.poly_order = 1
-                    drv_modifier.coefficients[0] = 1.0
-                    drv_modifier.coefficients[1] = -1.0
-
-                drv = ctrl_pole.constraints[0].driver_add("mute").driver
-                drv.type = 'AVERAGE'
-
-                var = drv.variables.new()
-                var.name = prop
-                var.type = "SINGLE_PROP"
-                var.targets[0].id = self.obj
-                var.targets[0].data_path = \
-                    owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                drv_modifier.mode = 'POLYNOMIAL'
-                drv_modifier.poly_order = 1
-                drv_modifier.coefficients[0] = 1.0
-                drv_modifier.coefficients[1] = -1.0
-
-                if len(ctrl_pole.constraints) > 1:
-                    drv = ctrl_pole.constraints[1].driver_add("mute").driver
-                    drv.type = 'AVERAGE'
-
-                    var = drv.variables.new()
-                    var.name = prop
-                    var.type = "SINGLE_PROP"
-                    var.targets[0].id = self.obj
-                    var.targets[0].data_path = \
-                        owner.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-                    drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-                    drv_modifier.mode = 'POLYNOMIAL'
-                    drv_modifier.poly_order = 1
-                    drv_modifier.coefficients[0] = 1.0
-                    drv_modifier.coefficients[1] = -1.0
+                for cns in ctrl.constraints[:2]:
+                    drivers.append((cns, "mute", [var], 'invert'))
+                for cns in ctrl_pole.constraints[:2]:
+                    drivers.append((cns, "mute", [var], 'invert'))
 
             elif prop == 'root/parent':
                 if len(ctrl.constraints) > 1:
@@ -1272,15 +1111,8 @@ class Rig:
                     rna_prop["soft_max"] = 1.0
                     rna_prop["description"] = prop
 
-                    drv = ctrl.constraints[1].driver_add("influence").driver
-                    drv.type = 'AVERAGE'
-
-                    var = drv.variables.new()
-                    var.name = prop
-                    var.type = "SINGLE_PROP"
-                    var.targets[0].id = self.obj
-                    var.targets[0].data_path = \
-                        owner.path_from_id() + '[' + '"' + prop + '"' + ']'
+                    # Inverted: at 0 the IK control follows the parent
+                    drivers.append((ctrl.constraints[1], "influence", [var], 'invert'))
 
             elif prop == 'pole_follow':
                 if len(ctrl_pole.constraints) > 1:
@@ -1292,15 +1124,9 @@ class Rig:
                     rna_prop["soft_max"] = 1.0
                     rna_prop["description"] = prop
 
-                    drv = ctrl_pole.constraints[1].driver_add("influence").driver
-                    drv.type = 'AVERAGE'
+                    drivers.append((ctrl_pole.constraints[1], "influence", [var]))
 
-                    var = drv.variables.new()
-                    var.name = prop
-                    var.type = "SINGLE_PROP"
-                    var.targets[0].id = self.obj
-                    var.targets[0].data_path = \
-                        owner.path_from_id() + '[' + '"' + prop + '"' + ']'
+        make_drivers(drivers)
 
     @staticmethod
     def get_future_names(bones):
@@ -1352,8 +1178,8 @@ class Rig:
         return names
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Adjust org-bones rotation
         self.orient_org_bones()
@@ -1518,7 +1344,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -1559,7 +1385,7 @@ def create_sample(obj):
     bones['heel.02.L'] = bone.name
 
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['thigh.L']]
     pbone.rigify_type = 'limbs.super_limb'
     pbone.lock_location = (False, False, False)
@@ -1624,7 +1450,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -3,6 +3,7 @@ import bpy
 from .paw import Rig as pawRig
 from .paw import parameters_ui
 from .paw import add_parameters
+from ...utils import mode_set
 
 IMPLEMENTATION = True   # Include and set True if Rig is just an implementation for a wrapper class
                         # add_parameters and parameters_ui are unused for implementation classes
@@ -16,7 +17,7 @@ class Rig(pawRig):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -133,7 +134,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['r_pinky.001.L']]
     bones['r_pinky.002.L'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['thigh.L']]
     pbone.rigify_type = 'limbs.super_limb'
     pbone.lock_location = (False, False, False)
@@ -279,7 +280,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -1,9 +1,12 @@
 import bpy
-from ...utils import copy_bone
+from ...utils import copy_bone, copy_bones
 from ...utils import strip_org, make_deformer_name, connected_children_names
-from ...utils import make_mechanism_name, put_bone, create_sphere_widget
+from ...utils import make_mechanism_name, create_sphere_widget
 from ...utils import create_widget, create_circle_widget
 from ...utils import MetarigError
+from ...utils import get_edit_bones, get_pose_bones
+from ...utils import get_edit_bone_arrays, set_edit_bone_arrays
+from ...utils import mode_set
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 
@@ -28,7 +31,7 @@ class Rig:
 
     def make_controls(self):
 
-        bpy.ops.object.mode_set(mode ='EDIT')
+        mode_set(self.obj, 'EDIT')
         org_bones = self.org_bones
 
         ctrl_chain = []
@@ -44,7 +47,7 @@ class Rig:
             ctrl_chain.append( ctrl_bone )
 
         # Make widgets
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        mode_set(self.obj, 'OBJECT')
 
         for ctrl in ctrl_chain:
             create_circle_widget(self.obj, ctrl, radius=0.3, head_tail=0.5)
@@ -53,36 +56,29 @@ class Rig:
 
     def make_tweaks(self):
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
         org_bones = self.org_bones
 
-        tweak_chain = []
-        for i in range( len( org_bones ) + 1 ):
-            if i == len( org_bones ):
-                # Make final tweak at the tip of the tentacle
-                name = org_bones[i-1]
-            else:
-                name = org_bones[i]
-
-            tweak_bone = copy_bone(
-                self.obj,
-                name,
-                "tweak_" + strip_org(name)
-            )
-
-            tweak_e = eb[ tweak_bone ]
+        # One tweak per bone, plus a final tweak at the tip of the tentacle
+        sources = org_bones + org_bones[-1:]
+        heads, tails, rolls = get_edit_bone_arrays( self.obj, sources )
 
-            tweak_e.length /= 2 # Set size to half
+        # Set size to half
+        vectors = tails - heads
+        tails   = heads + vectors / 2
 
-            if i == len( org_bones ):
-                # Position final tweak at the tip
-                put_bone( self.obj, tweak_bone, eb[ org_bones[-1]].tail )
+        # Position final tweak at the tip
+        heads[-1] += vectors[-1]
+        tails[-1] += vectors[-1]
 
-            tweak_chain.append( tweak_bone )
+        tweak_chain = copy_bones(
+            self.obj,
+            [ ( name, "tweak_" + strip_org(name) ) for name in sources ]
+        )
+        set_edit_bone_arrays( self.obj, tweak_chain, heads, tails, rolls )
 
         # Make widgets
-        bpy.ops.object.mode_set(mode = 'OBJECT')
+        mode_set(self.obj, 'OBJECT')
 
         for tweak in tweak_chain:
             create_sphere_widget( self.obj, tweak )
@@ -106,28 +102,21 @@ class Rig:
 
     def make_deform(self):
 
-        bpy.ops.object.mode_set(mode ='EDIT')
+        mode_set(self.obj, 'EDIT')
         org_bones = self.org_bones
 
-        def_chain = []
-        for i in range( len( org_bones ) ):
-            name = org_bones[i]
-
-            def_bone  = copy_bone(
-                self.obj,
-                name,
-                make_deformer_name(strip_org(name))
-            )
-
-            def_chain.append( def_bone )
+        def_chain = copy_bones(
+            self.obj,
+            [ ( name, make_deformer_name(strip_org(name)) ) for name in org_bones ]
+        )
 
         return def_chain
 
     def parent_bones(self, all_bones):
 
-        bpy.ops.object.mode_set(mode ='EDIT')
+        mode_set(self.obj, 'EDIT')
         org_bones = self.org_bones
-        eb        = self.obj.data.edit_bones
+        eb        = get_edit_bones(self.obj)
 
         # Parent control bones
         for bone in all_bones['control'][1:]:
@@ -158,9 +147,9 @@ class Rig:
 
     def make_constraints(self, all_bones):
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        mode_set(self.obj, 'OBJECT')
         org_bones = self.org_bones
-        pb        = self.obj.pose.bones
+        pb        = get_pose_bones(self.obj)
 
         # Deform bones' constraints
         ctrls   = all_bones['control']
@@ -195,8 +184,8 @@ class Rig:
                 con.owner_space = 'LOCAL'
 
     def generate(self):
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Clear all initial parenting
         for bone in self.org_bones:
@@ -295,7 +284,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -323,7 +312,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Bone.002']]
     bones['Bone.001'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Bone']]
     pbone.rigify_type = 'limbs.simple_tentacle'
     pbone.lock_location = (False, False, False)
@@ -346,7 +335,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
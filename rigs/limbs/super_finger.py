@@ -4,6 +4,7 @@ from ...utils import copy_bone, flip_bone
 from ...utils import strip_org, make_deformer_name, connected_children_names, make_mechanism_name
 from ...utils import create_circle_widget, create_sphere_widget, create_widget
 from ...utils import MetarigError
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 script = """
@@ -27,8 +28,8 @@ class Rig:
     def generate(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Bone name lists
         ctrl_chain    = []
@@ -137,9 +138,9 @@ class Rig:
 
         ctrl_bone_tip.parent = eb[ctrl_chain[-1]]
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        mode_set(self.obj, 'OBJECT')
 
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
 
         # Setting pose bones locks
         pb_master = pb[master_name]
@@ -321,7 +322,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -354,7 +355,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['f_pinky.02.L']]
     bones['f_pinky.03.L'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['palm.04.L']]
     pbone.rigify_type = ''
     pbone.lock_location = (False, False, False)
@@ -396,7 +397,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -3,6 +3,7 @@ import bpy
 from .arm import Rig as armRig
 from .leg import Rig as legRig
 from .paw import Rig as pawRig
+from ...utils import mode_set
 
 
 class Rig:
@@ -174,7 +175,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -200,7 +201,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['forearm.L']]
     bones['hand.L'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['upper_arm.L']]
     pbone.rigify_type = 'limbs.super_limb'
     pbone.lock_location = (False, False, False)
@@ -267,7 +268,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -27,6 +27,7 @@ from ...utils import MetarigError
 from ...utils import copy_bone
 from ...utils import strip_org, deformer
 from ...utils import create_widget
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 
 def bone_siblings(obj, bone):
@@ -89,7 +90,7 @@ class Rig:
             The main armature should be selected and active before this is called.
 
         """
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
         # Figure out the name for the control bone (remove the last .##)
         last_bone = self.org_bones[-1:][0]
@@ -105,7 +106,7 @@ class Rig:
             def_bones += [b]
 
         # Parenting
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         # turn off inherit scale for all ORG-bones to prevent undesired transformations
 
@@ -132,8 +133,8 @@ class Rig:
         eb[ctrl].parent = eb[parent_to]
 
         # Constraints
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         i = 0
         div = len(self.org_bones) - 1
@@ -238,7 +239,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -278,7 +279,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['palm.parent']]
     bones['palm.01'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['palm.parent']]
     pbone.rigify_type = ''
     pbone.lock_location = (False, False, False)
@@ -315,7 +316,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'YXZ'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -10,14 +10,14 @@ pole = '%s'
 # IK/FK Switch on all Control Bones
 if is_selected( controls ):
     layout.prop( pose_bones[parent], '["%s"]', slider = True )
-    props = layout.operator("pose.rigify_arm_fk2ik_" + rig_id, text="Snap FK->IK (" + fk_ctrl + ")")
+    props = layout.operator("pose.rigify_arm_fk2ik", text="Snap FK->IK (" + fk_ctrl + ")")
     props.uarm_fk = controls[1]
     props.farm_fk = controls[2]
     props.hand_fk = controls[3]
     props.uarm_ik = controls[0]
     props.farm_ik = ik_ctrl[1]
     props.hand_ik = controls[4]
-    props = layout.operator("pose.rigify_arm_ik2fk_" + rig_id, text="Snap IK->FK (" + fk_ctrl + ")")
+    props = layout.operator("pose.rigify_arm_ik2fk", text="Snap IK->FK (" + fk_ctrl + ")")
     props.uarm_fk = controls[1]
     props.farm_fk = controls[2]
     props.hand_fk = controls[3]
@@ -60,7 +60,7 @@ pole = '%s'
 # IK/FK Switch on all Control Bones
 if is_selected( controls ):
     layout.prop( pose_bones[parent], '["%s"]', slider = True )
-    props = layout.operator("pose.rigify_leg_fk2ik_" + rig_id, text="Snap FK->IK (" + fk_ctrl + ")")
+    props = layout.operator("pose.rigify_leg_fk2ik", text="Snap FK->IK (" + fk_ctrl + ")")
     props.thigh_fk = controls[1]
     props.shin_fk  = controls[2]
     props.foot_fk  = controls[3]
@@ -69,7 +69,7 @@ if is_selected( controls ):
     props.shin_ik  = ik_ctrl[1]
     props.foot_ik = ik_ctrl[2]
     props.mfoot_ik = ik_ctrl[2]
-    props = layout.operator("pose.rigify_leg_ik2fk_" + rig_id, text="Snap IK->FK (" + fk_ctrl + ")")
+    props = layout.operator("pose.rigify_leg_ik2fk", text="Snap IK->FK (" + fk_ctrl + ")")
     props.thigh_fk  = controls[1]
     props.shin_fk   = controls[2]
     props.foot_fk  = controls[3]
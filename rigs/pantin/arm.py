@@ -24,6 +24,7 @@ from ...utils import make_deformer_name, strip_org
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
 from ...utils import get_layers
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 from . import limb_common
@@ -96,10 +97,10 @@ class Rig:
                 elimb_ik, elimb_str) = (ik_limb.generate())
             (ulimb_fk, flimb_fk, elimb_fk) = (fk_limb.generate())
 
-            bpy.ops.object.mode_set(mode='EDIT')
+            mode_set(self.obj, 'EDIT')
 
             # Def bones
-            eb = self.obj.data.edit_bones
+            eb = get_edit_bones(self.obj)
             if s == '.L':
                 Z_index = -self.params.Z_index
             else:
@@ -129,8 +130,8 @@ class Rig:
                     eb[b].layers = get_layers(active_layer
                                               + self.params.fk_offset)
 
-            bpy.ops.object.mode_set(mode='OBJECT')
-            pb = self.obj.pose.bones
+            mode_set(self.obj, 'OBJECT')
+            pb = get_pose_bones(self.obj)
 
             # Widgets
             # IK
@@ -258,7 +259,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -284,7 +285,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Forearm']]
     bones['Hand'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Arm']]
     pbone.rigify_type = 'pantin.arm'
     pbone.lock_location = (False, False, True)
@@ -330,7 +331,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'XZY'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -25,6 +25,7 @@ from ...utils import make_deformer_name, make_mechanism_name, strip_org
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
 from ...utils import align_bone_z_axis
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -34,7 +35,7 @@ class Rig:
         self.obj = obj
         self.params = params
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         self.org_bone = bone_name
         if eb[bone_name].parent is not None:
@@ -50,8 +51,8 @@ class Rig:
     def generate(self):
         if self.params.use_parent_Z_index and self.org_parent is not None:
             # Get parent's Z indices
-            bpy.ops.object.mode_set(mode='OBJECT')
-            pb = self.obj.pose.bones
+            mode_set(self.obj, 'OBJECT')
+            pb = get_pose_bones(self.obj)
             def_parent_name = make_deformer_name(strip_org(self.org_parent))
             if (self.params.object_side != ".C" and
                     def_parent_name[-2:] not in ['.L', '.R']):
@@ -71,12 +72,12 @@ class Rig:
                         bone_Z_index = b['bone_index']
             bone_Z_index += 1
 
-            bpy.ops.object.mode_set(mode='EDIT')
+            mode_set(self.obj, 'EDIT')
         else:
             member_Z_index = self.params.member_Z_index
             bone_Z_index = self.params.first_bone_Z_index
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         ctrl_chain = []
         # mch_chain = []
@@ -127,8 +128,8 @@ class Rig:
                 0.0,
                 b)
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Widgets
         pantin_utils.create_capsule_widget(
@@ -209,7 +210,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -221,7 +222,7 @@ def create_sample(obj):
     bone.use_connect = False
     bones['Eyes'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Eyes']]
     pbone.rigify_type = 'pantin.eyes'
     pbone.lock_location = (False, False, True)
@@ -238,7 +239,7 @@ def create_sample(obj):
     except AttributeError:
         pass
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -20,8 +20,10 @@ import bpy
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 from ...utils import make_mechanism_name, make_deformer_name, strip_org
+from ...utils import rename_bone
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -46,13 +48,13 @@ class Rig:
         self.org_bones = [self.neck, self.head]
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
         ui_script = ""
 
         ctrl_chain = []
         follow_chain = []
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
         for i, b in enumerate(self.org_bones):
 
             target = eb[b].parent_recursive[-1].name
@@ -64,7 +66,7 @@ class Rig:
             # Add to list
             ctrl_chain += [ctrl_bone]
 
-            eb[ctrl_bone].name = ctrl_bone
+            ctrl_bone = rename_bone(self.obj, ctrl_bone, ctrl_bone)
 
             # Def bones
             def_bone = pantin_utils.create_deformation(
@@ -78,8 +80,8 @@ class Rig:
         if self.params.detach:
             eb[self.head].use_connect = False
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Widgets
         global_scale = self.obj.dimensions[2]
@@ -143,7 +145,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -176,7 +178,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Head']]
     bones['Eyelid'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Neck']]
     pbone.rigify_type = 'pantin.head'
     pbone.lock_location = (True, True, True)
@@ -214,7 +216,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'XZY'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -28,6 +28,7 @@ from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
 from ...utils import align_bone_x_axis
 from ...utils import get_layers
+from ...utils import get_data_bones, get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 from . import limb_common
@@ -62,7 +63,7 @@ class Rig:
     def __init__(self, obj, bone_name, params):
         self.obj = obj
 
-        bones = obj.data.bones
+        bones = get_data_bones(obj)
         leg = bone_name
         shin = bones[leg].children[0].name
         for b in bones[shin].children:
@@ -119,8 +120,8 @@ class Rig:
 
             ulimb_fk, flimb_fk, elimb_fk = fk_limb.generate()
 
-            bpy.ops.object.mode_set(mode='EDIT')
-            eb = self.obj.data.edit_bones
+            mode_set(self.obj, 'EDIT')
+            eb = get_edit_bones(self.obj)
 
             # Foot rig
             foot_fr = copy_bone(
@@ -248,8 +249,8 @@ class Rig:
                     eb[b].layers = get_layers(active_layer
                                               + self.params.fk_offset)
 
-            bpy.ops.object.mode_set(mode='OBJECT')
-            pb = self.obj.pose.bones
+            mode_set(self.obj, 'OBJECT')
+            pb = get_pose_bones(self.obj)
 
             # Bone settings
             pb[roll_fr].rotation_mode = 'XZY'
@@ -555,7 +556,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -595,7 +596,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Foot']]
     bones['Toe'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Thigh']]
     pbone.rigify_type = 'pantin.leg'
     pbone.lock_location = (False, False, True)
@@ -644,7 +645,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'XZY'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -26,6 +26,7 @@ from ...utils import copy_bone, new_bone, put_bone
 from ...utils import make_mechanism_name, make_deformer_name, strip_org
 from ...utils import connected_children_names, has_connected_children
 from ...utils import align_bone_x_axis
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -34,8 +35,8 @@ importlib.reload(pantin_utils)
 
 def create_side_org_bones(obj, org_bones, duplicate, side_suffix):
     """Copy originals with side suffix"""
-    bpy.ops.object.mode_set(mode='EDIT')
-    eb = obj.data.edit_bones
+    mode_set(obj, 'EDIT')
+    eb = get_edit_bones(obj)
 
     side_org_bones = []
     if duplicate:
@@ -82,9 +83,9 @@ class IKLimb:
         self.pelvis_name = pelvis_name
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         # Create the control bones
         ulimb_ik = copy_bone(
@@ -220,8 +221,8 @@ class IKLimb:
         # Layers
         joint_str_e.layers = elimb_str_e.layers
         # Object mode, get pose bones
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         ulimb_ik_p = pb[ulimb_ik]
         flimb_ik_p = pb[flimb_ik]
@@ -374,9 +375,9 @@ class FKLimb:
         self.pelvis_name = pelvis_name
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         # Create the control bones
 
@@ -425,8 +426,8 @@ class FKLimb:
         elimb_fk_e.parent = flimb_fk_e
 
         # Object mode, get pose bones
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         ulimb_fk_p = pb[ulimb_fk]
         flimb_fk_p = pb[flimb_fk]
@@ -24,6 +24,7 @@ from ...utils import make_mechanism_name, make_deformer_name, strip_org
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
 from ...utils import align_bone_x_axis
+from ...utils import get_data_bones, get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -33,7 +34,7 @@ class Rig:
         self.obj = obj
         self.params = params
 
-        bones = obj.data.bones
+        bones = get_data_bones(obj)
         self.mouth = bone_name
         self.ur, self.uc, self.ul = (
             b.name for b in bones[self.mouth].children_recursive[:3])
@@ -53,11 +54,11 @@ class Rig:
             self.org_parent = self.obj.data.bones[bone_name].parent.name
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
         ctrl_chain = []
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         # Control bones
         # Global control
@@ -98,16 +99,16 @@ class Rig:
             eb[b].parent = eb[self.mouth]
             ctrl_chain.append(b)
             
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
         for b in [ctrl_r, ctrl_uc, ctrl_lc, ctrl_l]:
             pb[b].lock_location = (False, False, True)
             pb[b].lock_rotation = (True, True, False)
             pb[b].lock_rotation_w = False
             pb[b].lock_scale = (False, False, False)
             pb[b].rotation_mode = 'XZY'
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Stretch
         # RIGHT
@@ -169,8 +170,8 @@ class Rig:
                     member_index=Z_index,
                     bone_index=i+1, new_name=strip_org(self.org_bones[0])+'_int')
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Widgets
         wgt_radius = pb[ctrl_uc].length / 3
@@ -231,7 +232,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -285,7 +286,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Mouth_lower']]
     bones['Mouth_lower.L'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Mouth']]
     pbone.rigify_type = 'pantin.mouth'
     pbone.lock_location = (False, False, True)
@@ -336,7 +337,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'XZY'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -23,10 +23,11 @@ from math import pi, cos, sin
 import re
 
 from ...utils import make_deformer_name, make_mechanism_name
-from ...utils import strip_org, copy_bone
+from ...utils import strip_org, copy_bone, rename_bone
 from ...utils import create_widget
 from ...utils import create_circle_polygon
 from ...utils import align_bone_z_axis
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 
 def strip_numbers(name):
@@ -62,6 +63,30 @@ def layers_to_index(layers):
         if l:
             return i
 
+# Members are a group of bones moving together (eg. Hand, Forearm, Arm)
+# Bones are individual pieces inside this group
+# They can have an extra offset, per bone (eg. eyelid hiding behind the head)
+MEMBER_OFFSET = 0.01
+BONE_OFFSET = 0.001
+
+
+def z_index_expression(flip_switch):
+    """Return the driver expression of a deformation bone's z offset.
+    Plain arithmetic on the driver variables, so no Python function
+    has to be looked up in the driver namespace.
+    flip is 0 or 1: (1 - 2 * flip) turns it into a sign."""
+    offset = ('bone_index * {} + extra_offset * {}'
+              .format(BONE_OFFSET, MEMBER_OFFSET))
+    if flip_switch:
+        # This bone changes sides when the rig is flipped (eg. limbs)
+        return 'member_index * {} + (1 - 2 * flip) * ({})'.format(
+            MEMBER_OFFSET, offset)
+    else:
+        # This bone does not change sides when the rig is flipped (eg. head)
+        return '(1 - 2 * flip) * (member_index * {} + {})'.format(
+            MEMBER_OFFSET, offset)
+
+
 def create_deformation(obj,
                        bone_name,
                        flip_switch,
@@ -69,8 +94,8 @@ def create_deformation(obj,
                        bone_index=0,
                        extra_offset=0.0,
                        new_name=''):
-    bpy.ops.object.mode_set(mode='EDIT')
-    eb = obj.data.edit_bones
+    mode_set(obj, 'EDIT')
+    eb = get_edit_bones(obj)
 
     org_bone_e = eb[bone_name]
     def_bone_e = eb.new(bone_name)
@@ -81,7 +106,7 @@ def create_deformation(obj,
     if new_name == '':
         new_name = bone_name
     def_name = make_deformer_name(strip_org(new_name))
-    def_bone_e.name = def_name
+    def_name = rename_bone(obj, def_bone_e.name, def_name)
 #    def_bone_e.name = strip_org(bone_name)
 
     def_bone_e.parent = org_bone_e
@@ -92,7 +117,7 @@ def create_deformation(obj,
     align_bone_z_axis(obj, def_name, Vector((0, -1, 0)))
     # def_bone_e.tail.z += org_bone_e.length * 0.5
 
-    bpy.ops.object.mode_set(mode='POSE')
+    mode_set(obj, 'POSE')
 
     def_bone_p = obj.pose.bones[def_name]
     def_bone_p['member_index'] = member_index
@@ -101,14 +126,7 @@ def create_deformation(obj,
 
     # Driver
     driver = obj.driver_add('pose.bones["{}"].location'.format(def_name), 2)
-    if flip_switch:
-        driver.driver.expression = (
-            'z_index(member_index, flip, bone_index, extra_offset)'
-        )
-    else:
-        driver.driver.expression = (
-            'z_index_same(member_index, flip, bone_index, extra_offset)'
-        )
+    driver.driver.expression = z_index_expression(flip_switch)
     var_mi = driver.driver.variables.new()
     var_bi = driver.driver.variables.new()
     var_flip = driver.driver.variables.new()
@@ -144,7 +162,7 @@ def create_deformation(obj,
     var_flip.targets[0].id = obj
     var_flip.targets[0].data_path = 'pose.bones["root"]["flip"]'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     return def_name
 
 
@@ -189,7 +207,7 @@ def create_deformation(obj,
 
 
 def make_follow(obj, b, target, ctrl_name=None, follow_name=None):
-    eb = obj.data.edit_bones
+    eb = get_edit_bones(obj)
 
     # Control bone
     if ctrl_name is None:
@@ -214,8 +232,8 @@ def make_follow(obj, b, target, ctrl_name=None, follow_name=None):
     eb[ctrl_bone].use_connect = False
     eb[ctrl_bone].parent = eb[follow_bone]
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-    pb = obj.pose.bones
+    mode_set(obj, 'OBJECT')
+    pb = get_pose_bones(obj)
 
     # Set up custom properties
     prop = rna_idprop_ui_prop_get(pb[ctrl_bone], "follow", create=True)
@@ -259,7 +277,7 @@ def make_follow(obj, b, target, ctrl_name=None, follow_name=None):
         var_pf.targets[0].id_type = 'OBJECT'
         var_pf.targets[0].id = obj
         var_pf.targets[0].data_path = pb[ctrl_bone].path_from_id() + '["follow"]'
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(obj, 'EDIT')
 
     return ctrl_bone, follow_bone
 
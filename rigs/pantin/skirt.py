@@ -23,6 +23,7 @@ from ...utils import copy_bone
 from ...utils import make_mechanism_name, make_deformer_name, strip_org
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -36,9 +37,9 @@ class Rig:
         self.org_bone = bone_name
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         trackers = []
         flaps = []
@@ -85,8 +86,8 @@ class Rig:
             eb[flap_b].parent = eb[flap_mch_b]
             eb[flap_b].use_connect = False
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Constraints
 
@@ -213,7 +214,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -225,7 +226,7 @@ def create_sample(obj):
     bone.use_connect = False
     bones['Skirt'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Skirt']]
     pbone.rigify_type = 'pantin.skirt'
     pbone.lock_location = (False, False, True)
@@ -238,7 +239,7 @@ def create_sample(obj):
     except AttributeError:
         pass
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -21,11 +21,12 @@ from rna_prop_ui import rna_idprop_ui_prop_get
 from mathutils import Vector
 import importlib
 
-from ...utils import new_bone, copy_bone
+from ...utils import new_bone, copy_bone, rename_bone
 from ...utils import make_deformer_name, make_mechanism_name,  strip_org
 from ...utils import create_bone_widget, create_widget, create_cube_widget
 from ...utils import connected_children_names, has_connected_children
 from ...utils import align_bone_x_axis, align_bone_z_axis
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 
 from . import pantin_utils
 
@@ -39,9 +40,9 @@ class Rig:
         self.params = params
 
     def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+        mode_set(self.obj, 'EDIT')
 
-        eb = self.obj.data.edit_bones
+        eb = get_edit_bones(self.obj)
 
         pelvis = self.org_bones[0]
         pelvis_e = eb[pelvis]
@@ -76,7 +77,7 @@ class Rig:
             ctrl_bone_e = eb[ctrl_bone]
 
             # Name
-            ctrl_bone_e.name = ctrl_bone = strip_org(b)
+            ctrl_bone = rename_bone(self.obj, ctrl_bone, strip_org(b))
 
             # Parenting
             if i == 0:
@@ -119,8 +120,8 @@ class Rig:
         pelvis_e.use_connect = False
         # pelvis_e.parent = flip_e
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # # Pose bone settings
         # flip_p = pb[flip]
@@ -228,7 +229,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -261,7 +262,7 @@ def create_sample(obj):
     bone.parent = arm.edit_bones[bones['Thorax']]
     bones['Chest'] = bone.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['Pelvis']]
     pbone.rigify_type = 'pantin.torso'
     pbone.lock_location = (False, False, True)
@@ -303,7 +304,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'XZY'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
@@ -5,6 +5,8 @@ from ...utils import strip_org, make_deformer_name, connected_children_names
 from ...utils import create_circle_widget, create_sphere_widget, create_neck_bend_widget, create_neck_tweak_widget
 from ..widgets import create_ballsocket_widget
 from ...utils import MetarigError, make_mechanism_name, create_cube_widget
+from ...utils import apply_constraints, make_drivers, prop_variable
+from ...utils import get_edit_bones, get_pose_bones, mode_set
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 script = """
@@ -26,7 +28,7 @@ class Rig:
     def __init__(self, obj, bone_name, params):
         """ Initialize torso rig and key rig properties """
 
-        eb = obj.data.edit_bones
+        eb = get_edit_bones(obj)
 
         self.obj = obj
         self.org_bones = [bone_name] + connected_children_names(obj, bone_name)
@@ -104,7 +106,7 @@ class Rig:
                 lower_torso_bones = self.org_bones[:pivot_index ]
 
             torso_bones = upper_torso_bones + lower_torso_bones
-            eb = self.obj.data.edit_bones
+            eb = get_edit_bones(self.obj)
             self.spine_length = sum([eb[b].length for b in torso_bones])
 
             return {
@@ -135,8 +137,8 @@ class Rig:
         org_bones = self.org_bones
         pivot_name = org_bones[pivot-1]
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create torso control bone
         torso_name = 'torso'
@@ -171,8 +173,8 @@ class Rig:
     def create_deform(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         def_bones = []
         for org_b in org_bones:
@@ -185,8 +187,8 @@ class Rig:
     def create_neck(self, neck_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         if not self.use_head:
             return {
@@ -284,8 +286,8 @@ class Rig:
     def create_chest(self, chest_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # get total spine length
 
@@ -323,8 +325,8 @@ class Rig:
     def create_hips(self, hip_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Create hips control bone
         hips = copy_bone(self.obj, org(hip_bones[-1]), 'hips')
@@ -365,8 +367,8 @@ class Rig:
         }
 
     def create_tail(self, tail_bones):
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
         org_bones = self.org_bones
 
         ctrl_chain = []
@@ -432,8 +434,8 @@ class Rig:
 
     def parent_bones(self, bones):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Parent deform bones
         for i, b in enumerate(bones['def']):
@@ -564,17 +566,7 @@ class Rig:
             eb[org_bones[-1]].parent = eb[bones['neck']['ctrl']]
 
     def make_constraint(self, bone, constraint):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
-
-        owner_pb = pb[bone]
-        const = owner_pb.constraints.new(constraint['constraint'])
-        const.target = self.obj
-
-        # filter contraint props to those that actually exist in the currnet
-        # type of constraint, then assign values to each
-        for p in [k for k in constraint.keys() if k in dir(const)]:
-            setattr(const, p, constraint[p])
+        apply_constraints(self.obj, [(bone, constraint)])
 
     def constrain_bones(self, bones):
         # MCH bones
@@ -725,7 +717,7 @@ class Rig:
                     'subtarget': tweaks[tidx + 1],
                 })
 
-        pb = self.obj.pose.bones
+        pb = get_pose_bones(self.obj)
 
         if bones['neck']['neck_bend']:
             pb[bones['neck']['neck_bend']].rotation_mode = 'ZXY'
@@ -750,8 +742,8 @@ class Rig:
                 pb[b].ik_stretch = 0.1
 
     def create_drivers(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # Setting the torso's props
         torso = pb[bones['pivot']['ctrl']]
@@ -783,28 +775,14 @@ class Rig:
             prop["description"] = prop
 
         # driving the follow rotation switches for neck and head
-        for bone, prop, in zip(owners, props):
-            # Add driver to copy rotation constraint
-            drv = pb[bone].constraints[0].driver_add("influence").driver
-            drv.type = 'AVERAGE'
-
-            var = drv.variables.new()
-            var.name = prop
-            var.type = "SINGLE_PROP"
-            var.targets[0].id = self.obj
-            var.targets[0].data_path = \
-                torso.path_from_id() + '[' + '"' + prop + '"' + ']'
-
-            drv_modifier = self.obj.animation_data.drivers[-1].modifiers[0]
-
-            drv_modifier.mode = 'POLYNOMIAL'
-            drv_modifier.poly_order = 1
-            drv_modifier.coefficients[0] = 1.0
-            drv_modifier.coefficients[1] = -1.0
+        make_drivers([
+            (pb[bone].constraints[0], "influence", [(prop, prop_variable(self.obj, torso.name, prop))], 'invert')
+            for bone, prop in zip(owners, props)
+        ])
 
     def locks_and_widgets(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        pb = self.obj.pose.bones
+        mode_set(self.obj, 'OBJECT')
+        pb = get_pose_bones(self.obj)
 
         # deform bones bbone segements
         for bone in bones['def'][:-1]:
@@ -953,8 +931,8 @@ class Rig:
 
         bone_chains = self.build_bone_structure()
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        eb = self.obj.data.edit_bones
+        mode_set(self.obj, 'EDIT')
+        eb = get_edit_bones(self.obj)
 
         # Clear parents for org bones
         for bone in self.org_bones:
@@ -982,8 +960,8 @@ class Rig:
                 bones['tail'] = self.create_tail(tail_bones)
 
             # TEST
-            bpy.ops.object.mode_set(mode='EDIT')
-            eb = self.obj.data.edit_bones
+            mode_set(self.obj, 'EDIT')
+            eb = get_edit_bones(self.obj)
 
             self.parent_bones(bones)
             self.constrain_bones(bones)
@@ -1139,7 +1117,7 @@ def parameters_ui(layout, params):
 
 def create_sample(obj):
     # generated by rigify.utils.write_metarig
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     arm = obj.data
 
     bones = {}
@@ -1200,7 +1178,7 @@ def create_sample(obj):
     bones['spine.006'] = bone.name
 
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    mode_set(obj, 'OBJECT')
     pbone = obj.pose.bones[bones['spine']]
     pbone.rigify_type = 'spines.super_spine'
     pbone.lock_location = (False, False, False)
@@ -1260,7 +1238,7 @@ def create_sample(obj):
     pbone.lock_scale = (False, False, False)
     pbone.rotation_mode = 'QUATERNION'
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    mode_set(obj, 'EDIT')
     for bone in arm.edit_bones:
         bone.select = False
         bone.select_head = False
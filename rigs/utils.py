@@ -1,10 +1,29 @@
 from .limbs.super_limb import Rig as LimbRig
-from ..utils import connected_children_names
+from ..utils import connected_children_names, BBONE_DRIVER_PATH, ORG_PREFIX
+from ..report import get_bone_owners, driver_bone_name
 import re
 
 
-def get_limb_generated_names(rig):
+LIMB_REGISTRY = "rigify_limbs"  # Armature custom property holding the limb registry
+LIGHT_TIERS = "rigify_light_tiers"  # Armature custom property: what the light evaluation mode mutes
+
+# Secondary evaluation tiers: (name, bone name pattern, rigify_type pattern of the owner rig).
+# The constraints and drivers of the matching bones are muted in light evaluation mode:
+# the tweak interpolation of the chains, and the face tweaks following their neighbours.
+LIGHT_TIER_BONES = (
+    ('tweak', r'tweak', None),
+    ('face', r'^(?!ORG-|MCH-|DEF-)', r'^faces\.'),
+)
+
+# Bones the primary controls work through, never muted: the limb IK stretch
+# bones and the eye, lid, jaw and tongue mechanism of the face
+LIGHT_EXCLUDED_BONES = r'_ik_stretch|^MCH-(eyes?[._]|lid\.|mouth_lock|jaw_master|tongue)'
 
+
+def scan_limb_generated_names(rig):
+    """ Derives the generated names of every super_limb in the rig
+        by walking all its pose bones.
+    """
     pbones = rig.pose.bones
     names = dict()
 
@@ -16,6 +35,114 @@ def get_limb_generated_names(rig):
             for child in children:
                 if re.match('^ORG', child) or re.match('^MCH', child):
                     super_limb_orgs.append(pbones[child])
-            names[b.name] = LimbRig.get_future_names(super_limb_orgs)
+            limb_names = LimbRig.get_future_names(super_limb_orgs)
+            if limb_names:
+                names[b.name] = limb_names
 
     return names
+
+
+def write_limb_registry(rig):
+    """ Stores the limb names in the armature data so the animation tools
+        don't have to scan the rig again. Called at generation time.
+    """
+    rig.data[LIMB_REGISTRY] = scan_limb_generated_names(rig)
+
+
+def get_limb_generated_names(rig):
+    """ Returns {limb org bone: limb names} for every super_limb in the rig,
+        from the registry written at generation time if there is one.
+        The returned dict is a fresh copy the caller can modify.
+    """
+    registry = rig.data.get(LIMB_REGISTRY)
+    if registry is None:
+        return scan_limb_generated_names(rig)
+
+    return registry.to_dict()
+
+
+def get_limb_bone_map(names):
+    """ Maps every bone name used by the limbs in names (as returned by
+        get_limb_generated_names) to the key of its limb.
+    """
+    bone_map = dict()
+    for group, limb in names.items():
+        for key, value in limb.items():
+            if key == 'limb_type':
+                continue
+            if isinstance(value, str):
+                bone_map.setdefault(value, group)
+            elif key in ('controls', 'ik_ctrl'):
+                for name in value:
+                    bone_map.setdefault(name, group)
+    return bone_map
+
+
+def get_owner(owners, pbone):
+    """ Returns the metarig bone owning pbone in owners (as returned by
+        get_bone_owners), or the owner of its closest owned parent for
+        bones missing from the registry. Empty if there is none.
+    """
+    while pbone and pbone.name not in owners:
+        pbone = pbone.parent
+    return owners[pbone.name] if pbone else ''
+
+
+def get_light_tiers(rig):
+    """ Sorts the constraints and drivers of secondary bones into the
+        light evaluation tiers, and lists the B-Bones with segments.
+    """
+    owners = get_bone_owners(rig)
+    pbones = rig.pose.bones
+    tiers = {name: {'constraints': [], 'drivers': []} for name, b, t in LIGHT_TIER_BONES}
+    tiers['bbone'] = {'constraints': [], 'drivers': []}
+    tier_bones = dict()
+
+    # B-Bone handles only shape the curve of the bones using them
+    for pbone in pbones:
+        for attr in ('bbone_custom_handle_start', 'bbone_custom_handle_end'):
+            handle = getattr(pbone, attr, None)
+            if handle is None or re.search(LIGHT_EXCLUDED_BONES, handle.name):
+                continue
+            if pbone.bone.bbone_segments > 1:
+                tier_bones.setdefault(handle.name, 'bbone')
+
+    for pbone in pbones:
+        if pbone.name in tier_bones or re.search(LIGHT_EXCLUDED_BONES, pbone.name):
+            continue
+        org = pbones.get(ORG_PREFIX + get_owner(owners, pbone))
+        for name, bone_pattern, type_pattern in LIGHT_TIER_BONES:
+            if not re.search(bone_pattern, pbone.name):
+                continue
+            if type_pattern and not (org and re.match(type_pattern, org.rigify_type)):
+                continue
+            tier_bones[pbone.name] = name
+            break
+
+    for bone_name, tier in tier_bones.items():
+        for con in pbones[bone_name].constraints:
+            if not con.mute:
+                tiers[tier]['constraints'].append([bone_name, con.name])
+
+    for source, anim in (('OBJECT', rig.animation_data), ('DATA', rig.data.animation_data)):
+        if anim is None:
+            continue
+        for fcu in anim.drivers:
+            if fcu.mute:
+                continue
+            if BBONE_DRIVER_PATH.match(fcu.data_path):
+                tier = 'bbone'
+            else:
+                tier = tier_bones.get(driver_bone_name(fcu.data_path))
+            if tier is not None:
+                tiers[tier]['drivers'].append([source, fcu.data_path, fcu.array_index])
+
+    bbones = [bone.name for bone in rig.data.bones if bone.bbone_segments > 1]
+    return {'tiers': tiers, 'bbone_segments': bbones}
+
+
+def write_light_tiers(rig):
+    """ Stores the light evaluation tiers in the armature data, for the
+        light evaluation toggle of the rig UI. Called at generation time.
+    """
+    rig.data[LIGHT_TIERS] = get_light_tiers(rig)
@@ -38,182 +38,259 @@ blender.stackexchange.com/questions/40711/how-to-convert-quaternions-keyframes-t
 #     "category": "Animation"}
 
 import bpy
+import re
+import numpy as np
+
+from .utils import get_keyframe_arrays, sample_fcurve
 
 order_list = ['QUATERNION', 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX']
 
+# Axis permutation and parity of each euler order, as in Blender's eulO functions
+euler_orders = {'XYZ': ((0, 1, 2), False),
+                'XZY': ((0, 2, 1), True),
+                'YXZ': ((1, 0, 2), True),
+                'YZX': ((1, 2, 0), False),
+                'ZXY': ((2, 0, 1), False),
+                'ZYX': ((2, 1, 0), True)}
+
+rotation_path = re.compile(r'^(pose\.bones\["(.+)"\]\.)(rotation_quaternion|rotation_euler)$')
+
+
+##############################
+## Vectorized rotation math ##
+##############################
+
+def quat_to_matrix_array(quats):
+    """ Converts an (n, 4) array of w, x, y, z quaternions
+        to an (n, 3, 3) array of rotation matrices.
+    """
+    q = quats / np.linalg.norm(quats, axis=1)[:, None]
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    mat = np.empty((len(q), 3, 3))
+    mat[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    mat[:, 0, 1] = 2 * (x * y - w * z)
+    mat[:, 0, 2] = 2 * (x * z + w * y)
+    mat[:, 1, 0] = 2 * (x * y + w * z)
+    mat[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    mat[:, 1, 2] = 2 * (y * z - w * x)
+    mat[:, 2, 0] = 2 * (x * z - w * y)
+    mat[:, 2, 1] = 2 * (y * z + w * x)
+    mat[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return mat
+
+
+def matrix_to_euler_array(mat, order):
+    """ Converts an (n, 3, 3) array of rotation matrices to the two
+        (n, 3) arrays of equivalent eulers in the given order.
+    """
+    (i, j, k), parity = euler_orders[order]
+
+    # Blender matrices are column major, so mat[a][b] there is mat[:, b, a] here
+    cy = np.hypot(mat[:, i, i], mat[:, j, i])
+    gimbal = cy <= 16.0 * np.finfo(np.float32).eps
+
+    eul1 = np.empty((len(mat), 3))
+    eul2 = np.empty((len(mat), 3))
+
+    eul1[:, i] = np.where(gimbal, np.arctan2(-mat[:, j, k], mat[:, j, j]), np.arctan2(mat[:, k, j], mat[:, k, k]))
+    eul1[:, j] = np.arctan2(-mat[:, k, i], cy)
+    eul1[:, k] = np.where(gimbal, 0.0, np.arctan2(mat[:, j, i], mat[:, i, i]))
+
+    eul2[:, i] = np.where(gimbal, eul1[:, i], np.arctan2(-mat[:, k, j], -mat[:, k, k]))
+    eul2[:, j] = np.where(gimbal, eul1[:, j], np.arctan2(-mat[:, k, i], -cy))
+    eul2[:, k] = np.where(gimbal, 0.0, np.arctan2(-mat[:, j, i], -mat[:, i, i]))
+
+    if parity:
+        eul1 = -eul1
+        eul2 = -eul2
+
+    return eul1, eul2
+
+
+def euler_filter(eul1, eul2):
+    """ Picks, frame after frame, the euler solution closest to the previous
+        frame and shifts it by whole turns so the curves stay continuous.
+    """
+    result = np.empty_like(eul1)
+    prev = None
+    for n in range(len(eul1)):
+        if prev is None:
+            cands = (eul1[n], eul2[n])
+            result[n] = min(cands, key=lambda e: np.abs(e).sum())
+        else:
+            cands = [e + 2 * np.pi * np.round((prev - e) / (2 * np.pi)) for e in (eul1[n], eul2[n])]
+            result[n] = min(cands, key=lambda e: np.abs(e - prev).sum())
+        prev = result[n]
+    return result
 
-class convert():
-    def get_or_create_fcurve(self, action, data_path, array_index=-1, group=None):
-        for fc in action.fcurves:
-            if fc.data_path == data_path and (array_index < 0 or fc.array_index == array_index):
-                return fc
-
-        fc = action.fcurves.new(data_path, array_index)
-        fc.group = group
-        return fc
-
-    def add_keyframe_quat(self, action, quat, frame, bone_prefix, group):
-        for i in range(len(quat)):
-            fc = self.get_or_create_fcurve(action, bone_prefix + "rotation_quaternion", i, group)
-            pos = len(fc.keyframe_points)
-            fc.keyframe_points.add(1)
-            fc.keyframe_points[pos].co = [frame, quat[i]]
-            fc.update()
 
-    def add_keyframe_euler(self, action, euler, frame, bone_prefix, group):
-        for i in range(len(euler)):
-            fc = self.get_or_create_fcurve(action, bone_prefix + "rotation_euler", i, group)
-            pos = len(fc.keyframe_points)
-            fc.keyframe_points.add(1)
-            fc.keyframe_points[pos].co = [frame, euler[i]]
-            fc.update()
+def quat_to_euler_array(quats, order):
+    """ Converts an (n, 4) array of quaternions to an (n, 3) array of
+        continuous eulers in the given order.
+    """
+    if not len(quats):
+        return np.zeros((0, 3))
+    eul1, eul2 = matrix_to_euler_array(quat_to_matrix_array(quats), order)
+    return euler_filter(eul1, eul2)
 
-    def frames_matching(self, action, data_path):
-        frames = set()
-        for fc in action.fcurves:
-            if fc.data_path == data_path:
-                fri = [kp.co[0] for kp in fc.keyframe_points]
-                frames.update(fri)
-        return frames
-
-    # Converts only one group/bone in one action - Quat to euler
-    def group_qe(self, obj, action, bone, bone_prefix, order):
-
-        pose_bone = bone
-        data_path = bone_prefix + "rotation_quaternion"
-        frames = self.frames_matching(action, data_path)
-        group = action.groups[bone.name]
-
-        for fr in frames:
-            quat = bone.rotation_quaternion.copy()
-            for fc in action.fcurves:
-                if fc.data_path == data_path:
-                    quat[fc.array_index] = fc.evaluate(fr)
-            euler = quat.to_euler(order)
-
-            self.add_keyframe_euler(action, euler, fr, bone_prefix, group)
-            bone.rotation_mode = order
 
-    # Converts only one group/bone in one action - Euler to Quat
-    def group_eq(self, obj, action, bone, bone_prefix, order):
+def euler_to_quat_array(eulers, order):
+    """ Converts an (n, 3) array of eulers in the given order to an (n, 4)
+        array of quaternions, keeping consecutive quaternions in the same
+        hemisphere.
+    """
+    (i, j, k), parity = euler_orders[order]
 
-        pose_bone = bone
-        data_path = bone_prefix + "rotation_euler"
-        frames = self.frames_matching(action, data_path)
-        group = action.groups[bone.name]
+    ti = eulers[:, i] * 0.5
+    tj = eulers[:, j] * (-0.5 if parity else 0.5)
+    th = eulers[:, k] * 0.5
 
-        for fr in frames:
-            euler = bone.rotation_euler.copy()
-            for fc in action.fcurves:
-                if fc.data_path == data_path:
-                    euler[fc.array_index] = fc.evaluate(fr)
-            quat = euler.to_quaternion()
+    ci, cj, ch = np.cos(ti), np.cos(tj), np.cos(th)
+    si, sj, sh = np.sin(ti), np.sin(tj), np.sin(th)
+    cc, cs, sc, ss = ci * ch, ci * sh, si * ch, si * sh
 
-            self.add_keyframe_quat(action, quat, fr, bone_prefix, group)
-            bone.rotation_mode = order
+    quats = np.empty((len(eulers), 4))
+    quats[:, 0] = cj * cc + sj * ss
+    quats[:, i + 1] = cj * sc - sj * cs
+    quats[:, j + 1] = cj * ss + sj * cc
+    quats[:, k + 1] = cj * cs - sj * sc
 
-    # One Action - One Bone
-    def one_act_one_bon(self, obj, action, bone, order):
-        do = False
-        bone_prefix = ''
+    if parity:
+        quats[:, j + 1] = -quats[:, j + 1]
+
+    # Flip signs so each quaternion is the shortest path from the previous one
+    if len(quats) > 1:
+        dots = np.einsum('ij,ij->i', quats[1:], quats[:-1])
+        signs = np.cumprod(np.where(dots < 0, -1.0, 1.0))
+        quats[1:] *= signs[:, None]
+
+    return quats
+
+
+class convert():
+    def rotation_fcurves(self, action):
+        """ Indexes the rotation fcurves of an action in a single pass:
+            {bone_name: (bone_prefix, {data_path_end: {array_index: fcurve}})}
+        """
+        channels = {}
+        for fc in action.fcurves:
+            match = rotation_path.match(fc.data_path)
+            if not match:
+                continue
+            bone_prefix, bone_name, prop = match.groups()
+            entry = channels.setdefault(bone_name, (bone_prefix, {}))
+            entry[1].setdefault(prop, {})[fc.array_index] = fc
+        return channels
+
+    def read_channels(self, fcurves, defaults):
+        """ Reads a rotation property as an (n, len(defaults)) array over the union
+            of the keyed frames of its fcurves. Channels keyed on every frame are
+            read directly, the others are sampled over the whole frame array.
+        """
+        keys = {index: get_keyframe_arrays(fc)[0] for index, fc in fcurves.items()}
+
+        if keys:
+            frames = np.unique(np.concatenate([co[:, 0] for co in keys.values()]))
+        else:
+            frames = np.zeros(0)
+
+        values = np.tile(np.array(defaults, dtype=float), (len(frames), 1))
+        for index, co in keys.items():
+            if index >= len(defaults):
+                continue
+            if len(co) == len(frames) and np.array_equal(co[:, 0], frames):
+                values[:, index] = co[:, 1]
+            else:
+                values[:, index] = sample_fcurve(fcurves[index], frames)
+
+        return frames, values
+
+    def write_channels(self, action, data_path, frames, values, group_name):
+        """ Writes every keyframe of a rotation property at once, one fcurve
+            per channel.
+        """
+        co = np.empty((len(frames), 2))
+        co[:, 0] = frames
+        for index in range(values.shape[1]):
+            fc = action.fcurves.new(data_path, index, group_name)
+            co[:, 1] = values[:, index]
+            fc.keyframe_points.add(len(frames))
+            fc.keyframe_points.foreach_set('co', co.ravel())
+            fc.update()
 
-        # What kind of conversion
-        cond1 = order == 'XYZ'
-        cond2 = order == 'XZY'
-        cond3 = order == 'YZX'
-        cond4 = order == 'YXZ'
-        cond5 = order == 'ZXY'
-        cond6 = order == 'ZYX'
+    # Converts the rotation fcurves of several bones in one action at once
+    def batch_convert(self, obj, action, order, pose_bones=None, src_orders=None):
 
-        order_euler = cond1 or cond2 or cond3 or cond4 or cond5 or cond6
-        order_quat = order == 'QUATERNION'
+        channels = self.rotation_fcurves(action)
+        src_prop = 'rotation_euler' if order == 'QUATERNION' else 'rotation_quaternion'
 
-        for fcurve in action.fcurves:
-            if fcurve.group.name == bone.name:
+        if pose_bones is None:
+            pose_bones = []
+            for bone_name, (bone_prefix, props) in channels.items():
+                if src_prop not in props:
+                    continue
+                if bone_name in obj.pose.bones:
+                    pose_bones.append(obj.pose.bones[bone_name])
+                else:
+                    print(bone_name, 'does not exist in Armature. Fcurve-group is not affected')
+
+        for bone in pose_bones:
+            if src_orders is not None:
+                src_order = src_orders.get(bone.name, bone.rotation_mode)
+            else:
+                src_order = bone.rotation_mode
+            bone_prefix, props = channels.get(bone.name, ('', {}))
+
+            if src_prop in props:
+                src_curves = props[src_prop]
 
                 # If To-Euler conversion
                 if order != 'QUATERNION':
-                    if fcurve.data_path.endswith('rotation_quaternion'):
-                        do = True
-                        bone_prefix = fcurve.data_path[:-len('rotation_quaternion')]
-                        break
+                    frames, quats = self.read_channels(src_curves, bone.rotation_quaternion)
+                    values = quat_to_euler_array(quats, order)
+                    dst_prop = 'rotation_euler'
 
                 # If To-Quat conversion
                 else:
-                    if fcurve.data_path.endswith('rotation_euler'):
-                        do = True
-                        bone_prefix = fcurve.data_path[:-len('rotation_euler')]
-                        break
-
-        # If To-Euler conversion
-        if do and order != 'QUATERNION':
-            # Converts the group/bone from Quat to Euler
-            self.group_qe(obj, action, bone, bone_prefix, order)
-
-            # Removes quaternion fcurves
-            for key in action.fcurves:
-                if key.data_path == 'pose.bones["' + bone.name + '"].rotation_quaternion':
-                    action.fcurves.remove(key)
-
-        # If To-Quat conversion
-        elif do:
-            # Converts the group/bone from Euler to Quat
-            self.group_eq(obj, action, bone, bone_prefix, order)
-
-            # Removes euler fcurves
-            for key in action.fcurves:
-                if key.data_path == 'pose.bones["' + bone.name + '"].rotation_euler':
-                    action.fcurves.remove(key)
-
-        # Changes rotation mode to new one
-        bone.rotation_mode = order
+                    if src_order not in euler_orders:
+                        src_order = 'XYZ'
+                    frames, eulers = self.read_channels(src_curves, bone.rotation_euler)
+                    values = euler_to_quat_array(eulers, src_order)
+                    dst_prop = 'rotation_quaternion'
+
+                # Removes previous fcurves, the source ones included
+                for fc in list(props.get(dst_prop, {}).values()) + list(src_curves.values()):
+                    action.fcurves.remove(fc)
+
+                self.write_channels(action, bone_prefix + dst_prop, frames, values, bone.name)
+
+            # Changes rotation mode to new one
+            bone.rotation_mode = order
+
+    # One Action - One Bone
+    def one_act_one_bon(self, obj, action, bone, order):
+        self.batch_convert(obj, action, order, [bone])
 
     # One Action, selected bones
     def one_act_sel_bon(self, obj, action, pose_bones, order):
-        for bone in pose_bones:
-            self.one_act_one_bon(obj, action, bone, order)
+        self.batch_convert(obj, action, order, pose_bones)
 
     # One action, all Bones (in Action)
     def one_act_every_bon(self, obj, action, order):
-
-        # Collects pose_bones that are in the action
-        pose_bones = set()
-        # Checks all fcurves
-        for fcurve in action.fcurves:
-            # Look for the ones that has rotation_euler
-            if order == 'QUATERNION':
-                if fcurve.data_path.endswith('rotation_euler'):
-                    # If the bone from action really exists
-                    if fcurve.group.name in obj.pose.bones:
-                        if obj.pose.bones[fcurve.group.name] not in pose_bones:
-                            pose_bones.add(obj.pose.bones[fcurve.group.name])
-                    else:
-                        print(fcurve.group.name, 'does not exist in Armature. Fcurve-group is not affected')
-
-            # Look for the ones that has rotation_quaternion
-            else:
-                if fcurve.data_path.endswith('rotation_quaternion'):
-                    # If the bone from action really exists
-                    if fcurve.group.name in obj.pose.bones:
-                        if obj.pose.bones[fcurve.group.name] not in pose_bones:
-                            pose_bones.add(obj.pose.bones[fcurve.group.name])
-                    else:
-                        print(fcurve.group.name, 'does not exist in Armature. Fcurve-group is not affected')
-
-        # Convert current action and pose_bones that are in each action
-        for bone in pose_bones:
-            self.one_act_one_bon(obj, action, bone, order)
+        self.batch_convert(obj, action, order)
 
     # All Actions, selected bones
     def all_act_sel_bon(self, obj, pose_bones, order):
+        src_orders = {bone.name: bone.rotation_mode for bone in pose_bones}
         for action in bpy.data.actions:
-            for bone in pose_bones:
-                self.one_act_one_bon(obj, action, bone, order)
+            self.batch_convert(obj, action, order, pose_bones, src_orders)
 
     # All actions, All Bones (in each Action)
     def all_act_every_bon(self, obj, order):
+        src_orders = {bone.name: bone.rotation_mode for bone in obj.pose.bones}
         for action in bpy.data.actions:
-            self.one_act_every_bon(obj, action, order)
+            self.batch_convert(obj, action, order, src_orders=src_orders)
 
 
 convert = convert()
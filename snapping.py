@@ -0,0 +1,440 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+import bpy
+from mathutils import Matrix
+from math import pi
+
+from .rigs.utils import get_limb_generated_names, get_limb_bone_map
+
+LOC = {'location'}
+ROT_SCALE = {'rotation', 'scale'}
+LOC_ROT_SCALE = {'location', 'rotation', 'scale'}
+
+
+#########################################
+## "Visual Transform" helper functions ##
+#########################################
+
+def get_pose_matrix_in_other_space(mat, pose_bone, parent_matrix=None):
+    """ Returns the transform matrix relative to pose_bone's current
+        transform space, presuming that mat is in armature space.
+        parent_matrix overrides the armature space matrix of the parent.
+    """
+    rest_inv = pose_bone.bone.matrix_local.inverted()
+    if pose_bone.parent:
+        if parent_matrix is None:
+            parent_matrix = pose_bone.parent.matrix
+        par_rest = pose_bone.parent.bone.matrix_local
+        return rest_inv * (par_rest * (parent_matrix.inverted() * mat))
+    else:
+        return rest_inv * mat
+
+
+def pose_translation(pose_bone, mat):
+    """ Returns the location giving the pose bone the translation of the
+        given matrix. Matrix should be given in bone's local space.
+    """
+    loc = mat.to_translation()
+    if pose_bone.bone.use_local_location is True:
+        return loc
+
+    rest = pose_bone.bone.matrix_local.copy()
+    if pose_bone.bone.parent:
+        par_rest = pose_bone.bone.parent.matrix_local.copy()
+    else:
+        par_rest = Matrix()
+
+    q = (par_rest.inverted() * rest).to_quaternion()
+    return q * loc
+
+
+def pose_rotation(pose_bone, mat):
+    """ Returns the value of the bone's rotation property (following its
+        rotation mode) for the rotation of the given matrix.
+        Matrix should be given in bone's local space.
+    """
+    q = mat.to_quaternion()
+
+    if pose_bone.rotation_mode == 'QUATERNION':
+        return q
+    elif pose_bone.rotation_mode == 'AXIS_ANGLE':
+        return (q.angle, q.axis[0], q.axis[1], q.axis[2])
+    else:
+        return q.to_euler(pose_bone.rotation_mode)
+
+
+def set_pose_translation(pose_bone, mat):
+    """ Sets the pose bone's translation to the same translation as the given matrix.
+        Matrix should be given in bone's local space.
+    """
+    pose_bone.location = pose_translation(pose_bone, mat)
+
+
+def set_pose_rotation(pose_bone, mat):
+    """ Sets the pose bone's rotation to the same rotation as the given matrix.
+        Matrix should be given in bone's local space.
+    """
+    setattr(pose_bone, rotation_data_path(pose_bone), pose_rotation(pose_bone, mat))
+
+
+def set_pose_scale(pose_bone, mat):
+    """ Sets the pose bone's scale to the same scale as the given matrix.
+        Matrix should be given in bone's local space.
+    """
+    pose_bone.scale = mat.to_scale()
+
+
+def visual_channels(pose_bone):
+    """ Returns {property: values} of the location, rotation and scale giving
+        the bone its current visual transform, constraints included.
+    """
+    local = get_pose_matrix_in_other_space(pose_bone.matrix, pose_bone)
+    return {
+        'location': pose_translation(pose_bone, local),
+        rotation_data_path(pose_bone): pose_rotation(pose_bone, local),
+        'scale': local.to_scale(),
+    }
+
+
+def rotation_data_path(pose_bone):
+    """ Returns the name of the rotation property used by the bone's rotation mode.
+    """
+    if pose_bone.rotation_mode == 'QUATERNION':
+        return 'rotation_quaternion'
+    elif pose_bone.rotation_mode == 'AXIS_ANGLE':
+        return 'rotation_axis_angle'
+    else:
+        return 'rotation_euler'
+
+
+###########################
+## Limb snapping targets ##
+###########################
+
+def pole_location(first, second, pole, length):
+    """ Returns the armature space location of the pole target that bends an
+        IK chain like the first -> second chain. first, second and pole are
+        pose bones, length is the distance of the pole from the chain center.
+    """
+    a = first.head
+    ac = second.tail - a
+    ab = second.head - a
+    on_line = ab.project(ac)
+    bend = ab - on_line
+
+    if bend.length > ac.length * 1e-3:
+        return a + ac / 2 + bend.normalized() * length
+
+    # Straight chain: keep the pole where it sits in the rest pose relative to first
+    rest_offset = first.bone.matrix_local.inverted() * pole.bone.head_local
+    return first.matrix * rest_offset
+
+
+def limb_snap_targets(rig, names, direction):
+    """ Reads, from the current evaluated pose, the armature space matrices
+        one limb has to be snapped to.
+        Returns (snaps, twists, resets, props): snaps is a list of
+        (pose_bone, matrix, channels), twists a list of (bone_ik, bone_fk)
+        needing a rotation correction, resets a list of pose bones whose
+        rotation must be cleared first and props a list of
+        (pose_bone, property, value) to set before snapping.
+    """
+    pb = rig.pose.bones
+    controls = names['controls']
+    ik_ctrl = names['ik_ctrl']
+    parent = pb[names['parent']]
+
+    snaps = []
+    twists = []
+    resets = []
+    props = []
+
+    if names['pole'] and parent.get('pole_vector'):
+        pole = pb[names['pole']]
+    else:
+        pole = None
+
+    if names['limb_type'] == 'arm':
+        uarm, farm, hand = pb[controls[1]], pb[controls[2]], pb[controls[3]]
+        uarmi, farmi, handi = pb[controls[0]], pb[ik_ctrl[1]], pb[controls[4]]
+
+        if direction == 'FK2IK':
+            if 'auto_stretch' in handi.keys():
+                # Legacy rigs: the FK chain stretches through stretch_length
+                props.append(legacy_stretch(uarm, handi, (uarmi, farmi), (uarm, farm)))
+                snaps.append((uarm, uarmi.matrix.copy(), ROT_SCALE))
+                snaps.append((farm, farmi.matrix.copy(), ROT_SCALE))
+                snaps.append((hand, handi.matrix.copy(), ROT_SCALE))
+            else:
+                snaps.append((uarm, uarmi.matrix.copy(), LOC_ROT_SCALE))
+                snaps.append((farm, farmi.matrix.copy(), ROT_SCALE))
+                snaps.append((hand, handi.matrix.copy(), LOC_ROT_SCALE))
+        else:
+            snaps.append((handi, hand.matrix.copy(), LOC_ROT_SCALE))
+            if pole:
+                loc = pole_location(uarm, farm, pole, uarmi.length + farmi.length)
+                snaps.append((pole, Matrix.Translation(loc), LOC))
+            else:
+                snaps.append((uarmi, uarm.matrix.copy(), LOC_ROT_SCALE))
+                twists.append((uarmi, uarm))
+
+    else:
+        thigh, shin, foot, mfoot = pb[controls[1]], pb[controls[2]], pb[controls[3]], pb[controls[7]]
+        thighi, shini, mfooti = pb[controls[0]], pb[ik_ctrl[1]], pb[ik_ctrl[2]]
+
+        if direction == 'FK2IK':
+            mat = mfoot.bone.matrix_local.inverted() * foot.bone.matrix_local
+            footi = pb[controls[6]]
+            if 'auto_stretch' in footi.keys():
+                # Legacy rigs: the FK chain stretches through stretch_length
+                props.append(legacy_stretch(thigh, footi, (thighi, shini), (thigh, shin)))
+                snaps.append((thigh, thighi.matrix.copy(), ROT_SCALE))
+            else:
+                snaps.append((thigh, thighi.matrix.copy(), LOC_ROT_SCALE))
+            snaps.append((shin, shini.matrix.copy(), ROT_SCALE))
+            snaps.append((foot, mfooti.matrix * mat, ROT_SCALE))
+        else:
+            footi, footroll = pb[controls[6]], pb[controls[5]]
+            mat = mfooti.bone.matrix_local.inverted() * footi.bone.matrix_local
+            resets.append(footroll)
+            if pole:
+                snaps.append((footi, mfoot.matrix * mat, LOC_ROT_SCALE))
+                loc = pole_location(thigh, shin, pole, thighi.length + shini.length)
+                snaps.append((pole, Matrix.Translation(loc), LOC))
+            else:
+                snaps.append((footi, foot.matrix * mat, LOC_ROT_SCALE))
+                snaps.append((thighi, thigh.matrix.copy(), LOC_ROT_SCALE))
+                twists.append((thighi, thigh))
+
+    return snaps, twists, resets, props
+
+
+def legacy_stretch(fk_root, ik_ctrl, ik_chain, fk_chain):
+    """ Returns the (pose_bone, property, value) matching the stretch_length
+        of a legacy FK chain with its IK chain, for rigs generated with the
+        auto_stretch property.
+    """
+    if ik_ctrl['auto_stretch'] == 0.0:
+        return (fk_root, 'stretch_length', ik_ctrl['stretch_length'])
+
+    ik_length = sum(b.vector.length for b in ik_chain)
+    fk_length = sum(b.vector.length for b in fk_chain)
+    return (fk_root, 'stretch_length', fk_root['stretch_length'] * ik_length / fk_length)
+
+
+def limb_key_bones(names):
+    """ Returns the bones whose keys mark the frames a limb is animated on.
+    """
+    controls = names['controls']
+    if names['limb_type'] == 'arm':
+        return (controls[0], controls[1], controls[2], controls[3], controls[4],
+                names['pole'], names['parent'])
+    else:
+        return (controls[0], controls[1], controls[2], controls[3], controls[6],
+                controls[5], names['pole'], names['parent'])
+
+
+def get_snap_limbs(rig, pose_bones=None):
+    """ Returns the names of the limbs owning any of pose_bones, in order,
+        or of every limb in the rig if pose_bones is None.
+    """
+    limb_names = get_limb_generated_names(rig)
+    if pose_bones is None:
+        return list(limb_names.values())
+
+    bone_map = get_limb_bone_map(limb_names)
+    limbs = []
+    for b in pose_bones:
+        group = bone_map.get(b.name)
+        if group in limb_names:
+            limbs.append(limb_names.pop(group))
+    return limbs
+
+
+######################
+## Applying a snap ##
+######################
+
+def apply_snaps(snaps):
+    """ Applies every (pose_bone, matrix, channels) snap. Bones are processed
+        parents first and the pose is only re-evaluated between hierarchy levels
+        that depend on each other, whatever the number of limbs.
+    """
+    levels = {}
+    for snap in snaps:
+        levels.setdefault(len(snap[0].parent_recursive), []).append(snap)
+
+    applied = set()
+    for depth in sorted(levels):
+        level = levels[depth]
+        if any(p.name in applied for snap in level for p in snap[0].parent_recursive):
+            bpy.context.scene.update()
+
+        for pose_bone, mat, channels in level:
+            local = get_pose_matrix_in_other_space(mat, pose_bone)
+            if 'location' in channels:
+                set_pose_translation(pose_bone, local)
+            if 'rotation' in channels:
+                set_pose_rotation(pose_bone, local)
+            if 'scale' in channels:
+                set_pose_scale(pose_bone, local)
+            applied.add(pose_bone.name)
+
+    bpy.context.scene.update()
+
+
+def correct_twists(twists, steps=16, precision=0.1):
+    """ Rotates every bone_ik around its axis until its tail meets bone_fk's.
+        All the (bone_ik, bone_fk) pairs are searched together, so each
+        evaluation of the pose is shared by every limb.
+    """
+    if not twists:
+        return
+
+    modes = [ik.rotation_mode for ik, fk in twists]
+    for ik, fk in twists:
+        ik.rotation_mode = 'AXIS_ANGLE'
+
+    def distances(angles):
+        for (ik, fk), angle in zip(twists, angles):
+            ik.rotation_axis_angle[0] = angle
+        bpy.context.scene.update()
+        return [(fk.tail - ik.tail).length for ik, fk in twists]
+
+    # Coarse scan around the whole turn
+    start = [ik.rotation_axis_angle[0] for ik, fk in twists]
+    delta = 2 * pi / steps
+    best = list(start)
+    best_dist = distances(start)
+    for step in range(1, steps):
+        angles = [s + step * delta for s in start]
+        for i, d in enumerate(distances(angles)):
+            if d < best_dist[i]:
+                best[i] = angles[i]
+                best_dist[i] = d
+
+    # Ternary search around the best coarse angle
+    left = [b - delta for b in best]
+    right = [b + delta for b in best]
+    while max(r - l for l, r in zip(left, right)) > precision:
+        left_third = [l + (r - l) / 3 for l, r in zip(left, right)]
+        right_third = [r - (r - l) / 3 for l, r in zip(left, right)]
+        left_dist = distances(left_third)
+        right_dist = distances(right_third)
+        for i in range(len(twists)):
+            if left_dist[i] > right_dist[i]:
+                left[i] = left_third[i]
+            else:
+                right[i] = right_third[i]
+
+    distances([(l + r) / 2 for l, r in zip(left, right)])
+
+    for (ik, fk), mode in zip(twists, modes):
+        ik.rotation_mode = mode
+    bpy.context.scene.update()
+
+
+def key_bones(pose_bones, frame):
+    """ Inserts visual location, rotation and scale keys on the given bones.
+    """
+    for pose_bone in pose_bones:
+        for data_path in ('location', rotation_data_path(pose_bone), 'scale'):
+            pose_bone.keyframe_insert(data_path, frame=frame, group=pose_bone.name,
+                                      options={'INSERTKEY_VISUAL'})
+
+
+def record_keys(keys, pose_bones, frame):
+    """ Stores the current visual location, rotation and scale of the given
+        bones in keys, {(bone name, property, index): [(frame, value)]},
+        to be written later by write_keys.
+    """
+    for pose_bone in pose_bones:
+        for prop, values in visual_channels(pose_bone).items():
+            for index, value in enumerate(values):
+                keys.setdefault((pose_bone.name, prop, index), []).append((frame, value))
+
+
+def write_keys(rig, keys):
+    """ Inserts all the keys recorded by record_keys, one fcurve at a time.
+    """
+    if not rig.animation_data:
+        rig.animation_data_create()
+    action = rig.animation_data.action
+    if not action:
+        action = bpy.data.actions.new(rig.name + "Action")
+        rig.animation_data.action = action
+
+    fcurves = {(fc.data_path, fc.array_index): fc for fc in action.fcurves}
+
+    for (bone_name, prop, index), points in keys.items():
+        data_path = 'pose.bones["%s"].%s' % (bone_name, prop)
+        fc = fcurves.get((data_path, index))
+        if fc is None:
+            fc = action.fcurves.new(data_path, index, bone_name)
+        for frame, value in points:
+            fc.keyframe_points.insert(frame, value, {'FAST'})
+        fc.update()
+
+
+def snap_limbs(rig, limbs, direction, keyframe=False):
+    """ Snaps the IK chains of all the given limbs on their FK chains
+        (direction 'IK2FK') or the FK chains on the IK ones ('FK2IK').
+        Every target is read from the same evaluated pose, then all the
+        limbs are moved together.
+    """
+    snaps = []
+    twists = []
+    resets = []
+    props = []
+    for names in limbs:
+        limb_snaps, limb_twists, limb_resets, limb_props = limb_snap_targets(rig, names, direction)
+        snaps += limb_snaps
+        twists += limb_twists
+        resets += limb_resets
+        props += limb_props
+
+    for pose_bone in resets:
+        set_pose_rotation(pose_bone, Matrix())
+    for pose_bone, prop, value in props:
+        pose_bone[prop] = value
+
+    apply_snaps(snaps)
+    correct_twists(twists)
+
+    snapped = [snap[0] for snap in snaps] + resets
+    if keyframe:
+        frame = bpy.context.scene.frame_current
+        key_bones(snapped, frame)
+        for pose_bone, prop, value in props:
+            pose_bone.keyframe_insert('["%s"]' % prop, frame=frame, group=pose_bone.name)
+
+    return snapped
+
+
+def switch_limbs_pole(rig, limbs, values):
+    """ Switches the IK of every limb between rotation and pole target mode
+        while keeping its pose. values maps the limb parents to the new
+        pole_vector value. Returns the IK bones that were moved.
+    """
+    snap_limbs(rig, limbs, 'FK2IK')
+    for names in limbs:
+        rig.pose.bones[names['parent']]['pole_vector'] = values[names['parent']]
+    return snap_limbs(rig, limbs, 'IK2FK')
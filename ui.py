@@ -26,9 +26,15 @@ from .utils import get_rig_type, MetarigError
 from .utils import write_metarig, write_widget
 from .utils import unique_name
 from .utils import upgradeMetarigTypes, outdated_types
-from .utils import get_keyed_frames, bones_in_frame
+from .utils import get_keyed_frames, get_bones_keyed_frames
 from .utils import overwrite_prop_animation
 from .rigs.utils import get_limb_generated_names
+from .snapping import snap_limbs, get_snap_limbs, limb_key_bones
+from .snapping import switch_limbs_pole, record_keys, write_keys
+from .bake import bake_deform_rig
+from .report import rig_complexity_report, format_report, report_to_json
+from .profiler import profile_rig, format_profile
+from .driver_audit import convert_python_drivers, format_remaining
 from . import rig_lists
 from . import template_list
 from . import generate
@@ -126,6 +132,10 @@ class DATA_PT_rigify_buttons(bpy.types.Panel):
 
             col.separator()
             row = col.row()
+            row.prop(armature_id_store, "rigify_detail_level", expand=True)
+            row = col.row()
+            row.prop(armature_id_store, "rigify_mirror_generation")
+            row = col.row()
             row.active = len(context.object.data.rigify_templates) != 0
             row.operator("pose.rigify_generate", text="Generate Rig", icon='POSE_HLT')
 
@@ -658,6 +668,9 @@ class BONE_PT_rigify_buttons(bpy.types.Panel):
                     box = layout.box()
                     rig.parameters_ui(box, bone.rigify_parameters)
 
+                row = layout.row()
+                row.prop(bone.rigify_parameters, "rigify_detail_level")
+
 
 class VIEW3D_PT_tools_rigify_dev(bpy.types.Panel):
     bl_label = "Rigify Dev Tools"
@@ -730,6 +743,12 @@ class VIEW3D_PT_rigify_animation_tools(bpy.types.Panel):
             row.prop(id_store, 'rigify_transfer_end_frame')
             row.operator("rigify.get_frame_range", icon='TIME', text='')
 
+            row = self.layout.row()
+            row.operator("rigify.bake_deform_proxy", icon='ARMATURE_DATA')
+            row.operator("rigify.complexity_report", icon='INFO')
+            row.operator("rigify.profile_playback", icon='TIME')
+            row.operator("rigify.convert_python_drivers", icon='DRIVER')
+
 
 def rigify_report_exception(operator, exception):
     import traceback
@@ -967,156 +986,44 @@ class OBJECT_OT_GetFrameRange(bpy.types.Operator):
         return {'FINISHED'}
 
 
-def FktoIk(rig, window='ALL'):
+def transfer_limbs(rig, direction, window='ALL'):
+    """ Snaps the limbs of rig on every keyed frame of the transfer range
+        (window 'ALL') or at the current frame (window 'CURRENT').
+        All the limbs keyed on a frame are snapped together.
+    """
 
     scn = bpy.context.scene
     id_store = bpy.context.window_manager
 
-    rig_id = rig.data['rig_id']
-    leg_ik2fk = eval('bpy.ops.pose.rigify_leg_ik2fk_' + rig_id)
-    arm_ik2fk = eval('bpy.ops.pose.rigify_arm_ik2fk_' + rig_id)
-    limb_generated_names = get_limb_generated_names(rig)
+    if id_store.rigify_transfer_only_selected:
+        limbs = get_snap_limbs(rig, bpy.context.selected_pose_bones)
+    else:
+        limbs = get_snap_limbs(rig)
+
+    if not limbs:
+        return
 
     if window == 'ALL':
         frames = get_keyed_frames(rig)
         frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
-    else:
-        frames = [scn.frame_current]
-
-    if not id_store.rigify_transfer_only_selected:
-        pbones = rig.pose.bones
-        bpy.ops.pose.select_all(action='DESELECT')
+        keyed_frames = get_bones_keyed_frames(rig)
+        for f in frames:
+            keyed = [names for names in limbs
+                     if any(f in keyed_frames.get(b, ()) for b in limb_key_bones(names))]
+            if not keyed:
+                continue
+            scn.frame_set(f)
+            snap_limbs(rig, keyed, direction, keyframe=True)
     else:
-        pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
-
-    for b in pbones:
-        for group in limb_generated_names:
-            if b.name in limb_generated_names[group].values() or b.name in limb_generated_names[group]['controls']\
-                    or b.name in limb_generated_names[group]['ik_ctrl']:
-                names = limb_generated_names[group]
-                if names['limb_type'] == 'arm':
-                    func = arm_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = True
-                    rig.pose.bones[controls[4]].bone.select = True
-                    rig.pose.bones[pole].bone.select = True
-                    rig.pose.bones[parent].bone.select = True
-                    kwargs = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1], 'hand_ik': controls[4],
-                              'pole': pole, 'main_parent': parent}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[4], pole, parent)
-                else:
-                    func = leg_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = True
-                    rig.pose.bones[controls[6]].bone.select = True
-                    rig.pose.bones[controls[5]].bone.select = True
-                    rig.pose.bones[pole].bone.select = True
-                    rig.pose.bones[parent].bone.select = True
-                    kwargs = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': controls[6], 'pole': pole, 'footroll': controls[5], 'mfoot_ik': ik_ctrl[2],
-                              'main_parent': parent}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[6], controls[5], pole, parent)
-
-                for f in frames:
-                    if not bones_in_frame(f, rig, *args):
-                        continue
-                    scn.frame_set(f)
-                    func(**kwargs)
-                    bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                    bpy.ops.anim.keyframe_insert_menu(type='Scaling')
-
-                bpy.ops.pose.select_all(action='DESELECT')
-                limb_generated_names.pop(group)
-                break
+        snap_limbs(rig, limbs, direction, keyframe=True)
 
 
-def IktoFk(rig, window='ALL'):
-
-    scn = bpy.context.scene
-    id_store = bpy.context.window_manager
-
-    rig_id = rig.data['rig_id']
-    leg_fk2ik = eval('bpy.ops.pose.rigify_leg_fk2ik_' + rig_id)
-    arm_fk2ik = eval('bpy.ops.pose.rigify_arm_fk2ik_' + rig_id)
-    limb_generated_names = get_limb_generated_names(rig)
+def FktoIk(rig, window='ALL'):
+    transfer_limbs(rig, 'IK2FK', window=window)
 
-    if window == 'ALL':
-        frames = get_keyed_frames(rig)
-        frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
-    else:
-        frames = [scn.frame_current]
 
-    if not id_store.rigify_transfer_only_selected:
-        bpy.ops.pose.select_all(action='DESELECT')
-        pbones = rig.pose.bones
-    else:
-        pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
-
-    for b in pbones:
-        for group in limb_generated_names:
-            if b.name in limb_generated_names[group].values() or b.name in limb_generated_names[group]['controls']\
-                    or b.name in limb_generated_names[group]['ik_ctrl']:
-                names = limb_generated_names[group]
-                if names['limb_type'] == 'arm':
-                    func = arm_fk2ik
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[1]].bone.select = True
-                    rig.pose.bones[controls[2]].bone.select = True
-                    rig.pose.bones[controls[3]].bone.select = True
-                    kwargs = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1],
-                              'hand_ik': controls[4]}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[4], pole, parent)
-                else:
-                    func = leg_fk2ik
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[1]].bone.select = True
-                    rig.pose.bones[controls[2]].bone.select = True
-                    rig.pose.bones[controls[3]].bone.select = True
-                    kwargs = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': ik_ctrl[2], 'mfoot_ik': ik_ctrl[2]}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[6], controls[5], pole, parent)
-
-                for f in frames:
-                    if not bones_in_frame(f, rig, *args):
-                        continue
-                    scn.frame_set(f)
-                    func(**kwargs)
-                    bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                    bpy.ops.anim.keyframe_insert_menu(type='Scaling')
-
-                bpy.ops.pose.select_all(action='DESELECT')
-                limb_generated_names.pop(group)
-                break
+def IktoFk(rig, window='ALL'):
+    transfer_limbs(rig, 'FK2IK', window=window)
 
 
 def clearAnimation(act, type, names):
@@ -1161,97 +1068,59 @@ def rotPoleToggle(rig, window='ALL', value=False, toggle=False, bake=False):
     scn = bpy.context.scene
     id_store = bpy.context.window_manager
 
-    rig_id = rig.data['rig_id']
-    leg_fk2ik = eval('bpy.ops.pose.rigify_leg_fk2ik_' + rig_id)
-    arm_fk2ik = eval('bpy.ops.pose.rigify_arm_fk2ik_' + rig_id)
-    leg_ik2fk = eval('bpy.ops.pose.rigify_leg_ik2fk_' + rig_id)
-    arm_ik2fk = eval('bpy.ops.pose.rigify_arm_ik2fk_' + rig_id)
-    limb_generated_names = get_limb_generated_names(rig)
-
-    if window == 'ALL':
-        frames = get_keyed_frames(rig)
-        frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
+    if id_store.rigify_transfer_only_selected:
+        limbs = get_snap_limbs(rig, bpy.context.selected_pose_bones)
     else:
-        frames = [scn.frame_current]
+        limbs = get_snap_limbs(rig)
 
-    if not id_store.rigify_transfer_only_selected:
-        bpy.ops.pose.select_all(action='DESELECT')
-        pbones = rig.pose.bones
-    else:
-        pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
+    if not limbs:
+        return
 
-    for b in pbones:
-        for group in limb_generated_names:
-            names = limb_generated_names[group]
+    values = dict()
+    for names in limbs:
+        parent = names['parent']
+        if toggle:
+            values[parent] = not rig.pose.bones[parent]['pole_vector']
+        else:
+            values[parent] = value
+
+    if window != 'ALL':
+        snapped = switch_limbs_pole(rig, limbs, values)
+        if bake:
+            keys = dict()
+            record_keys(keys, snapped, scn.frame_current)
+            write_keys(rig, keys)
+            for names in limbs:
+                parent = rig.pose.bones[names['parent']]
+                overwrite_prop_animation(rig, parent, 'pole_vector', values[parent.name], [scn.frame_current])
+        return
 
-            if toggle:
-                new_pole_vector_value = not rig.pose.bones[names['parent']]['pole_vector']
-            else:
-                new_pole_vector_value = value
-
-            if b.name in names.values() or b.name in names['controls'] or b.name in names['ik_ctrl']:
-                if names['limb_type'] == 'arm':
-                    func1 = arm_fk2ik
-                    func2 = arm_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[4]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[parent].bone.select = not new_pole_vector_value
-                    rig.pose.bones[pole].bone.select = new_pole_vector_value
-
-                    kwargs1 = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1],
-                              'hand_ik': controls[4]}
-                    kwargs2 = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1], 'hand_ik': controls[4],
-                              'pole': pole, 'main_parent': parent}
-                    args = (controls[0], controls[4], pole, parent)
-                else:
-                    func1 = leg_fk2ik
-                    func2 = leg_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[6]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[5]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[parent].bone.select = not new_pole_vector_value
-                    rig.pose.bones[pole].bone.select = new_pole_vector_value
-
-                    kwargs1 = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': ik_ctrl[2], 'mfoot_ik': ik_ctrl[2]}
-                    kwargs2 = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': controls[6], 'pole': pole, 'footroll': controls[5], 'mfoot_ik': ik_ctrl[2],
-                              'main_parent': parent}
-                    args = (controls[0], controls[6], controls[5], pole, parent)
-
-                for f in frames:
-                    if not bones_in_frame(f, rig, *args):
-                        continue
-                    scn.frame_set(f)
-                    func1(**kwargs1)
-                    rig.pose.bones[names['parent']]['pole_vector'] = new_pole_vector_value
-                    func2(**kwargs2)
-                    if bake:
-                        bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                        bpy.ops.anim.keyframe_insert_menu(type='Scaling')
-                        overwrite_prop_animation(rig, rig.pose.bones[parent], 'pole_vector', new_pole_vector_value, [f])
-
-                bpy.ops.pose.select_all(action='DESELECT')
-                limb_generated_names.pop(group)
-                break
-    scn.frame_set(0)
+    frames = get_keyed_frames(rig)
+    frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
+    keyed_frames = get_bones_keyed_frames(rig)
+    frame_current = scn.frame_current
+
+    # Keys are collected over the whole range, then written once per fcurve
+    keys = dict()
+    switched_frames = {names['parent']: [] for names in limbs}
+    for f in frames:
+        switched = [names for names in limbs
+                    if any(f in keyed_frames.get(b, ()) for b in limb_key_bones(names))]
+        if not switched:
+            continue
+        scn.frame_set(f)
+        snapped = switch_limbs_pole(rig, switched, values)
+        if bake:
+            record_keys(keys, snapped, f)
+            for names in switched:
+                switched_frames[names['parent']].append(f)
+
+    if bake:
+        write_keys(rig, keys)
+        for parent, parent_frames in switched_frames.items():
+            overwrite_prop_animation(rig, rig.pose.bones[parent], 'pole_vector', values[parent], parent_frames)
+
+    scn.frame_set(frame_current)
 
 
 class OBJECT_OT_IK2FK(bpy.types.Operator):
@@ -1358,6 +1227,130 @@ class OBJECT_OT_Rot2Pole(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class OBJECT_OT_BakeDeformProxy(bpy.types.Operator):
+    bl_idname = "rigify.bake_deform_proxy"
+    bl_label = "Bake Deform Proxy"
+    bl_options = {'UNDO'}
+    bl_description = "Bake the DEF bones over the transfer range into a constraint free armature"
+    remap = bpy.props.BoolProperty(name="Remap Meshes", default=True,
+                                   description="Deform the meshes of the rig with the baked armature")
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'ARMATURE'
+
+    def execute(self, context):
+        rig = context.object
+        id_store = context.window_manager
+        start = id_store.rigify_transfer_start_frame
+        end = id_store.rigify_transfer_end_frame
+        if end <= start:
+            start, end = context.scene.frame_start, context.scene.frame_end
+
+        try:
+            proxy = bake_deform_rig(context, rig, start, end, remap=self.remap)
+        except MetarigError as rig_exception:
+            rigify_report_exception(self, rig_exception)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, "Baked %d bones of %s into %s" % (len(proxy.data.bones), rig.name, proxy.name))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_ComplexityReport(bpy.types.Operator):
+    bl_idname = "rigify.complexity_report"
+    bl_label = "Complexity Report"
+    bl_description = "Count the bones, constraints, drivers and widgets every rig type added to this rig"
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'ARMATURE'
+
+    def execute(self, context):
+        rig = context.object
+        try:
+            report = rig_complexity_report(rig)
+        except MetarigError as rig_exception:
+            rigify_report_exception(self, rig_exception)
+            return {'CANCELLED'}
+
+        name = "rigify_report_%s.json" % report['rig_id']
+        text = bpy.data.texts.get(name) or bpy.data.texts.new(name)
+        text.from_string(report_to_json(report))
+        print(format_report(report))
+
+        total = report['total']
+        self.report({'INFO'}, "%s: %d bones, %d constraints, %d drivers (%d python), written to %s"
+                    % (rig.name, sum(total['bones'].values()), sum(total['constraints'].values()),
+                       sum(total['drivers'].values()), total['python_drivers'], name))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_ConvertPythonDrivers(bpy.types.Operator):
+    bl_idname = "rigify.convert_python_drivers"
+    bl_label = "Convert Python Drivers"
+    bl_description = "Rewrite the scripted drivers of this rig that are linear in their variables" \
+                     " as averaged or summed drivers, and list the others"
+    bl_options = {'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'ARMATURE'
+
+    def execute(self, context):
+        rig = context.object
+        try:
+            converted, remaining = convert_python_drivers(rig)
+        except MetarigError as rig_exception:
+            rigify_report_exception(self, rig_exception)
+            return {'CANCELLED'}
+        if remaining:
+            print(format_remaining(remaining))
+        self.report({'INFO'}, "%s: %d drivers converted, %d left as Python"
+                    % (rig.name, converted, len(remaining)))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_ProfilePlayback(bpy.types.Operator):
+    bl_idname = "rigify.profile_playback"
+    bl_label = "Profile Playback"
+    bl_description = "Time the playback over the transfer range, and the share of every rig and bone group"
+    repeat = bpy.props.IntProperty(name="Repeat", default=3, min=1, description="Runs per measure")
+    per_rig = bpy.props.BoolProperty(name="Rigs", default=True, description="Measure every rig type instance")
+    per_group = bpy.props.BoolProperty(name="Bone Groups", default=True,
+                                       description="Measure the tweak, IK stretch and face bones")
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'ARMATURE'
+
+    def execute(self, context):
+        rig = context.object
+        id_store = context.window_manager
+        start = id_store.rigify_transfer_start_frame
+        end = id_store.rigify_transfer_end_frame
+        if end <= start:
+            start, end = context.scene.frame_start, context.scene.frame_end
+
+        use_global_undo = context.user_preferences.edit.use_global_undo
+        context.user_preferences.edit.use_global_undo = False
+        try:
+            profile = profile_rig(context, rig, start, end, self.repeat, self.per_rig, self.per_group)
+        except MetarigError as rig_exception:
+            rigify_report_exception(self, rig_exception)
+            return {'CANCELLED'}
+        finally:
+            context.user_preferences.edit.use_global_undo = use_global_undo
+
+        name = "rigify_profile_%s.txt" % profile['rig_id']
+        text = bpy.data.texts.get(name) or bpy.data.texts.new(name)
+        text.from_string(format_profile(profile))
+
+        self.report({'INFO'}, "%s: %.3f ms per frame, profile written to %s"
+                    % (rig.name, profile['ms_per_frame'], name))
+        return {'FINISHED'}
+
+
 def register():
 
     bpy.utils.register_class(DATA_UL_rigify_template_list)
@@ -1392,6 +1385,10 @@ def register():
     bpy.utils.register_class(OBJECT_OT_TransferIKtoFK)
     bpy.utils.register_class(OBJECT_OT_ClearAnimation)
     bpy.utils.register_class(OBJECT_OT_Rot2Pole)
+    bpy.utils.register_class(OBJECT_OT_BakeDeformProxy)
+    bpy.utils.register_class(OBJECT_OT_ComplexityReport)
+    bpy.utils.register_class(OBJECT_OT_ConvertPythonDrivers)
+    bpy.utils.register_class(OBJECT_OT_ProfilePlayback)
 
     rot_mode.register()
 
@@ -1430,5 +1427,9 @@ def unregister():
     bpy.utils.unregister_class(OBJECT_OT_TransferIKtoFK)
     bpy.utils.unregister_class(OBJECT_OT_ClearAnimation)
     bpy.utils.unregister_class(OBJECT_OT_Rot2Pole)
+    bpy.utils.unregister_class(OBJECT_OT_BakeDeformProxy)
+    bpy.utils.unregister_class(OBJECT_OT_ComplexityReport)
+    bpy.utils.unregister_class(OBJECT_OT_ConvertPythonDrivers)
+    bpy.utils.unregister_class(OBJECT_OT_ProfilePlayback)
 
     rot_mode.unregister()
@@ -25,30 +25,6 @@ from math import acos, pi
 rig_id = "%s"
 
 
-#######################
-## Driver namespace  ##
-#######################
-MEMBER_OFFSET = 0.01
-BONE_OFFSET = 0.001
-
-# Members are a group of bones moving together (eg. Hand, Forearm, Arm)
-# Bones are individual pieces inside this group
-# They can have an extra offset, per bone (eg. eyelid hiding behind the head)
-
-def z_index(member_index, flip, bone_index, extra_offset=0.0):
-    """This bone changes sides when the rig is flipped (eg. limbs)"""
-    if flip:
-        return member_index * MEMBER_OFFSET - bone_index * BONE_OFFSET - extra_offset * MEMBER_OFFSET
-    else:
-        return member_index * MEMBER_OFFSET + bone_index * BONE_OFFSET + extra_offset * MEMBER_OFFSET
-
-def z_index_same(member_index, flip, bone_index, extra_offset=0.0):
-    """This bone does not change sides when the rig is flipped (eg. head)"""
-    if flip:
-        return -member_index * MEMBER_OFFSET - bone_index * BONE_OFFSET - extra_offset * MEMBER_OFFSET
-    else:
-        return member_index * MEMBER_OFFSET + bone_index * BONE_OFFSET + extra_offset * MEMBER_OFFSET
-
 #######################
 ## Root modification ##
 #######################
@@ -209,6 +185,54 @@ def get_name_from_org(name, suffix='.IK'):
         side = ''
     return name[4:].replace(side, suffix + side)
 
+def get_parent_transforms(pbone, par_mat):
+    """Return the rotation/scale and the location matrices pbone gets from
+    its parent posed at par_mat (armature space), following the bone's
+    inherit rotation, inherit scale and local location options"""
+    bone = pbone.bone
+    if pbone.parent is None:
+        offset = rotscale = bone.matrix_local
+    else:
+        parent_rest = pbone.parent.bone.matrix_local
+        offset = parent_rest.inverted() * bone.matrix_local
+        if not bone.use_inherit_rotation and not bone.use_inherit_scale:
+            rotscale = parent_rest * offset
+        elif not bone.use_inherit_rotation:
+            scale = par_mat.to_scale()
+            scale_mat = Matrix.Identity(4)
+            for i in range(3):
+                scale_mat[i][i] = scale[i]
+            # The parent rest matrix is rescaled along its own axes
+            rotscale = parent_rest * scale_mat * offset
+        elif not bone.use_inherit_scale:
+            rotscale = par_mat.normalized() * offset
+        else:
+            rotscale = par_mat * offset
+        offset = par_mat * offset
+
+    if not bone.use_local_location:
+        loc = Matrix.Translation(offset.translation)
+    elif bone.use_inherit_rotation and bone.use_inherit_scale:
+        loc = rotscale
+    else:
+        loc = offset
+    return rotscale, loc
+
+def get_chain_basis_matrices(chain_matrices):
+    """Return the basis matrices giving each pose bone of chain_matrices,
+    a list of (pose bone, armature space matrix) in parent order,
+    its armature space matrix"""
+    targets = {pbone.name: mat for pbone, mat in chain_matrices}
+    bases = []
+    for pbone, mat in chain_matrices:
+        parent = pbone.parent
+        par_mat = targets.get(parent.name, parent.matrix) if parent else None
+        rotscale, loc = get_parent_transforms(pbone, par_mat)
+        basis = rotscale.inverted() * mat
+        basis.translation = loc.inverted() * mat.translation
+        bases.append((pbone, basis))
+    return bases
+
 class Rigify_IK_Switch(bpy.types.Operator):
     """ Snap selected member from IK to FK or from FK to IK
     """
@@ -218,29 +242,81 @@ class Rigify_IK_Switch(bpy.types.Operator):
 
     to_ik = bpy.props.BoolProperty()
     keyframe_insert = bpy.props.BoolProperty(default=False)
+    bake = bpy.props.BoolProperty(default=False, description="Switch every frame of the range")
+    frame_start = bpy.props.IntProperty()
+    frame_end = bpy.props.IntProperty()
 
     @classmethod
     def poll(cls, context):
         return (context.active_object != None and context.mode == 'POSE')
 
     def execute(self, context):
-        def set_fk_ik_prop(switch_value, keyframe_insert=False):
-            # Get the bone having the IK_FK prop, and set it according to destination mode
+        def get_fk_ik_prop_bone():
+            # Get the bone having the IK_FK prop
             for org in bones:
                 ik_name = get_name_from_org(org.name)
                 if (ik_name in obj.pose.bones
                         and 'IK_FK' in obj.pose.bones[ik_name]):
-                    if keyframe_insert:
-                        obj.keyframe_insert('pose.bones["{}"]["IK_FK"]'.format(ik_name),
-                                            frame=context.scene.frame_current - 1)
-                    obj.pose.bones[ik_name]['IK_FK'] = switch_value
-                    if keyframe_insert:
-                        obj.keyframe_insert('pose.bones["{}"]["IK_FK"]'.format(ik_name),
-                                            frame=context.scene.frame_current)
-                    break
+                    return obj.pose.bones[ik_name]
+            return None
+
+        def key_fk_ik_prop(value, frame):
+            prop_bone['IK_FK'] = value
+            obj.keyframe_insert(prop_bone.path_from_id('["IK_FK"]'), frame=frame)
+
+        def key_chain(chain, frame):
+            for dst_bone, basis in chain:
+                dst_bone.keyframe_insert('location', frame=frame)
+                dst_bone.keyframe_insert('rotation_euler', frame=frame)
+
+        def set_source_state():
+            # Make the ORG bones follow the source chain, without flip
+            # to avoid constraint matrix problems
+            obj.pose.bones["root"]["flip"] = 0
+            if prop_bone is not None:
+                prop_bone['IK_FK'] = int(not switch_value)
+
+        def get_prop_fcurves():
+            # Animation of the flip and IK_FK properties, if any
+            if obj.animation_data is None or obj.animation_data.action is None:
+                return []
+            paths = ['pose.bones["root"]["flip"]']
+            if prop_bone is not None:
+                paths.append(prop_bone.path_from_id('["IK_FK"]'))
+            fcurves = [obj.animation_data.action.fcurves.find(path) for path in paths]
+            return [fcu for fcu in fcurves if fcu is not None]
+
+        def clear_fk_ik_keys(frame_start, frame_end):
+            for fcu in get_prop_fcurves():
+                if fcu.data_path.endswith('["IK_FK"]'):
+                    for point in reversed(fcu.keyframe_points):
+                        if frame_start <= point.co[0] <= frame_end:
+                            fcu.keyframe_points.remove(point)
+
+        def switch_chain(evaluate=True):
+            if evaluate:
+                set_source_state()
+                obj.update_tag({"DATA"}) # Mark data to be updated, to recalculate matrices
+                context.scene.update() # Force update
+
+            # Destination matrices of the whole chain, in armature space
+            chain_matrices = []
+            for org in bones:
+                dst_name = get_name_from_org(org.name, dst_suffix)
+                if dst_name in obj.pose.bones:
+                    dst_bone = obj.pose.bones[dst_name]
+                    diff_mat = org.bone.matrix_local.inverted() * dst_bone.bone.matrix_local
+                    chain_matrices.append((dst_bone, org.matrix * diff_mat))
+
+            # Apply them in one pass, parents first
+            bases = get_chain_basis_matrices(chain_matrices)
+            for dst_bone, basis in bases:
+                dst_bone.matrix_basis = basis
+            return bases
 
         obj = context.object
         bone = context.active_pose_bone
+        scene = context.scene
 
         switch_value = int(self.to_ik)
 
@@ -254,42 +330,58 @@ class Rigify_IK_Switch(bpy.types.Operator):
             return {'CANCELLED'}
         org_bone = obj.pose.bones[org_name]
         bones = get_connected_bone_chain(org_bone)
+        prop_bone = get_fk_ik_prop_bone()
 
-        # Set flip to 0, to avoid constraint matrix problems
         previous_flip = obj.pose.bones["root"]["flip"]
-        obj.pose.bones["root"]["flip"] = 0
-        obj.update_tag({"DATA"}) # Mark data to be updated, to recalculate matrices
-        context.scene.update() # Force update
-
-        mats = {}
-
-        set_fk_ik_prop(int(not switch_value))
-        obj.update_tag({"DATA"}) # Mark data to be updated, to recalculate matrices
-        context.scene.update() # Force update
 
-        for i in range(len(bones)): # Recalculate matrices once for each bone in the chain. Couldn't find better :/
-            for org in bones:
-                dst_name = get_name_from_org(org.name, dst_suffix)
-                if dst_name in obj.pose.bones:
-                    dst_bone = obj.pose.bones[dst_name]
-                    diff_mat = org.bone.matrix_local.inverted() * dst_bone.bone.matrix_local
-                    if org in mats: # Second pass: apply transforms
-                        dst_bone.matrix = mats[org] * diff_mat
-                        if self.keyframe_insert:
-                            dst_bone.keyframe_insert('location')
-                            dst_bone.keyframe_insert('rotation_euler')
-                    else: # First pass: record transforms
-                        mats[org] = org.matrix.copy()
-                        if self.keyframe_insert:
-                            dst_bone.keyframe_insert('location', frame=context.scene.frame_current - 1)
-                            dst_bone.keyframe_insert('rotation_euler', frame=context.scene.frame_current - 1)
+        if self.bake:
+            # Bake the switch over the frame range, one evaluation per frame:
+            # the flip and IK_FK animation is muted so that frame_set()
+            # evaluates the source state directly
+            frame_current = scene.frame_current
+            muted = [fcu for fcu in get_prop_fcurves() if not fcu.mute]
+            for fcu in muted:
+                fcu.mute = True
+            set_source_state()
+            try:
+                for frame in range(self.frame_start, self.frame_end + 1):
+                    scene.frame_set(frame)
+                    key_chain(switch_chain(evaluate=False), frame)
+            finally:
+                for fcu in muted:
+                    fcu.mute = False
+
+            if prop_bone is not None:
+                clear_fk_ik_keys(self.frame_start - 1, self.frame_end + 1)
+                key_fk_ik_prop(int(not switch_value), self.frame_start - 1)
+                key_fk_ik_prop(int(not switch_value), self.frame_end + 1)
+                key_fk_ik_prop(switch_value, self.frame_start)
+                key_fk_ik_prop(switch_value, self.frame_end)
+            scene.frame_set(frame_current)
+
+        else:
+            if self.keyframe_insert:
+                for org in bones:
+                    dst_name = get_name_from_org(org.name, dst_suffix)
+                    if dst_name in obj.pose.bones:
+                        dst_bone = obj.pose.bones[dst_name]
+                        dst_bone.keyframe_insert('location', frame=scene.frame_current - 1)
+                        dst_bone.keyframe_insert('rotation_euler', frame=scene.frame_current - 1)
+
+            chain = switch_chain()
+
+            if self.keyframe_insert:
+                key_chain(chain, scene.frame_current)
+
+            if prop_bone is not None:
+                if self.keyframe_insert:
+                    key_fk_ik_prop(int(not switch_value), scene.frame_current - 1)
+                    key_fk_ik_prop(switch_value, scene.frame_current)
                 else:
-                    continue
-
-            context.scene.update() # Force update
+                    prop_bone['IK_FK'] = switch_value
 
         # Hide other layer
-        if self.keyframe_insert:
+        if self.keyframe_insert or self.bake:
             dst_name = get_name_from_org(org_name, dst_suffix)
             dst_bone = obj.pose.bones[dst_name]
             src_name = get_name_from_org(org_name, src_suffix)
@@ -300,8 +392,6 @@ class Rigify_IK_Switch(bpy.types.Operator):
                 if src_bone.bone.layers[l_i]:
                     obj.data.layers[l_i] = False
 
-        set_fk_ik_prop(switch_value, self.keyframe_insert)
-
         # Reset flip value
         obj.pose.bones["root"]["flip"] = previous_flip
         obj.update_tag({"DATA"})
@@ -313,6 +403,68 @@ class Rigify_IK_Switch(bpy.types.Operator):
 ## Bone Z Index Operators and UI ##
 ###################################
 
+# Deform bone names of each member, per rig object:
+# {object name: {member_index: [bone names]}}
+# Kept up to date by the operators below, cleared after an undo, a redo
+# or a file load, rebuilt when found stale
+member_bones_index = {}
+# Number of pose bones of each rig object when its index was built
+member_bones_count = {}
+
+@bpy.app.handlers.persistent
+def clear_member_index(scene):
+    """Drop the member index, the member of any bone may have changed"""
+    member_bones_index.clear()
+    member_bones_count.clear()
+
+def register_member_index_handlers():
+    """Install clear_member_index once, replacing the one of a previous run of this script"""
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post, bpy.app.handlers.load_post):
+        for handler in [h for h in handlers if h.__name__ == clear_member_index.__name__]:
+            handlers.remove(handler)
+        handlers.append(clear_member_index)
+
+def build_member_index(obj):
+    """Index the deform bones of obj by member"""
+    index = {}
+    for pbone in obj.pose.bones:
+        if not pbone.bone.use_deform:
+            continue
+        index.setdefault(pbone['member_index'], []).append(pbone.name)
+    member_bones_index[obj.name] = index
+    member_bones_count[obj.name] = len(obj.pose.bones)
+    return index
+
+def get_member_bones(obj, member_index):
+    """Return the deform pose bones of a member"""
+    pose_bones = obj.pose.bones
+    index = member_bones_index.get(obj.name)
+    # Bones added or removed since the index was built may belong to the member
+    if index is None or member_bones_count.get(obj.name) != len(pose_bones):
+        index = build_member_index(obj)
+
+    bones = [pose_bones.get(name) for name in index.get(member_index, ())]
+    if any(b is None or b['member_index'] != member_index for b in bones):
+        index = build_member_index(obj)
+        bones = [pose_bones[name] for name in index.get(member_index, ())]
+    return bones
+
+def set_member_index(obj, bones, member_index):
+    """Move bones to another member, keeping the index up to date"""
+    index = member_bones_index.get(obj.name)
+    for b in bones:
+        if index is not None:
+            old_names = index.get(b['member_index'])
+            if old_names is not None and b.name in old_names:
+                old_names.remove(b.name)
+            index.setdefault(member_index, []).append(b.name)
+        b['member_index'] = member_index
+
+def update_z_order(obj, context):
+    """Re-evaluate the z index drivers after an index change"""
+    obj.update_tag({"DATA"})
+    context.scene.update()
+
 class Rigify_Fill_Members(bpy.types.Operator):
     """Construct member and bone structure"""
     bl_idname = "pose.rigify_fill_members" + rig_id
@@ -327,17 +479,11 @@ class Rigify_Fill_Members(bpy.types.Operator):
         obj = context.object
 
         obj.pantin_members.clear()
-        members = {}
-        for pbone in obj.pose.bones:
-            # print(bone.name)
-            if not pbone.bone.use_deform:
-                continue
-            if not pbone['member_index'] in members:
-                members[pbone['member_index']] = []
-            members[pbone['member_index']].append((pbone['bone_index'], pbone.name))
-        # print(members)
-
-        for member, bones in sorted(members.items(), key=lambda i:i[0], reverse=True):
+        pose_bones = obj.pose.bones
+        index = build_member_index(obj)
+
+        for member, names in sorted(index.items(), key=lambda i:i[0], reverse=True):
+            bones = [(pose_bones[name]['bone_index'], name) for name in names]
             m = obj.pantin_members.add()
             m.index = member
             for bone in sorted(bones, key=lambda i:i[0], reverse=True):
@@ -371,6 +517,8 @@ class Rigify_Reapply_Members(bpy.types.Operator):
                 pb['member_index'] = member.index
                 pb['bone_index'] = bone.index
 
+        build_member_index(obj)
+        update_z_order(obj, context)
         return {'FINISHED'}
 
 class Rigify_Sort_Doubles(bpy.types.Operator):
@@ -438,13 +586,10 @@ class Rigify_Reorder_Members(bpy.types.Operator):
                 other_member_index = other_member.index
 
         if other_member is not None:
-            for b in obj.pose.bones:
-                if not b.bone.use_deform:
-                    continue
-                if b['member_index'] == active_member_index:
-                    b['member_index'] = other_member_index
-                elif b['member_index'] == other_member_index :
-                    b['member_index'] = active_member_index
+            active_bones = get_member_bones(obj, active_member_index)
+            other_bones = get_member_bones(obj, other_member_index)
+            set_member_index(obj, active_bones, other_member_index)
+            set_member_index(obj, other_bones, active_member_index)
 
             # move in UI
             active_member.index = other_member_index
@@ -466,9 +611,7 @@ class Rigify_Reorder_Members(bpy.types.Operator):
                 # # bone0.index += 1
                 # # bone1.index -= 1
 
-        mode = bpy.context.mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.object.mode_set(mode=mode)
+        update_z_order(obj, context)
 
         return {'FINISHED'}
 
@@ -496,14 +639,12 @@ class Rigify_Reorder_Bones(bpy.types.Operator):
         print('BONE:', rig_bone_index)
         num_bones = len(active_member.bones)
         # get related bones in rig
-        for b in obj.pose.bones:
-            if not b.bone.use_deform:
-                continue
-            if b['member_index'] == active_member_index and b['bone_index'] == rig_bone_index:
+        for b in get_member_bones(obj, active_member_index):
+            if b['bone_index'] == rig_bone_index:
                 active_bone = b
-            if rig_bone_index < num_bones-1 and b['member_index'] == active_member_index and b['bone_index'] == rig_bone_index + 1 :
+            if rig_bone_index < num_bones-1 and b['bone_index'] == rig_bone_index + 1 :
                 previous_bone = b
-            if rig_bone_index > 0 and b['member_index'] == active_member_index and b['bone_index'] == rig_bone_index - 1 :
+            if rig_bone_index > 0 and b['bone_index'] == rig_bone_index - 1 :
                 next_bone = b
         # for b in(previous_bone, active_bone, next_bone):
         #     try:
@@ -537,9 +678,7 @@ class Rigify_Reorder_Bones(bpy.types.Operator):
                 bone0.index += 1
                 bone1.index -= 1
 
-        mode = bpy.context.mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.object.mode_set(mode=mode)
+        update_z_order(obj, context)
 
         return {'FINISHED'}
 
@@ -550,14 +689,9 @@ class PantinBones(bpy.types.PropertyGroup):
 bpy.utils.register_class(PantinBones)
 
 def member_index_update(self, context):
-    for m in self.id_data.pantin_members:
-        for bone in m.bones:
-            self.id_data.pose.bones[bone.name]['member_index'] = m.index
-
-    for b in self.id_data.pose.bones:
-        if not b.bone.use_deform:
-            continue
-
+    obj = self.id_data
+    bones = [obj.pose.bones[bone.name] for bone in self.bones]
+    set_member_index(obj, bones, self.index)
 
 
 class PantinMembers(bpy.types.PropertyGroup):
@@ -677,20 +811,21 @@ class RigUI(bpy.types.Panel):
         pose_bones = context.active_object.pose.bones
         # bones = context.active_object.data.bones
         try:
-            selected_bones = [bone.name for bone in context.selected_pose_bones]
-            selected_bones += [context.active_pose_bone.name]
+            selected_bones = {bone.name for bone in context.selected_pose_bones}
+            selected_bones.add(context.active_pose_bone.name)
         except (AttributeError, TypeError):
             return
 
+        # Rig sections with at least one selected bone
+        sections = set()
+        for name in selected_bones:
+            sections.update(SECTION_BONES.get(name, ()))
+
         def is_selected(names):
             # Returns whether any of the named bones are selected.
-            if type(names) == list:
-                for name in names:
-                    if name in selected_bones:
-                        return True
-            elif names in selected_bones:
-                return True
-            return False
+            if isinstance(names, str):
+                return names in selected_bones
+            return not selected_bones.isdisjoint(names)
 
         layout.operator("pose.rigify_swap_bones" + rig_id)
         layout.separator()
@@ -712,6 +847,16 @@ class RigUI(bpy.types.Panel):
         op.to_ik = False
         op.keyframe_insert = True
 
+        # Bake the switch over the scene frame range
+        scene = context.scene
+        row = col.row(align=True)
+        for to_ik, text in ((True, "Bake FK to IK"), (False, "Bake IK to FK")):
+            op = row.operator("pose.rigify_ik_switch" + rig_id, text=text, icon="ACTION_TWEAK")
+            op.to_ik = to_ik
+            op.bake = True
+            op.frame_start = scene.frame_start
+            op.frame_end = scene.frame_end
+
         layout.separator()
 
         layout.prop(pose_bones["root"], '["flip"]', text="Flip", slider=True)
@@ -801,9 +946,6 @@ def register():
     bpy.utils.register_class(RigUI)
     bpy.utils.register_class(RigLayers)
 
-    bpy.app.driver_namespace["z_index"] = z_index
-    bpy.app.driver_namespace["z_index_same"] = z_index_same
-
     bpy.utils.register_class(Rigify_Fill_Members)
     bpy.utils.register_class(Rigify_Reapply_Members)
     bpy.utils.register_class(Rigify_Reorder_Members)
@@ -813,6 +955,7 @@ def register():
     bpy.utils.register_class(PANTIN_UL_bones_list)
     bpy.utils.register_class(DATA_PT_members_panel)
     bpy.types.Object.pantin_members = bpy.props.CollectionProperty(type=PantinMembers)
+    register_member_index_handlers()
 
 def unregister():
     bpy.utils.unregister_class(Rigify_Swap_Bones)
@@ -821,9 +964,6 @@ def unregister():
     bpy.utils.unregister_class(RigUI)
     bpy.utils.unregister_class(RigLayers)
 
-    del bpy.app.driver_namespace["z_index"]
-    del bpy.app.driver_namespace["z_index_same"]
-
     del bpy.types.Object.pantin_members
     bpy.utils.unregister_class(Rigify_Fill_Members)
     bpy.utils.unregister_class(Rigify_Reapply_Members)
@@ -834,6 +974,9 @@ def unregister():
     bpy.utils.unregister_class(DATA_PT_members_panel)
     bpy.utils.unregister_class(PantinMembers)
     bpy.utils.unregister_class(PantinBones)
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post, bpy.app.handlers.load_post):
+        if clear_member_index in handlers:
+            handlers.remove(clear_member_index)
 
 register()
 '''
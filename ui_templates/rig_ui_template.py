@@ -18,12 +18,17 @@
 
 # <pep8 compliant>
 
-UI_SLIDERS = '''
+UI_RUNTIME_NAME = "rig_ui_runtime.py"
+
+UI_RUNTIME = '''
 import bpy
+from bpy.app.handlers import persistent
 from mathutils import Matrix, Vector
 from math import acos, pi, radians
 
-rig_id = "%s"
+# UI data of the generated rigs, keyed on rig_id. Kept when the
+# module is run again, e.g. by the runtime text of another rig file.
+RIGS = globals().get("RIGS", {})
 
 
 ############################
@@ -524,10 +529,10 @@ def ik2fk_leg(obj, fk, ik):
 ## IK/FK snapping operators ##
 ##############################
 
-class Rigify_Arm_FK2IK(bpy.types.Operator):
+class POSE_OT_rigify_arm_fk2ik(bpy.types.Operator):
     """ Snaps an FK arm to an IK arm.
     """
-    bl_idname = "pose.rigify_arm_fk2ik_" + rig_id
+    bl_idname = "pose.rigify_arm_fk2ik"
     bl_label = "Rigify Snap FK arm to IK"
     bl_options = {'UNDO'}
 
@@ -553,10 +558,10 @@ class Rigify_Arm_FK2IK(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class Rigify_Arm_IK2FK(bpy.types.Operator):
+class POSE_OT_rigify_arm_ik2fk(bpy.types.Operator):
     """ Snaps an IK arm to an FK arm.
     """
-    bl_idname = "pose.rigify_arm_ik2fk_" + rig_id
+    bl_idname = "pose.rigify_arm_ik2fk"
     bl_label = "Rigify Snap IK arm to FK"
     bl_options = {'UNDO'}
 
@@ -585,10 +590,10 @@ class Rigify_Arm_IK2FK(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class Rigify_Leg_FK2IK(bpy.types.Operator):
+class POSE_OT_rigify_leg_fk2ik(bpy.types.Operator):
     """ Snaps an FK leg to an IK leg.
     """
-    bl_idname = "pose.rigify_leg_fk2ik_" + rig_id
+    bl_idname = "pose.rigify_leg_fk2ik"
     bl_label = "Rigify Snap FK leg to IK"
     bl_options = {'UNDO'}
 
@@ -616,10 +621,10 @@ class Rigify_Leg_FK2IK(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class Rigify_Leg_IK2FK(bpy.types.Operator):
+class POSE_OT_rigify_leg_ik2fk(bpy.types.Operator):
     """ Snaps an IK leg to an FK leg.
     """
-    bl_idname = "pose.rigify_leg_ik2fk_" + rig_id
+    bl_idname = "pose.rigify_leg_ik2fk"
     bl_label = "Rigify Snap IK leg to FK"
     bl_options = {'UNDO'}
 
@@ -650,118 +655,308 @@ class Rigify_Leg_IK2FK(bpy.types.Operator):
         return {'FINISHED'}
 
 
+###########################
+## Light evaluation mode ##
+###########################
+
+LIGHT_TIERS = "rigify_light_tiers"  # Written at generation: the secondary constraints and drivers
+LIGHT_MUTED = "rigify_light_muted"  # What the light mode muted, to restore exactly that
+
+# Names of the rigs switched back to full evaluation for the current render
+RENDER_LIGHT_RIGS = []
+
+
+def is_light(obj):
+    return LIGHT_MUTED in obj.data
+
+
+def set_light_evaluation(obj, light):
+    """ Mutes the constraints and drivers of the secondary tiers recorded
+        at generation, and straightens the B-Bones, or restores them.
+        Returns whether anything was switched.
+    """
+    tiers = obj.data.get(LIGHT_TIERS)
+    if tiers is None or is_light(obj) == light:
+        return False
+    tiers = tiers.to_dict()
+
+    pbones = obj.pose.bones
+    bones = obj.data.bones
+    drivers = {}
+    for source, anim in (('OBJECT', obj.animation_data), ('DATA', obj.data.animation_data)):
+        if anim is not None:
+            for fcu in anim.drivers:
+                drivers[(source, fcu.data_path, fcu.array_index)] = fcu
+
+    if light:
+        muted = {'constraints': [], 'drivers': [], 'bbone_segments': {}}
+        for tier in tiers['tiers'].values():
+            for bone_name, con_name in tier['constraints']:
+                pbone = pbones.get(bone_name)
+                con = pbone.constraints.get(con_name) if pbone else None
+                if con is not None and not con.mute:
+                    con.mute = True
+                    muted['constraints'].append([bone_name, con_name])
+            for source, path, index in tier['drivers']:
+                fcu = drivers.get((source, path, index))
+                if fcu is not None and not fcu.mute:
+                    fcu.mute = True
+                    muted['drivers'].append([source, path, index])
+        for name in tiers['bbone_segments']:
+            bone = bones.get(name)
+            if bone is not None and bone.bbone_segments > 1:
+                muted['bbone_segments'][name] = bone.bbone_segments
+                bone.bbone_segments = 1
+        obj.data[LIGHT_MUTED] = muted
+    else:
+        muted = obj.data[LIGHT_MUTED].to_dict()
+        for bone_name, con_name in muted['constraints']:
+            pbone = pbones.get(bone_name)
+            con = pbone.constraints.get(con_name) if pbone else None
+            if con is not None:
+                con.mute = False
+        for source, path, index in muted['drivers']:
+            fcu = drivers.get((source, path, index))
+            if fcu is not None:
+                fcu.mute = False
+        for name, segments in muted['bbone_segments'].items():
+            bone = bones.get(name)
+            if bone is not None:
+                bone.bbone_segments = segments
+        del obj.data[LIGHT_MUTED]
+
+    obj.update_tag({'OBJECT', 'DATA'})
+    return True
+
+
+@persistent
+def light_render_pre(scene):
+    """ Renders and playblasts always evaluate the rigs fully.
+    """
+    for obj in scene.objects:
+        if obj.type == 'ARMATURE' and is_light(obj) and set_light_evaluation(obj, False):
+            RENDER_LIGHT_RIGS.append(obj.name)
+
+
+@persistent
+def light_render_post(scene):
+    for name in RENDER_LIGHT_RIGS:
+        obj = bpy.data.objects.get(name)
+        if obj is not None:
+            set_light_evaluation(obj, True)
+    del RENDER_LIGHT_RIGS[:]
+
+
+LIGHT_HANDLERS = (
+    (bpy.app.handlers.render_pre, light_render_pre),
+    (bpy.app.handlers.render_post, light_render_post),
+    (bpy.app.handlers.render_cancel, light_render_post),
+)
+
+
+def remove_light_handlers():
+    # Handlers added by a previous run of the runtime are other functions
+    for handlers, handler in LIGHT_HANDLERS:
+        for h in list(handlers):
+            if h.__name__ == handler.__name__:
+                handlers.remove(h)
+
+
+class POSE_OT_rigify_light_evaluation(bpy.types.Operator):
+    """ Toggle the light evaluation of the rig: secondary constraints
+        and drivers muted and B-Bones straightened, restored for renders
+    """
+    bl_idname = "pose.rigify_light_evaluation"
+    bl_label = "Light Evaluation"
+    bl_options = {'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == 'ARMATURE' and LIGHT_TIERS in obj.data
+
+    def execute(self, context):
+        obj = context.active_object
+        set_light_evaluation(obj, not is_light(obj))
+        return {'FINISHED'}
+
+
 ###################
 ## Rig UI Panels ##
 ###################
 
-class RigUI(bpy.types.Panel):
+def register_rig(rig_id, draw, layers, section_bones):
+    """ Adds the UI of a generated rig to the shared panels.
+        draw(layout, pose_bones, selected_bones, sections) draws its
+        properties, layers lists the rows of (layer index, name) and
+        section_bones maps bone names to the UI sections they show.
+    """
+    RIGS[rig_id] = {'draw': draw, 'layers': layers, 'section_bones': section_bones}
+
+
+def unregister_rig(rig_id):
+    RIGS.pop(rig_id, None)
+
+
+def get_active_rig(context):
+    """ Returns the UI data of the active rig, or None.
+    """
+    try:
+        return RIGS.get(context.active_object.data.get("rig_id"))
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+class VIEW3D_PT_rigify_rig_ui(bpy.types.Panel):
     bl_space_type = 'VIEW_3D'
     bl_region_type = 'UI'
     bl_label = "Rig Main Properties"
-    bl_idname = rig_id + "_PT_rig_ui"
+    bl_idname = "VIEW3D_PT_rigify_rig_ui"
 
     @classmethod
     def poll(self, context):
-        if context.mode != 'POSE':
-            return False
-        try:
-            return (context.active_object.data.get("rig_id") == rig_id)
-        except (AttributeError, KeyError, TypeError):
-            return False
+        return context.mode == 'POSE' and get_active_rig(context) is not None
 
     def draw(self, context):
-        layout = self.layout
-        pose_bones = context.active_object.pose.bones
+        rig = get_active_rig(context)
         try:
-            selected_bones = [bone.name for bone in context.selected_pose_bones]
-            selected_bones += [context.active_pose_bone.name]
+            selected_bones = {bone.name for bone in context.selected_pose_bones}
+            selected_bones.add(context.active_pose_bone.name)
         except (AttributeError, TypeError):
             return
 
-        def is_selected(names):
-            # Returns whether any of the named bones are selected.
-            if type(names) == list:
-                for name in names:
-                    if name in selected_bones:
-                        return True
-            elif names in selected_bones:
-                return True
-            return False
+        # Rig sections with at least one selected bone
+        sections = set()
+        for name in selected_bones:
+            sections.update(rig['section_bones'].get(name, ()))
 
-
-'''
+        rig['draw'](self.layout, context.active_object.pose.bones, selected_bones, sections)
 
 
-def layers_ui(layers, layout):
-    """ Turn a list of booleans + a list of names into a layer UI.
-    """
-
-    code = '''
-class RigLayers(bpy.types.Panel):
+class VIEW3D_PT_rigify_rig_layers(bpy.types.Panel):
     bl_space_type = 'VIEW_3D'
     bl_region_type = 'UI'
     bl_label = "Rig Layers"
-    bl_idname = rig_id + "_PT_rig_layers"
+    bl_idname = "VIEW3D_PT_rigify_rig_layers"
 
     @classmethod
     def poll(self, context):
-        try:
-            return (context.active_object.data.get("rig_id") == rig_id)
-        except (AttributeError, KeyError, TypeError):
-            return False
+        return get_active_rig(context) is not None
 
     def draw(self, context):
-        layout = self.layout
-        col = layout.column()
+        data = context.active_object.data
+        col = self.layout.column()
+
+        if LIGHT_TIERS in data:
+            col.operator("pose.rigify_light_evaluation", icon='MOD_DECIM', depress=LIGHT_MUTED in data)
+            col.separator()
+
+        for layers in get_active_rig(context)['layers']:
+            row = col.row()
+            for index, name in layers:
+                row.prop(data, 'layers', index=index, toggle=True, text=name)
+
+        # Root layer
+        row = col.row()
+        row.separator()
+        row = col.row()
+        row.separator()
+
+        row = col.row()
+        row.prop(data, 'layers', index=28, toggle=True, text='Root')
+
+
+classes = [
+    POSE_OT_rigify_arm_fk2ik,
+    POSE_OT_rigify_arm_ik2fk,
+    POSE_OT_rigify_leg_fk2ik,
+    POSE_OT_rigify_leg_ik2fk,
+    POSE_OT_rigify_light_evaluation,
+    VIEW3D_PT_rigify_rig_ui,
+    VIEW3D_PT_rigify_rig_layers,
+]
+
+
+def register():
+    # Replace the classes registered by a previous run of the runtime
+    for cls in classes:
+        old = getattr(bpy.types, cls.__name__, None)
+        if old is not None:
+            bpy.utils.unregister_class(old)
+        bpy.utils.register_class(cls)
+
+    remove_light_handlers()
+    for handlers, handler in LIGHT_HANDLERS:
+        handlers.append(handler)
+
+def unregister():
+    for cls in classes:
+        old = getattr(bpy.types, cls.__name__, None)
+        if old is not None:
+            bpy.utils.unregister_class(old)
+
+    remove_light_handlers()
+
+register()
+
+'''
+
+UI_SLIDERS = '''
+import rig_ui_runtime
+
+rig_id = "%s"
+
+
+###################
+## Rig UI Panels ##
+###################
+
+class RigUI:
+    """ Draws the properties of this rig in the shared rig UI panel.
+    """
+
+    @staticmethod
+    def draw(layout, pose_bones, selected_bones, sections):
+
+        def is_selected(names):
+            # Returns whether any of the named bones are selected.
+            if isinstance(names, str):
+                return names in selected_bones
+            return not selected_bones.isdisjoint(names)
+
 '''
+
+
+def layers_ui(layers, layout):
+    """ Turn a list of booleans + a list of names into the layer rows
+        drawn by the shared layers panel.
+    """
     rows = {}
     for i in range(28):
         if layers[i]:
             if layout[i][1] not in rows:
                 rows[layout[i][1]] = []
-            rows[layout[i][1]] += [(layout[i][0], i)]
+            rows[layout[i][1]] += [(i, layout[i][0])]
 
     keys = list(rows.keys())
     keys.sort()
 
+    # At most four layers per row
+    layer_rows = []
     for key in keys:
-        code += "\n        row = col.row()\n"
-        i = 0
-        for l in rows[key]:
-            if i > 3:
-                code += "\n        row = col.row()\n"
-                i = 0
-            code += "        row.prop(context.active_object.data, 'layers', index=%s, toggle=True, text='%s')\n" % (str(l[1]), l[0])
-            i += 1
-
-    # Root layer
-    code += "\n        row = col.row()"
-    code += "\n        row.separator()"
-    code += "\n        row = col.row()"
-    code += "\n        row.separator()\n"
-    code += "\n        row = col.row()\n"
-    code += "        row.prop(context.active_object.data, 'layers', index=28, toggle=True, text='Root')\n"
-
-    return code
+        for i in range(0, len(rows[key]), 4):
+            layer_rows.append(rows[key][i:i + 4])
+
+    return "\nLAYERS = %r\n" % layer_rows
 
 
 UI_REGISTER = '''
 
 def register():
-    bpy.utils.register_class(Rigify_Arm_FK2IK)
-    bpy.utils.register_class(Rigify_Arm_IK2FK)
-    bpy.utils.register_class(Rigify_Leg_FK2IK)
-    bpy.utils.register_class(Rigify_Leg_IK2FK)
-    bpy.utils.register_class(RigUI)
-    bpy.utils.register_class(RigLayers)
+    rig_ui_runtime.register_rig(rig_id, RigUI.draw, LAYERS, SECTION_BONES)
 
 def unregister():
-    bpy.utils.unregister_class(Rigify_Arm_FK2IK)
-    bpy.utils.unregister_class(Rigify_Arm_IK2FK)
-    bpy.utils.unregister_class(Rigify_Leg_FK2IK)
-    bpy.utils.unregister_class(Rigify_Leg_IK2FK)
-    bpy.utils.unregister_class(RigUI)
-    bpy.utils.unregister_class(RigLayers)
+    rig_ui_runtime.unregister_rig(rig_id)
 
 register()
 '''